@@ -1,154 +1,443 @@
-# Save this as app.py (requires Flask, requests, flask-cors, python-dotenv, google-cloud-texttospeech, python-docx, PyPDF2)
-# pip install Flask requests flask-cors python-dotenv google-cloud-texttospeech google-cloud-speech python-docx PyPDF2
+# Save this as app.py (requires Flask, requests, flask-cors, python-dotenv, google-cloud-texttospeech, python-docx, PyPDF2, numpy)
+# pip install Flask requests flask-cors python-dotenv google-cloud-texttospeech google-cloud-speech python-docx PyPDF2 numpy
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS, cross_origin
+import contextvars
 import json
-import requests
 import os
 import uuid
 import base64
+import time
 from dotenv import load_dotenv
-import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from werkzeug.utils import secure_filename # Import for secure filename handling
 
-# Imports for document parsing (you'll need to install these: pip install python-docx PyPDF2)
+# Knowledge base retrieval index (you'll need to install numpy: pip install numpy)
 try:
-    from docx import Document # For .docx files
+    from knowledge_index import KnowledgeIndex, format_excerpts
 except ImportError:
-    print("WARNING: python-docx not installed. Word document parsing will not work.")
-    Document = None
+    print("WARNING: numpy not installed. Knowledge base retrieval is disabled; the full content will be sent to Gemini.")
+    KnowledgeIndex = None
 
-try:
-    import PyPDF2 # For .pdf files
-except ImportError:
-    print("WARNING: PyPDF2 not installed. PDF document parsing will not work.")
-    PyPDF2 = None
-
-
-# Import the Google Cloud client library for Text-to-Speech
-from google.cloud import texttospeech_v1beta1 as texttospeech
-from google.cloud import speech_v1p1beta1 as speech
+from lru import LRUCache
+from tokens import estimate_tokens
+from agent_store import create_agent_store
+from chat_sessions import create_session_store, select_turns_to_compact
+from gemini_client import GeminiError, chunk_text, create_gemini_client
+from tts_cache import TTSCache, tts_cache_key
+from voice_pipeline import SentenceSplitter, clean_for_speech
+from speech_stream import STT_ENCODINGS, audio_chunk_bytes, build_streaming_config, read_audio_chunks, transcribe_stream
+from ingestion import ACTIVE_JOB_STATUSES, JobHeartbeat, create_ingestion_job_store, extract_document_to_file, parser_version, pypdf2, python_docx
+from extraction_cache import ExtractionCache, hash_stream_to_file
+from reply_cache import create_reply_cache, profile_hash, reply_cache_key
+import observability
+from observability import annotate, record_coalesced, record_first_audio, record_prompt, record_upstream, span
+from single_flight import SingleFlight, request_key
+from lazy import LazyValue
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
+# --- Observability: per-request traces, Prometheus metrics at /metrics, optional JSON request logs ---
+REQUEST_LOG_JSON = os.environ.get("LOG_FORMAT", "").lower() == "json"
+
 # --- Gemini API Configuration ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key="
+GEMINI_GENERATION_MODEL = "gemini-2.0-flash"
 
 if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY environment variable not set. Please set it in a .env file or directly.")
 
-# --- Google Cloud TTS Client Initialization ---
-try:
-    tts_client = texttospeech.TextToSpeechClient()
-    print("Google Cloud Text-to-Speech client initialized.")
-except Exception as e:
-    print(f"ERROR: Failed to initialize Google Cloud Text-to-Speech client: {e}")
-    print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set and has 'Cloud Text-to-Speech User' role.")
-    tts_client = None
-
-# --- Google Cloud STT Client Initialization ---
-try:
-    stt_client = speech.SpeechClient()
-    print("Google Cloud Speech-to-Text client initialized.")
-except Exception as e:
-    print(f"ERROR: Failed to initialize Google Cloud Speech-to-Text client: {e}")
-    print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set and has 'Cloud Speech-to-Text User' role.")
-    stt_client = None
-
-
-# --- Data Storage (for demonstration, in-memory. Use Firestore/DB for production) ---
-deployed_agents = {}
-
-# --- Helper function for text extraction from documents ---
-def extract_text_from_pdf(pdf_path):
-    if not PyPDF2:
-        return "[PyPDF2 not installed - cannot extract PDF text]"
-    text = ""
+# Shared pooled client (timeouts, retries, concurrency limits, circuit breaker) for every Gemini call
+gemini_client = create_gemini_client(GEMINI_API_KEY)
+gemini_client.observer = observability.gemini_observer
+
+# --- Google Cloud TTS / STT Clients ---
+# Imported and created on first use (or by warm_up), once per process: workers that only serve
+# chat never load the Google Cloud libraries or wait on credential discovery.
+def create_tts_client():
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                text += reader.pages[page_num].extract_text() or ''
-        return text
+        from google.cloud import texttospeech_v1beta1 as texttospeech
+        client = texttospeech.TextToSpeechClient()
+        print("Google Cloud Text-to-Speech client initialized.")
+        return client
     except Exception as e:
-        return f"[Error extracting PDF text: {e}]"
+        print(f"ERROR: Failed to initialize Google Cloud Text-to-Speech client: {e}")
+        print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set and has 'Cloud Text-to-Speech User' role.")
+        return None
 
-def extract_text_from_word(docx_path):
-    if not Document:
-        return "[python-docx not installed - cannot extract Word text]"
-    text = ""
+def create_stt_client():
     try:
-        document = Document(docx_path)
-        for paragraph in document.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        from google.cloud import speech_v1p1beta1 as speech
+        client = speech.SpeechClient()
+        print("Google Cloud Speech-to-Text client initialized.")
+        return client
     except Exception as e:
-        return f"[Error extracting Word text: {e}]"
+        print(f"ERROR: Failed to initialize Google Cloud Speech-to-Text client: {e}")
+        print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set and has 'Cloud Speech-to-Text User' role.")
+        return None
 
-@app.route('/api/generate-agent-ai', methods=['POST'])
-def generate_agent_ai_endpoint():
+tts_client = LazyValue(create_tts_client, name="tts")
+stt_client = LazyValue(create_stt_client, name="stt")
+
+# --- TTS Audio Cache ---
+TTS_AUDIO_ENCODING = "MP3"
+tts_cache = TTSCache(
+    os.environ.get("TTS_CACHE_DIR", "tts_cache"),
+    max_bytes=int(os.environ.get("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    memory_items=int(os.environ.get("TTS_CACHE_MEMORY_ITEMS", "256"))
+)
+
+# Bounded pool that synthesizes voice-turn sentences concurrently
+tts_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("VOICE_TTS_WORKERS", "4")), thread_name_prefix="tts")
+
+
+# --- Knowledge Base Retrieval Configuration ---
+KNOWLEDGE_INDEX_DIR = os.environ.get("KNOWLEDGE_INDEX_DIR", "agent_indexes")
+DEFAULT_RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "4"))
+DEFAULT_RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("RETRIEVAL_TOKEN_BUDGET", "1500"))
+
+# --- Chat Session Configuration ---
+DEFAULT_HISTORY_TOKEN_BUDGET = int(os.environ.get("SESSION_HISTORY_TOKEN_BUDGET", "3000"))
+
+# --- Batch Chat Configuration ---
+CHAT_BATCH_MAX_ITEMS = int(os.environ.get("CHAT_BATCH_MAX_ITEMS", "100"))
+# Bounded pool shared by all batch requests, so concurrent batches cannot flood Gemini
+chat_batch_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CHAT_BATCH_WORKERS", "8")), thread_name_prefix="chat-batch")
+
+# --- Document Ingestion Configuration ---
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+INGESTION_PROCESSES = int(os.environ.get("INGESTION_PROCESSES", str(os.cpu_count() or 2)))
+ingestion_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("INGESTION_JOB_WORKERS", "2")), thread_name_prefix="ingest")
+# Jobs refresh a heartbeat while their process holds them; any worker fails jobs whose heartbeat is older than this
+INGESTION_JOB_STALE_SECONDS = float(os.environ.get("INGESTION_JOB_STALE_SECONDS", "600"))
+INGESTION_HEARTBEAT_SECONDS = float(os.environ.get("INGESTION_HEARTBEAT_SECONDS", "30"))
+ingestion_pool = None # Process pool for page extraction, created on first upload
+ingestion_pool_lock = threading.Lock()
+# Extracted text and knowledge indexes keyed by uploaded file hash + parser version
+extraction_cache = ExtractionCache(
+    os.environ.get("EXTRACTION_CACHE_DIR", "extraction_cache"),
+    max_bytes=int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+)
+
+# --- Data Storage (SQLite by default so all workers share agents; set AGENT_STORE=memory for the old in-process dict) ---
+agent_store = create_agent_store()
+session_store = create_session_store()
+ingestion_jobs = create_ingestion_job_store()
+ingestion_heartbeat = JobHeartbeat(ingestion_jobs, INGESTION_HEARTBEAT_SECONDS)
+reply_cache = create_reply_cache() # None unless REPLY_CACHE_ENABLED is set
+base_system_instructions = LRUCache(maxsize=256, ttl=300)
+# Identical concurrent Gemini / TTS requests share one in-flight upstream call
+gemini_flight = SingleFlight()
+tts_flight = SingleFlight()
+loaded_knowledge_indexes = LRUCache(maxsize=int(os.environ.get("KNOWLEDGE_INDEX_CACHE_SIZE", "32")))
+
+def fail_orphaned_ingestion_jobs():
     """
-    Receives Agent data from frontend (now potentially FormData with files),
-    calls Gemini, and prepares data.
+    Jobs run in the process that accepted the upload, so a restart loses them. Marks the
+    ones left queued/running by an exited process, or whose heartbeat has gone stale, and
+    their agents, as failed.
     """
-    # Check if this is a JSON request (legacy or if frontend sends JSON)
-    # The frontend is now sending FormData, so this check will likely fail.
-    # The primary way to receive data will be request.form and request.files.
-    # We will remove this check for now, as it's causing the 400.
-    # if not request.is_json:
-    #     return jsonify({"message": "Request must be JSON"}), 400
+    error = "Ingestion was interrupted by a server restart or stopped responding; please upload the document again."
+    for job in ingestion_jobs.fail_orphaned(error, stale_after=INGESTION_JOB_STALE_SECONDS):
+        agent_profile = agent_store.get(job['agent_id'])
+        if agent_profile and agent_profile.get('status') == 'ingesting':
+            agent_store.put({"id": job['agent_id'], "status": "failed", "error": error,
+                             "parameters": agent_profile.get('parameters'), "ingestion_job_id": job['id']})
+        print(f"Marked interrupted ingestion job {job['id']} for agent {job['agent_id']} as failed.")
 
-    # Access form data (text fields) via request.form
-    agent_data = {}
-    for key in request.form:
-        # Flask's request.form gives strings. If you have nested JSON, you'll need to parse.
-        if key in ['advancedFeatures', 'deploymentChannels']: # These are JSON.stringify'd from frontend
-            try:
-                agent_data[key] = json.loads(request.form[key])
-            except json.JSONDecodeError:
-                agent_data[key] = request.form[key] # Keep as string if not valid JSON
+fail_orphaned_ingestion_jobs()
+
+# --- Warm-up ---
+WARMABLE = {"tts": tts_client, "stt": stt_client, "pdf": pypdf2, "docx": python_docx}
+
+def warm_up(components=None):
+    """
+    Loads lazily created clients and parsers now instead of on first use (all of them by
+    default). Call it from a server hook such as gunicorn's post_fork, or set WARM_UP.
+    Returns {component: load seconds}.
+    """
+    timings = {}
+    for name in components or WARMABLE:
+        lazy_value = WARMABLE[name]
+        lazy_value.get()
+        timings[name] = lazy_value.load_seconds
+    print(f"Warm-up done: {', '.join(f'{name} {seconds or 0:.2f}s' for name, seconds in timings.items())}")
+    return timings
+
+# WARM_UP=all, or a comma-separated subset of tts,stt,pdf,docx, preloads them at startup
+if os.environ.get("WARM_UP"):
+    warm_up(None if os.environ["WARM_UP"].lower() == "all" else [name.strip() for name in os.environ["WARM_UP"].split(",") if name.strip()])
+
+# --- Helper functions for knowledge base retrieval ---
+def parse_positive_int(value, default):
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return default
+    return parsed if parsed > 0 else default
+
+def build_knowledge_index(deployment_id, content, extraction_cache_key=None):
+    """
+    Chunks and indexes the knowledge base text, saving it under KNOWLEDGE_INDEX_DIR.
+    With an extraction cache key, an index already built for the same document is reused.
+    Returns (index, index_path), or (None, None) if retrieval is unavailable.
+    """
+    if not KnowledgeIndex or not content or not content.strip():
+        return None, None
+    index_path = os.path.join(KNOWLEDGE_INDEX_DIR, deployment_id)
+    if extraction_cache_key and extraction_cache.has_index(extraction_cache_key):
+        extraction_cache.copy_index(extraction_cache_key, index_path)
+        index = KnowledgeIndex.load(index_path)
+    else:
+        index = KnowledgeIndex.build(content)
+        if len(index) == 0:
+            return None, None
+        index.save(index_path)
+        if extraction_cache_key:
+            extraction_cache.store_index(extraction_cache_key, index_path)
+    loaded_knowledge_indexes.set(deployment_id, index)
+    return index, index_path
+
+def get_knowledge_index(agent_profile):
+    retrieval = agent_profile.get('retrieval') or {}
+    index_path = retrieval.get('index_path')
+    if not KnowledgeIndex or not index_path:
+        return None
+    index = loaded_knowledge_indexes.get(agent_profile['id'])
+    if index is None:
+        try:
+            index = KnowledgeIndex.load(index_path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading knowledge index for agent {agent_profile['id']}: {e}")
+            return None
+        loaded_knowledge_indexes.set(agent_profile['id'], index)
+    return index
+
+def retrieve_knowledge(agent_profile, query):
+    """
+    Returns the knowledge base excerpts most relevant to `query`, limited by the
+    agent's top-k and token budget, or an empty string if nothing matches.
+    """
+    index = get_knowledge_index(agent_profile)
+    if index is None:
+        return ""
+    retrieval = agent_profile['retrieval']
+    results = index.search(query, top_k=retrieval['top_k'], token_budget=retrieval['token_budget'])
+    return format_excerpts(results)
+
+# --- Helper functions for chat prompts ---
+def get_base_system_instruction(agent_profile):
+    """
+    Returns the persona/rules part of the system instruction, built once per agent and cached.
+    """
+    base_instruction = base_system_instructions.get(agent_profile['id'])
+    if base_instruction is None:
+        agent_name = agent_profile['parameters'].get('name', 'AI Agent')
+        agent_persona = agent_profile.get('ai_generated_content', 'You are a helpful assistant.')
+        campaign_design = agent_profile['parameters'].get('campaignDesignPrompt', 'Engage in general conversation.')
+        selected_language = agent_profile['parameters'].get('language', 'English')
+        base_instruction = (
+            f"You are {agent_name}. Your core persona is:\n{agent_persona}\n\n"
+            f"Follow these conversation flow and function calling instructions:\n{campaign_design}\n\n"
+            f"**IMPORTANT:** All your responses MUST be entirely in {selected_language}. Do NOT use any other language or mixed languages. Start every response directly in {selected_language}. Do not give special symbol: for instance asterisk symbol in response unless required (@ in email address)."
+            f"Be concise, helpful, and follow your defined persona and rules. Respond in markdown."
+        )
+        base_system_instructions.set(agent_profile['id'], base_instruction)
+    return base_instruction
+
+def build_system_instruction(agent_profile, user_message, history_summary=""):
+    """
+    Returns the system instruction for a chat turn: the cached base instruction plus the
+    knowledge retrieved for this message and the history summary, which vary per turn.
+    """
+    system_instruction = get_base_system_instruction(agent_profile)
+    knowledge_excerpts = retrieve_knowledge(agent_profile, user_message)
+    if knowledge_excerpts:
+        system_instruction += f"\n\nUse these knowledge base excerpts to answer when they are relevant:\n{knowledge_excerpts}"
+    if history_summary:
+        system_instruction += f"\n\nSummary of the earlier conversation with this user:\n{history_summary}"
+    return system_instruction
+
+def build_chat_contents(agent_profile, user_message, chat_history, history_summary=None):
+    """
+    Converts a client-supplied chatHistory ([{sender, message}]) plus the new message
+    into Gemini `contents`, led by the agent's system instruction.
+    """
+    gemini_chat_history = []
+    gemini_chat_history.append({'role': 'user', 'parts': [{'text': build_system_instruction(agent_profile, user_message, history_summary)}]})
+
+    if chat_history:
+        for entry in chat_history:
+            if entry['sender'] == 'user':
+                gemini_chat_history.append({'role': 'user', 'parts': [{'text': entry['message']}]})
+            elif entry['sender'] == 'agent':
+                gemini_chat_history.append({'role': 'model', 'parts': [{'text': entry['message']}]})
+
+    gemini_chat_history.append({'role': 'user', 'parts': [{'text': user_message}]})
+    return gemini_chat_history
+
+def chat_history_error(chat_history):
+    """
+    Returns why a client-supplied chatHistory cannot be used, or None if it is valid.
+    """
+    if not isinstance(chat_history, list):
+        return "chatHistory must be a list"
+    for entry in chat_history:
+        if not isinstance(entry, dict) or not isinstance(entry.get('sender'), str) or not isinstance(entry.get('message'), str):
+            return "Each chatHistory entry must have a sender and a message"
+    return None
+
+def prepare_agent_reply(agent_profile, user_message, chat_history, generation_config=None, bypass_cache=False, history_summary=None):
+    """
+    Everything in a chat turn but the Gemini call: the reply cache lookup and the prompt.
+    Returns (cached_reply, cache_status, gemini_call); gemini_call is None on a cache hit,
+    otherwise {"model", "contents", "payload_fields", "cache_key"} for the call to make.
+    """
+    selected_llm = agent_profile['parameters'].get('llm', 'gemini-2.0-flash')
+    payload_fields = {"generationConfig": generation_config} if generation_config else {}
+
+    cache_key = None
+    cache_status = "OFF"
+    if reply_cache is not None:
+        cache_key = reply_cache_key(
+            agent_profile.get('profile_hash') or profile_hash(agent_profile),
+            selected_llm, chat_history, user_message, generation_config, history_summary
+        )
+        if bypass_cache:
+            reply_cache.bypasses += 1
+            cache_status = "BYPASS"
         else:
-            agent_data[key] = request.form[key]
+            with span("reply_cache"):
+                cached_reply = reply_cache.get(cache_key)
+            if cached_reply is not None:
+                annotate(replyCache="HIT")
+                return cached_reply, "HIT", None
+            cache_status = "MISS"
+    annotate(replyCache=cache_status, model=selected_llm)
 
-    # Handle the uploaded file (knowledgeBaseFile)
-    knowledge_base_file = request.files.get('knowledgeBaseFile')
-    knowledge_base_content_from_file = ""
+    with span("build_prompt"):
+        gemini_chat_history = build_chat_contents(agent_profile, user_message, chat_history, history_summary)
+    prompt_parts = [part['text'] for content in gemini_chat_history for part in content['parts']]
+    record_prompt(sum(len(text) for text in prompt_parts), sum(estimate_tokens(text) for text in prompt_parts))
+    return None, cache_status, {"model": selected_llm, "contents": gemini_chat_history, "payload_fields": payload_fields, "cache_key": cache_key}
 
-    if agent_data.get('knowledgeBaseType') == 'upload_doc' and knowledge_base_file:
-        filename = secure_filename(knowledge_base_file.filename)
-        # Create a temporary file to save the uploaded content
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            knowledge_base_file.save(tmp_file.name)
-            temp_filepath = tmp_file.name # Get the path to the temporary file
+def gemini_request_key(gemini_call):
+    """
+    Single-flight key: the exact upstream request, so only byte-identical prompts are coalesced.
+    """
+    return request_key(gemini_call['model'], gemini_call['contents'], gemini_call['payload_fields'])
+
+def store_agent_reply(gemini_call, agent_response_text):
+    if gemini_call['cache_key'] is not None:
+        reply_cache.put(gemini_call['cache_key'], agent_response_text)
+
+def generate_agent_reply(agent_profile, user_message, chat_history, generation_config=None, bypass_cache=False, history_summary=None):
+    """
+    Runs one chat turn, consulting the reply cache when it is enabled. Session turns pass
+    the summary of their compacted history as `history_summary`.
+    Returns (reply_text, cache_status) where cache_status is HIT, MISS, BYPASS or OFF.
+    Raises GeminiError.
+    """
+    cached_reply, cache_status, gemini_call = prepare_agent_reply(
+        agent_profile, user_message, chat_history, generation_config, bypass_cache, history_summary
+    )
+    if gemini_call is None:
+        return cached_reply, cache_status
+    with span("gemini"):
+        agent_response_text, shared = gemini_flight.do(
+            gemini_request_key(gemini_call),
+            lambda: gemini_client.generate_text(gemini_call['model'], gemini_call['contents'], **gemini_call['payload_fields'])
+        )
+    if shared:
+        record_coalesced("gemini")
+    else:
+        store_agent_reply(gemini_call, agent_response_text)
+    return agent_response_text, cache_status
+
+def summarize_history(model, previous_summary, turns, language):
+    """
+    Folds `turns` into the running conversation summary. Falls back to a truncated
+    transcript if Gemini cannot produce one, so a chat turn never fails on compaction.
+    """
+    transcript = "\n".join(f"{'User' if turn['role'] == 'user' else 'Agent'}: {turn['text']}" for turn in turns)
+    prompt = (
+        f"Update the running summary of a customer conversation.\n"
+        f"Keep every fact, name, number, order detail, promise and open question. Write it in {language}, as short bullet points.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New conversation turns:\n{transcript}"
+    )
+    try:
+        return gemini_client.generate_text(model, [{'role': 'user', 'parts': [{'text': prompt}]}])
+    except Exception as e:
+        print(f"Error summarizing chat history, keeping a truncated transcript instead: {e}")
+        return f"{previous_summary}\n{transcript}".strip()[-4000:]
 
+def get_ingestion_pool():
+    global ingestion_pool
+    with ingestion_pool_lock:
+        if ingestion_pool is None:
+            ingestion_pool = ProcessPoolExecutor(max_workers=INGESTION_PROCESSES)
+        return ingestion_pool
+
+def reset_ingestion_pool(broken_pool):
+    """
+    Drops a pool whose worker process died (a crash or OOM on a bad document), which leaves
+    it unusable, so the next upload gets a fresh one.
+    """
+    global ingestion_pool
+    with ingestion_pool_lock:
+        if ingestion_pool is broken_pool:
+            ingestion_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+def agent_not_ready_message(agent_profile):
+    """
+    Returns the 409 response body while the agent's knowledge base is still being ingested
+    (or failed to ingest), otherwise None.
+    """
+    status = agent_profile.get('status', 'ready')
+    if status == 'ready':
+        return None
+    if status == 'failed':
+        return {"message": f"Agent creation failed: {agent_profile.get('error', 'unknown error')}"}
+    return {"message": "Agent is still ingesting its knowledge base. Try again shortly.", "jobId": agent_profile.get('ingestion_job_id')}
+
+def agent_not_ready_response(agent_profile):
+    message = agent_not_ready_message(agent_profile)
+    return (jsonify(message), 409) if message else None
+
+def build_agent_prompt(deployment_id, agent_data, knowledge_base_content, extraction_cache_key=None):
+    """
+    Indexes the knowledge base and builds the prompt that asks Gemini for the agent persona.
+    Returns (prompt, retrieval_settings).
+    """
+    # Index the knowledge base so prompts only carry the relevant chunks
+    retrieval_settings = {
+        "top_k": parse_positive_int(agent_data.get('retrievalTopK'), DEFAULT_RETRIEVAL_TOP_K),
+        "token_budget": parse_positive_int(agent_data.get('retrievalTokenBudget'), DEFAULT_RETRIEVAL_TOKEN_BUDGET),
+    }
+    knowledge_base_for_prompt = knowledge_base_content or 'No knowledge base content provided.'
+    with span("build_index"):
         try:
-            if filename.lower().endswith('.pdf'):
-                knowledge_base_content_from_file = extract_text_from_pdf(temp_filepath)
-            elif filename.lower().endswith(('.doc', '.docx')):
-                knowledge_base_content_from_file = extract_text_from_word(temp_filepath)
-            else:
-                knowledge_base_content_from_file = f"[Unsupported file type for extraction: {filename}]"
+            knowledge_index, index_path = build_knowledge_index(deployment_id, knowledge_base_content, extraction_cache_key)
         except Exception as e:
-            knowledge_base_content_from_file = f"[Error processing file {filename}: {e}]"
-            print(f"Error processing uploaded file {filename}: {e}")
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_filepath)
-        
-        # Override knowledgeBaseContent with extracted text
-        agent_data['knowledgeBaseContent'] = knowledge_base_content_from_file
-        print(f"Extracted content from {filename} (first 200 chars): {knowledge_base_content_from_file[:200]}")
-
-    # Basic validation for essential fields (after parsing FormData)
-    required_fields = ['name', 'llm', 'useCase', 'purpose', 'campaignDesignPrompt']
-    if not all(k in agent_data for k in required_fields):
-        missing_fields = [k for k in required_fields if k not in agent_data]
-        return jsonify({"message": f"Missing essential Agent data fields. Required: {', '.join(required_fields)}. Missing: {', '.join(missing_fields)}"}), 400
+            print(f"Error building knowledge index, falling back to full content: {e}")
+            knowledge_index, index_path = None, None
+        if knowledge_index is not None:
+            retrieval_settings.update({"index_path": index_path, "num_chunks": len(knowledge_index)})
+            profile_query = " ".join(agent_data.get(k, '') for k in ['useCase', 'purpose', 'campaignDesignPrompt'])
+            excerpts = knowledge_index.search(profile_query, top_k=retrieval_settings['top_k'], token_budget=retrieval_settings['token_budget']) \
+                or knowledge_index.head(top_k=retrieval_settings['top_k'], token_budget=retrieval_settings['token_budget'])
+            knowledge_base_for_prompt = format_excerpts(excerpts)
+            print(f"Indexed knowledge base into {len(knowledge_index)} chunks for agent {deployment_id}")
+    annotate(knowledgeBaseChars=len(knowledge_base_content or ''), knowledgeChunks=retrieval_settings.get('num_chunks'))
 
     # Determine the output language for Gemini's generated content
     output_language_for_gemini = agent_data.get('language', 'English')
@@ -162,7 +451,7 @@ def generate_agent_ai_endpoint():
     
     
     # Construct the prompt for Gemini using the processed agent_data
-    # Note: Use agent_data.get('knowledgeBaseContent', '') as it now holds either direct text or extracted text
+    # Note: knowledge_base_for_prompt holds the most relevant excerpts when an index was built, otherwise the full content
     prompt = (
         f"Create a Business Agent AI profile based on the following details:\n"
         f"Agent Name: {agent_data.get('name', 'N/A')}\n"
@@ -174,7 +463,7 @@ def generate_agent_ai_endpoint():
         f"Traits: {agent_data.get('traits', 'N/A')}\n"
         f"Flaws: {agent_data.get('flaws', 'N/A')}\n"
         f"Knowledge Base Type: {agent_data.get('knowledgeBaseType', 'N/A')}\n"
-        f"Knowledge Base Content: {agent_data.get('knowledgeBaseContent', 'No knowledge base content provided.')}\n"
+        f"Knowledge Base Content: {knowledge_base_for_prompt}\n"
         f"Voice Select: {agent_data.get('voiceSelect', 'N/A')}\n"
         f"Voice Speed: {agent_data.get('voiceSpeed', 'N/A')}\n"
         f"\n--- Campaign Design and Function Calling Instructions ---\n"
@@ -184,123 +473,450 @@ def generate_agent_ai_endpoint():
         f"**{output_requirement_text}**" # Use dynamic output requirement
     )
 
-    payload = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [{"text": prompt}]
-            }
-        ]
-    }
+    record_prompt(len(prompt), estimate_tokens(prompt))
+    return prompt, retrieval_settings
 
-    headers = {
-        'Content-Type': 'application/json'
+def store_agent_profile(deployment_id, agent_data, generated_text, retrieval_settings):
+    # --- Store/Prepare data ---
+    full_agent_profile = {
+        "id": deployment_id,
+        "status": "ready",
+        "parameters": agent_data, # Original input parameters from form (includes knowledgeBaseType, content)
+        "ai_generated_content": generated_text, # Gemini's response
+        "deployment_channels": agent_data.get('deploymentChannels', []), # Note: This might be stringified JSON from frontend
+        "retrieval": retrieval_settings, # Per-agent top-k / token budget and the knowledge index location
+        "history_token_budget": parse_positive_int(agent_data.get('historyTokenBudget'), DEFAULT_HISTORY_TOKEN_BUDGET) # Session history size before older turns are summarized
     }
+    full_agent_profile["profile_hash"] = profile_hash(full_agent_profile) # Part of the reply cache key
 
-    api_full_url = f"{GEMINI_API_URL}{GEMINI_API_KEY}"
-    generated_text = ""
+    with span("store"):
+        agent_store.put(full_agent_profile)
+    print(f"Agent created and stored. ID: {deployment_id}")
+
+def create_agent_profile(deployment_id, agent_data, knowledge_base_content, extraction_cache_key=None):
+    """
+    Indexes the knowledge base, asks Gemini to generate the agent persona and stores the
+    ready agent. Returns the generated text; raises GeminiError if Gemini fails.
+    """
+    prompt, retrieval_settings = build_agent_prompt(deployment_id, agent_data, knowledge_base_content, extraction_cache_key)
+    with span("gemini"):
+        generated_text = gemini_client.generate_text(GEMINI_GENERATION_MODEL, [{"role": "user", "parts": [{"text": prompt}]}])
+    store_agent_profile(deployment_id, agent_data, generated_text, retrieval_settings)
+    return generated_text
+
+def run_ingestion_job(job_id, deployment_id, agent_data, upload_path, filename, extraction_cache_key):
+    """
+    Background job: extracts the uploaded document to a text file (pages in parallel),
+    caches the text, then indexes it and generates the agent. Progress is recorded on the job.
+    """
+    text_path = f"{upload_path}.txt"
+    try:
+        ingestion_jobs.update(job_id, status='running')
+        pool = get_ingestion_pool()
+        try:
+            extract_document_to_file(
+                upload_path, filename, text_path, pool,
+                progress=lambda done, total: ingestion_jobs.update(job_id, pages_done=done, pages_total=total)
+            )
+        except BrokenProcessPool:
+            reset_ingestion_pool(pool)
+            raise RuntimeError(f"Document extraction worker crashed while processing {filename}.")
+        extraction_cache.put_text(extraction_cache_key, text_path)
+        with open(text_path, 'r', encoding='utf-8') as f:
+            knowledge_base_content = f.read()
+        print(f"Extracted content from {filename} (first 200 chars): {knowledge_base_content[:200]}")
+        create_agent_profile(deployment_id, agent_data, knowledge_base_content, extraction_cache_key)
+        ingestion_jobs.update(job_id, status='completed')
+    except Exception as e:
+        print(f"Error ingesting uploaded file {filename}: {e}")
+        ingestion_jobs.update(job_id, status='failed', error=str(e))
+        agent_store.put({"id": deployment_id, "status": "failed", "error": str(e), "parameters": agent_data, "ingestion_job_id": job_id})
+    finally:
+        ingestion_heartbeat.discard(job_id)
+        for path in (upload_path, text_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+@app.before_request
+def start_request_trace():
+    observability.start_trace(request.endpoint or "unmatched", request.headers.get('X-Request-ID'))
+
+def log_finished_trace(trace):
+    if trace is not None and REQUEST_LOG_JSON:
+        observability.log_trace(trace)
+
+@app.after_request
+def finish_request_trace(response):
+    if response.mimetype == 'text/event-stream' and observability.current_trace() is not None:
+        # The SSE body runs after this hook: keep the trace open until the stream ends
+        trace = observability.detach_trace()
+        response.headers['X-Request-ID'] = trace.request_id
+        response.response = observability.trace_stream(trace, response.response, request.method, response.status_code, log_finished_trace)
+        return response
+    trace = observability.end_trace(request.method, response.status_code)
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        log_finished_trace(trace)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics for this worker: request counts and durations, per-stage timings,
+    prompt sizes, upstream (Gemini/TTS) calls by status and Gemini token usage.
+    """
+    return Response(observability.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/generate-agent-ai', methods=['POST'])
+def generate_agent_ai_endpoint():
+    """
+    Receives Agent data from frontend (now potentially FormData with files),
+    calls Gemini, and prepares data.
+    Uploaded documents are ingested in the background: the response is 202 with a
+    jobId to poll at /api/ingestion-jobs/<jobId>; the agent is usable once it completes.
+    """
+    # Check if this is a JSON request (legacy or if frontend sends JSON)
+    # The frontend is now sending FormData, so this check will likely fail.
+    # The primary way to receive data will be request.form and request.files.
+    # We will remove this check for now, as it's causing the 400.
+    # if not request.is_json:
+    #     return jsonify({"message": "Request must be JSON"}), 400
+
+    # Access form data (text fields) via request.form
+    with span("parse_form"):
+        agent_data = parse_agent_form(request.form)
+
+    # Basic validation for essential fields (after parsing FormData)
+    missing_fields_message = check_agent_fields(agent_data)
+    if missing_fields_message:
+        return jsonify({"message": missing_fields_message}), 400
 
     if not GEMINI_API_KEY:
         return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
 
-    try:
-        response = requests.post(api_full_url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        json_response = response.json()
-
-        if "candidates" in json_response and len(json_response["candidates"]) > 0 and \
-           "content" in json_response["candidates"][0] and \
-           "parts" in json_response["candidates"][0]["content"] and \
-           len(json_response["candidates"][0]["content"]["parts"]) > 0:
-            generated_text = json_response["candidates"][0]["content"]["parts"][0]["text"]
+    deployment_id = str(uuid.uuid4())
+
+    # Handle the uploaded file (knowledgeBaseFile) as a background ingestion job
+    knowledge_base_file = request.files.get('knowledgeBaseFile')
+    if agent_data.get('knowledgeBaseType') == 'upload_doc' and knowledge_base_file:
+        try:
+            cached_content, extraction_cache_key, job = accept_knowledge_base_upload(deployment_id, agent_data, knowledge_base_file)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        if job is not None:
+            return jsonify(ingestion_accepted_message(deployment_id, job)), 202
+        return create_agent_response(deployment_id, agent_data, cached_content, extraction_cache_key)
+
+    return create_agent_response(deployment_id, agent_data, agent_data.get('knowledgeBaseContent', ''))
+
+def parse_agent_form(form):
+    """
+    Agent data from the /api/generate-agent-ai form fields.
+    """
+    agent_data = {}
+    for key in form:
+        # Form values are strings. If you have nested JSON, you'll need to parse.
+        if key in ['advancedFeatures', 'deploymentChannels']: # These are JSON.stringify'd from frontend
+            try:
+                agent_data[key] = json.loads(form[key])
+            except json.JSONDecodeError:
+                agent_data[key] = form[key] # Keep as string if not valid JSON
         else:
-            print(f"Unexpected Gemini API response structure: {json.dumps(json_response)}")
-            return jsonify({"message": "Failed to get generated text from Gemini."}), 500
+            agent_data[key] = form[key]
+    return agent_data
+
+def check_agent_fields(agent_data):
+    """
+    Returns the 400 message if essential fields are missing, otherwise None.
+    """
+    required_fields = ['name', 'llm', 'useCase', 'purpose', 'campaignDesignPrompt']
+    missing_fields = [k for k in required_fields if k not in agent_data]
+    if missing_fields:
+        return f"Missing essential Agent data fields. Required: {', '.join(required_fields)}. Missing: {', '.join(missing_fields)}"
+    return None
+
+def accept_knowledge_base_upload(deployment_id, agent_data, knowledge_base_file):
+    """
+    Saves the uploaded document and either finds its text in the extraction cache or queues
+    a background ingestion job. Returns (cached_content, extraction_cache_key, job), where
+    exactly one of cached_content and job is set. Raises ValueError for unsupported files.
+    """
+    filename = secure_filename(knowledge_base_file.filename)
+    if not filename.lower().endswith(('.pdf', '.doc', '.docx')):
+        raise ValueError(f"Unsupported file type for extraction: {filename}")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    upload_path = os.path.join(UPLOAD_DIR, f"{deployment_id}-{filename}")
+    with span("upload"):
+        content_sha256 = hash_stream_to_file(knowledge_base_file.stream, upload_path)
+    extraction_cache_key = ExtractionCache.make_key(content_sha256, parser_version())
+    agent_data['knowledgeBaseFile'] = filename
 
-    except requests.exceptions.RequestException as e:
+    # Same document seen before: skip parsing and create the agent right away
+    with span("extraction_cache"):
+        cached_content = extraction_cache.get_text(extraction_cache_key)
+    annotate(extractionCache="HIT" if cached_content is not None else "MISS")
+    if cached_content is not None:
+        os.unlink(upload_path)
+        print(f"Extraction cache hit for {filename} ({content_sha256[:12]})")
+        return cached_content, extraction_cache_key, None
+
+    job = ingestion_jobs.create(deployment_id, filename)
+    ingestion_heartbeat.add(job['id'])
+    agent_store.put({"id": deployment_id, "status": "ingesting", "parameters": agent_data, "ingestion_job_id": job['id']})
+    ingestion_executor.submit(contextvars.copy_context().run, run_ingestion_job, job['id'], deployment_id, agent_data, upload_path, filename, extraction_cache_key)
+    return None, extraction_cache_key, job
+
+def ingestion_accepted_message(deployment_id, job):
+    return {
+        "message": "Knowledge base upload accepted; the agent will be ready once ingestion completes.",
+        "deploymentId": deployment_id,
+        "jobId": job['id'],
+        "statusUrl": f"/api/ingestion-jobs/{job['id']}"
+    }
+
+def create_agent_response(deployment_id, agent_data, knowledge_base_content, extraction_cache_key=None):
+    """
+    Creates the agent synchronously and returns the HTTP response for /api/generate-agent-ai.
+    """
+    try:
+        generated_text = create_agent_profile(deployment_id, agent_data, knowledge_base_content, extraction_cache_key)
+    except GeminiError as e:
         print(f"Error calling Gemini API: {e}")
-        return jsonify({"message": f"Error calling Gemini API: {e}"}), 500
-    except json.JSONDecodeError as e:
-        print(f"Error decoding Gemini API response: {e}")
-        return jsonify({"message": f"Error decoding Gemini API response: {e}"}), 500
+        return jsonify({"message": f"Error calling Gemini API: {e}"}), e.status_code
     except Exception as e:
         print(f"An unexpected error occurred during Gemini API call: {e}")
         return jsonify({"message": f"An unexpected error occurred during AI generation: {e}"}), 500
 
-    # --- Store/Prepare data ---
-    deployment_id = str(uuid.uuid4())
-    full_agent_profile = {
-        "id": deployment_id,
-        "parameters": agent_data, # Original input parameters from form (includes knowledgeBaseType, content)
-        "ai_generated_content": generated_text, # Gemini's response
-        "deployment_channels": agent_data.get('deploymentChannels', []) # Note: This might be stringified JSON from frontend
-    }
-
-    deployed_agents[deployment_id] = full_agent_profile
-    print(f"Agent created and stored. ID: {deployment_id}")
-
     return jsonify({
         "message": "Agent AI generated successfully!",
         "generatedText": generated_text,
         "deploymentId": deployment_id
     }), 200
 
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Hit/miss counters for this worker's caches.
+    """
+    return jsonify({
+        "extraction": extraction_cache.stats(),
+        "tts": tts_cache.stats(),
+        "reply": reply_cache.stats() if reply_cache is not None else None,
+        "coalescing": {"gemini": gemini_flight.stats(), "tts": tts_flight.stats()}
+    }), 200
+
+def ingestion_job_status(job_id):
+    """
+    The /api/ingestion-jobs/<job_id> response body, or None if there is no such job.
+    """
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        return None
+    if job['status'] in ACTIVE_JOB_STATUSES and job['updated_at'] < time.time() - INGESTION_JOB_STALE_SECONDS:
+        fail_orphaned_ingestion_jobs()
+        job = ingestion_jobs.get(job_id)
+
+    result = {
+        "jobId": job['id'],
+        "deploymentId": job['agent_id'],
+        "filename": job['filename'],
+        "status": job['status'],
+        "pagesDone": job['pages_done'],
+        "pagesTotal": job['pages_total'],
+        "progress": job['pages_done'] / job['pages_total'] if job['pages_total'] else 0.0,
+        "error": job['error']
+    }
+    if job['status'] == 'completed':
+        agent_profile = agent_store.get(job['agent_id'])
+        result["generatedText"] = agent_profile.get('ai_generated_content') if agent_profile else None
+    return result
+
+@app.route('/api/ingestion-jobs/<job_id>', methods=['GET'])
+def get_ingestion_job(job_id):
+    """
+    Reports progress of a knowledge base ingestion job. Once completed, the response
+    also carries the agent's generated text.
+    """
+    result = ingestion_job_status(job_id)
+    if result is None:
+        return jsonify({"message": "Ingestion job not found."}), 404
+    return jsonify(result), 200
+
 @app.route('/api/get-agent-data/<deployment_id>', methods=['GET'])
 def get_agent_data(deployment_id):
     """
     Endpoint to fetch Agent data by ID.
     """
-    agent_profile = deployed_agents.get(deployment_id)
+    agent_profile = agent_store.get(deployment_id)
     if agent_profile:
         return jsonify(agent_profile), 200
     else:
         return jsonify({"message": "Agent data not found."}), 404
 
-@app.route('/api/synthesize-speech', methods=['POST'])
-def synthesize_speech():
+@app.route('/api/agents', methods=['GET'])
+def list_agents():
     """
-    Receives text, language, and voice type from frontend,
-    calls Google Cloud TTS, and returns base64 encoded audio.
+    Lists deployed agents, newest first. Paginate with ?limit=<n>&offset=<n>.
     """
-    if not request.is_json:
-        return jsonify({"message": "Request must be JSON"}), 400
+    limit = min(parse_positive_int(request.args.get('limit'), 20), 100)
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"message": "offset must be an integer"}), 400
 
-    data = request.get_json()
-    text = data.get('text')
-    language_code = data.get('languageCode')
-    voice_name = data.get('voiceName')
+    agents = agent_store.list(limit=limit, offset=offset)
+    return jsonify({
+        "agents": agents,
+        "total": agent_store.count(),
+        "limit": limit,
+        "offset": offset
+    }), 200
 
-    if not text or not language_code or not voice_name:
-        return jsonify({"message": "Missing text, languageCode, or voiceName"}), 400
+def build_tts_request(text, language_code, voice_name, speaking_rate):
+    """
+    Keyword arguments for TextToSpeechClient.synthesize_speech (sync or async).
+    """
+    from google.cloud import texttospeech_v1beta1 as texttospeech # Already imported by the client factory
+
+    synthesis_input = texttospeech.SynthesisInput(text=text)
 
-    if tts_client is None:
-        return jsonify({"message": "Google Cloud Text-to-Speech client not initialized. Check server logs."}), 500
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=language_code,
+        name=voice_name
+    )
+
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.MP3,
+        speaking_rate=speaking_rate
+    )
+    return {"input": synthesis_input, "voice": voice, "audio_config": audio_config}
 
+def synthesize_audio(text, language_code, voice_name, speaking_rate=1.0):
+    """
+    Returns (cache_key, mp3_bytes, cache_hit) for the given text and voice, calling
+    Google Cloud TTS only when the audio is not already cached.
+    """
+    cache_key = tts_cache_key(text, language_code, voice_name, speaking_rate, TTS_AUDIO_ENCODING)
+    with span("tts_cache"):
+        audio_content = tts_cache.get(cache_key)
+    if audio_content is not None:
+        return cache_key, audio_content, True
+
+    audio_content, shared = tts_flight.do(
+        cache_key, lambda: synthesize_uncached_audio(cache_key, text, language_code, voice_name, speaking_rate)
+    )
+    if shared:
+        record_coalesced("tts")
+    return cache_key, audio_content, False
+
+def synthesize_uncached_audio(cache_key, text, language_code, voice_name, speaking_rate):
+    """
+    Calls Google Cloud TTS and stores the audio under cache_key. Returns the mp3 bytes.
+    """
+    client = tts_client.get()
+    if client is None:
+        raise RuntimeError("Google Cloud Text-to-Speech client not initialized. Check server logs.")
+
+    started_at = time.perf_counter()
+    with span("tts"):
+        try:
+            response = client.synthesize_speech(**build_tts_request(text, language_code, voice_name, speaking_rate))
+        except Exception as e:
+            record_upstream("tts", voice_name, "synthesize_speech", type(e).__name__, time.perf_counter() - started_at)
+            raise
+    record_upstream("tts", voice_name, "synthesize_speech", "OK", time.perf_counter() - started_at)
+
+    with span("tts_cache_store"):
+        tts_cache.put(cache_key, response.audio_content)
+    return response.audio_content
+
+def parse_speaking_rate(data):
+    """
+    Validates the optional speakingRate (default 1.0) against Google Cloud TTS's 0.25-4.0 range;
+    raises ValueError with the 400 message.
+    """
     try:
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+        speaking_rate = float(data.get('speakingRate', 1.0))
+    except (TypeError, ValueError):
+        raise ValueError("speakingRate must be a number")
+    if not 0.25 <= speaking_rate <= 4.0:
+        raise ValueError("speakingRate must be between 0.25 and 4.0")
+    return speaking_rate
 
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code,
-            name=voice_name
-        )
+def parse_speech_request(data):
+    """
+    Validates a /api/synthesize-speech body. Returns (text, language_code, voice_name,
+    speaking_rate, response_format); raises ValueError with the 400 message.
+    """
+    text = data.get('text')
+    language_code = data.get('languageCode')
+    voice_name = data.get('voiceName')
+    response_format = data.get('responseFormat', 'base64')
 
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0 # You can adjust this if needed
-        )
+    if not text or not language_code or not voice_name:
+        raise ValueError("Missing text, languageCode, or voiceName")
 
-        response = tts_client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+    speaking_rate = parse_speaking_rate(data)
+    if response_format not in ('base64', 'binary', 'url'):
+        raise ValueError("responseFormat must be one of: base64, binary, url")
+    return text, language_code, voice_name, speaking_rate, response_format
 
-        audio_content_base64 = base64.b64encode(response.audio_content).decode('utf-8')
+@app.route('/api/synthesize-speech', methods=['POST'])
+def synthesize_speech():
+    """
+    Receives text, language, and voice type from frontend,
+    calls Google Cloud TTS (or the audio cache), and returns the audio.
+    Optional `responseFormat`: 'base64' (default JSON), 'binary' (raw audio/mpeg body)
+    or 'url' (JSON with a cacheable /api/tts-audio/<key> URL).
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
 
-        return jsonify({"audioContent": audio_content_base64, "format": "audio/mp3"}), 200
+    with span("parse_request"):
+        data = request.get_json()
+    try:
+        text, language_code, voice_name, speaking_rate, response_format = parse_speech_request(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
+    try:
+        cache_key, audio_content, cache_hit = synthesize_audio(text, language_code, voice_name, speaking_rate)
+    except RuntimeError as e:
+        return jsonify({"message": str(e)}), 500
     except Exception as e:
         print(f"Error synthesizing speech with GCP TTS: {e}")
         return jsonify({"message": f"Failed to synthesize speech: {e}"}), 500
 
+    cache_header = {'X-Cache': 'HIT' if cache_hit else 'MISS'}
+    annotate(textChars=len(text), ttsCache=cache_header['X-Cache'], audioBytes=len(audio_content))
+    if response_format == 'binary':
+        return Response(audio_content, mimetype='audio/mpeg', headers={**cache_header, 'ETag': f'"{cache_key}"'})
+    if response_format == 'url':
+        return jsonify({"audioUrl": f"/api/tts-audio/{cache_key}", "format": "audio/mp3"}), 200, cache_header
+
+    with span("encode"):
+        audio_content_base64 = base64.b64encode(audio_content).decode('utf-8')
+        return jsonify({"audioContent": audio_content_base64, "format": "audio/mp3"}), 200, cache_header
+
+@app.route('/api/tts-audio/<cache_key>', methods=['GET'])
+def get_tts_audio(cache_key):
+    """
+    Serves cached speech as audio/mpeg. Keys are content hashes, so browsers may cache forever.
+    """
+    if not tts_cache.is_valid_key(cache_key):
+        return jsonify({"message": "Invalid audio key"}), 400
+    if request.headers.get('If-None-Match') == f'"{cache_key}"':
+        return Response(status=304)
+
+    audio_content = tts_cache.get(cache_key)
+    if audio_content is None:
+        return jsonify({"message": "Audio not found"}), 404
+    return Response(audio_content, mimetype='audio/mpeg', headers={
+        'ETag': f'"{cache_key}"',
+        'Cache-Control': 'public, max-age=31536000, immutable'
+    })
+
 
 @app.route('/api/chat-with-agent', methods=['POST', 'OPTIONS'])
 @cross_origin()
@@ -309,11 +925,143 @@ def chat_with_agent():
     Handles a chat turn with a specified agent.
     Receives agent_id and user_message, fetches agent config,
     and sends to Gemini for a response.
+    Optional `generationConfig` is passed through to Gemini (e.g. temperature 0 for evaluation runs).
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    with span("parse_request"):
+        data = request.get_json()
+    agent_id = data.get('agentId')
+    user_message = data.get('userMessage')
+    chat_history = data.get('chatHistory', [])
+
+    if not agent_id or not user_message:
+        return jsonify({"message": "Missing agentId or userMessage"}), 400
+
+    with span("load_agent"):
+        agent_profile = agent_store.get(agent_id)
+    if not agent_profile:
+        return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
+
+    if not GEMINI_API_KEY:
+        return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
+
+    # Reply cache (when enabled): skip the lookup with header "X-Reply-Cache: bypass" or "bypassCache": true
+    bypass_cache = request.headers.get('X-Reply-Cache', '').lower() == 'bypass' or bool(data.get('bypassCache'))
+
+    try:
+        agent_response_text, cache_status = generate_agent_reply(
+            agent_profile, user_message, chat_history, data.get('generationConfig'), bypass_cache
+        )
+        with span("serialize"):
+            return jsonify({"response": agent_response_text}), 200, {'X-Reply-Cache': cache_status}
+    except GeminiError as e:
+        print(f"Error calling Gemini API for chat: {e}")
+        return jsonify({"message": f"Error communicating with AI: {e}"}), e.status_code
+    except Exception as e:
+        print(f"An unexpected error occurred during chat with AI: {e}")
+        return jsonify({"message": f"An unexpected error occurred: {e}"}), 500
+
+def run_batch_item(agent_profile, item, default_generation_config, bypass_cache):
+    """
+    Runs one /api/chat-with-agent/batch item and returns its result dict; never raises.
+    """
+    started_at = time.perf_counter()
+    result = {"response": None, "error": None, "statusCode": 200, "cache": None}
+    try:
+        history_error = chat_history_error(item.get('chatHistory', []))
+        if not item.get('userMessage'):
+            result.update(error="Missing userMessage", statusCode=400)
+        elif history_error:
+            result.update(error=history_error, statusCode=400)
+        else:
+            result['response'], result['cache'] = generate_agent_reply(
+                agent_profile, item['userMessage'], item.get('chatHistory', []),
+                item.get('generationConfig', default_generation_config), bypass_cache
+            )
+    except GeminiError as e:
+        print(f"Error calling Gemini API for batch chat item: {e}")
+        result.update(error=f"Error communicating with AI: {e}", statusCode=e.status_code)
+    except Exception as e:
+        print(f"An unexpected error occurred during batch chat item: {e}")
+        result.update(error=f"An unexpected error occurred: {e}", statusCode=500)
+    result['latencyMs'] = (time.perf_counter() - started_at) * 1000
+    return result
+
+@app.route('/api/chat-with-agent/batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def chat_with_agent_batch():
+    """
+    Runs many independent chat turns against one agent in a single request.
+    Body: {"agentId", "items": [{"userMessage", "chatHistory", "generationConfig"}], "generationConfig", "bypassCache"}
+    (a top-level generationConfig applies to items that do not set their own).
+    The agent is looked up and its base system instruction built once; the Gemini calls run
+    concurrently on a bounded pool. Results come back in item order, each with its own
+    response or error, statusCode, reply cache status and latencyMs.
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"message": "Request body must be a JSON object"}), 400
+    agent_id = data.get('agentId')
+    items = data.get('items')
+
+    if not agent_id or not isinstance(items, list) or not items:
+        return jsonify({"message": "Missing agentId or items"}), 400
+    if not all(isinstance(item, dict) for item in items):
+        return jsonify({"message": "Each item must be a JSON object"}), 400
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        return jsonify({"message": f"Too many items: at most {CHAT_BATCH_MAX_ITEMS} per batch"}), 400
+
+    agent_profile = agent_store.get(agent_id)
+    if not agent_profile:
+        return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
+
+    if not GEMINI_API_KEY:
+        return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
+
+    bypass_cache = request.headers.get('X-Reply-Cache', '').lower() == 'bypass' or bool(data.get('bypassCache'))
+
+    started_at = time.perf_counter()
+    get_base_system_instruction(agent_profile)
+    futures = [
+        chat_batch_executor.submit(contextvars.copy_context().run, run_batch_item, agent_profile, item, data.get('generationConfig'), bypass_cache)
+        for item in items
+    ]
+    results = [future.result() for future in futures]
+    return jsonify({
+        "results": results,
+        "failed": sum(1 for result in results if result['error']),
+        "timing": {"totalMs": (time.perf_counter() - started_at) * 1000}
+    }), 200
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat-with-agent/stream', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def chat_with_agent_stream():
+    """
+    Streaming variant of /api/chat-with-agent (same request body). Responds with
+    Server-Sent Events: `delta` events carry partial text as Gemini produces it and a
+    final `done` event carries the full response, token usage and timings.
+    A reply cache hit is sent as a single `delta` followed by `done`.
     """
     if not request.is_json:
         return jsonify({"message": "Request must be JSON"}), 400
 
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"message": "Request body must be a JSON object"}), 400
     agent_id = data.get('agentId')
     user_message = data.get('userMessage')
     chat_history = data.get('chatHistory', [])
@@ -321,73 +1069,392 @@ def chat_with_agent():
     if not agent_id or not user_message:
         return jsonify({"message": "Missing agentId or userMessage"}), 400
 
-    agent_profile = deployed_agents.get(agent_id)
+    agent_profile = agent_store.get(agent_id)
     if not agent_profile:
         return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
 
-    agent_name = agent_profile['parameters'].get('name', 'AI Agent')
-    agent_persona = agent_profile.get('ai_generated_content', 'You are a helpful assistant.')
-    campaign_design = agent_profile['parameters'].get('campaignDesignPrompt', 'Engage in general conversation.')
-    selected_llm = agent_profile['parameters'].get('llm', 'gemini-2.0-flash')
-    selected_language = agent_profile['parameters'].get('language', 'English') 
+    if not GEMINI_API_KEY:
+        return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
 
-    system_instruction = (
-        f"You are {agent_name}. Your core persona is:\n{agent_persona}\n\n"
-        f"Follow these conversation flow and function calling instructions:\n{campaign_design}\n\n"
-        f"**IMPORTANT:** All your responses MUST be entirely in {selected_language}. Do NOT use any other language or mixed languages. Start every response directly in {selected_language}. Do not give special symbol: for instance asterisk symbol in response unless required (@ in email address)."
-        f"Be concise, helpful, and follow your defined persona and rules. Respond in markdown."
+    bypass_cache = request.headers.get('X-Reply-Cache', '').lower() == 'bypass' or bool(data.get('bypassCache'))
+    cached_reply, cache_status, gemini_call = prepare_agent_reply(
+        agent_profile, user_message, chat_history, data.get('generationConfig'), bypass_cache
     )
 
-    gemini_chat_history = []
-    gemini_chat_history.append({'role': 'user', 'parts': [{'text': system_instruction}]})
+    def stream_reply_text():
+        """
+        Yields (text, usageMetadata) as Gemini produces the reply, or the cached reply at once.
+        """
+        if gemini_call is None:
+            yield cached_reply, {}
+            return
+        with span("gemini"):
+            for json_chunk in gemini_client.stream_generate_content(
+                gemini_call['model'], {"contents": gemini_call['contents'], **gemini_call['payload_fields']}
+            ):
+                yield chunk_text(json_chunk), json_chunk.get('usageMetadata')
 
-    if chat_history:
-        for entry in chat_history:
-            if entry['sender'] == 'user':
-                gemini_chat_history.append({'role': 'user', 'parts': [{'text': entry['message']}]})
-            elif entry['sender'] == 'agent':
-                gemini_chat_history.append({'role': 'model', 'parts': [{'text': entry['message']}]})
+    def generate():
+        started_at = time.perf_counter()
+        first_token_ms = None
+        usage = {}
+        response_parts = []
+        try:
+            for text, chunk_usage in stream_reply_text():
+                usage = chunk_usage or usage
+                if not text:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started_at) * 1000
+                response_parts.append(text)
+                yield sse_event('delta', {"text": text})
+        except GeminiError as e:
+            print(f"Error streaming from Gemini API for chat: {e}")
+            yield sse_event('error', {"message": f"Error communicating with AI: {e}", "status": e.status_code})
+            return
 
-    gemini_chat_history.append({'role': 'user', 'parts': [{'text': user_message}]})
+        agent_response_text = "".join(response_parts)
+        if gemini_call is not None:
+            store_agent_reply(gemini_call, agent_response_text)
+        yield sse_event('done', {
+            "response": agent_response_text,
+            "usage": usage,
+            "timing": {
+                "firstTokenMs": first_token_ms,
+                "totalMs": (time.perf_counter() - started_at) * 1000
+            }
+        })
 
-    payload = {
-        "contents": gemini_chat_history
-    }
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Reply-Cache': cache_status}
+    )
 
-    headers = {
-        'Content-Type': 'application/json'
-    }
+@app.route('/api/voice-turn', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def voice_turn():
+    """
+    Chat turn plus speech in one request. The Gemini reply is streamed, split into
+    sentences, and each sentence is synthesized on a bounded thread pool as soon as it is
+    complete. Server-Sent Events: `delta` (reply text), `audio` (one per sentence, in
+    order), `audio_error`, and a final `done` with the full reply and timings, including
+    time-to-first-audio. Body: agentId, userMessage, chatHistory, languageCode, voiceName,
+    optional speakingRate and audioFormat ('base64' or 'url').
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    agent_id = data.get('agentId')
+    user_message = data.get('userMessage')
+    chat_history = data.get('chatHistory', [])
+    language_code = data.get('languageCode')
+    voice_name = data.get('voiceName')
+    audio_format = data.get('audioFormat', 'base64')
+
+    if not agent_id or not user_message or not language_code or not voice_name:
+        return jsonify({"message": "Missing agentId, userMessage, languageCode, or voiceName"}), 400
+    try:
+        speaking_rate = parse_speaking_rate(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    agent_profile = agent_store.get(agent_id)
+    if not agent_profile:
+        return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
 
-    api_full_url = f"https://generativelanguage.googleapis.com/v1beta/models/{selected_llm}:generateContent?key={GEMINI_API_KEY}"
-    
     if not GEMINI_API_KEY:
         return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
 
+    selected_llm = agent_profile['parameters'].get('llm', 'gemini-2.0-flash')
+    gemini_chat_history = build_chat_contents(agent_profile, user_message, chat_history)
+
+    def generate():
+        started_at = time.perf_counter()
+        timing = {"firstTokenMs": None, "firstAudioMs": None, "sentences": 0}
+        splitter = SentenceSplitter()
+        pending = deque()
+        response_parts = []
+
+        def submit(sentences):
+            for sentence in sentences:
+                speech_text = clean_for_speech(sentence)
+                if speech_text:
+                    future = tts_executor.submit(contextvars.copy_context().run, synthesize_audio, speech_text, language_code, voice_name, speaking_rate)
+                    pending.append((timing['sentences'], sentence, future))
+                    timing['sentences'] += 1
+
+        def drain(block):
+            # Emit finished sentences strictly in order; stop at the first one still synthesizing.
+            while pending and (block or pending[0][2].done()):
+                index, sentence, future = pending.popleft()
+                try:
+                    cache_key, audio_content, _cache_hit = future.result()
+                except Exception as e:
+                    print(f"Error synthesizing voice-turn sentence {index}: {e}")
+                    yield sse_event('audio_error', {"index": index, "text": sentence, "message": f"Failed to synthesize speech: {e}"})
+                    continue
+                if timing['firstAudioMs'] is None:
+                    timing['firstAudioMs'] = (time.perf_counter() - started_at) * 1000
+                    record_first_audio(timing['firstAudioMs'] / 1000)
+                audio = {"index": index, "text": sentence, "format": "audio/mp3"}
+                if audio_format == 'url':
+                    audio["audioUrl"] = f"/api/tts-audio/{cache_key}"
+                else:
+                    audio["audioContent"] = base64.b64encode(audio_content).decode('utf-8')
+                yield sse_event('audio', audio)
+
+        try:
+            try:
+                for json_chunk in gemini_client.stream_generate_content(selected_llm, {"contents": gemini_chat_history}):
+                    text = chunk_text(json_chunk)
+                    if not text:
+                        continue
+                    if timing['firstTokenMs'] is None:
+                        timing['firstTokenMs'] = (time.perf_counter() - started_at) * 1000
+                    response_parts.append(text)
+                    yield sse_event('delta', {"text": text})
+                    submit(splitter.feed(text))
+                    yield from drain(block=False)
+            except GeminiError as e:
+                print(f"Error streaming from Gemini API for voice turn: {e}")
+                yield sse_event('error', {"message": f"Error communicating with AI: {e}", "status": e.status_code})
+                return
+
+            submit(splitter.flush())
+            yield from drain(block=True)
+
+            timing['totalMs'] = (time.perf_counter() - started_at) * 1000
+            print(f"Voice turn for agent {agent_id}: first token {timing['firstTokenMs']} ms, first audio {timing['firstAudioMs']} ms, total {timing['totalMs']:.0f} ms")
+            yield sse_event('done', {"response": "".join(response_parts), "timing": timing})
+        finally:
+            # Gemini failed or the client disconnected: stop synthesizing sentences nobody will hear
+            for _index, _sentence, future in pending:
+                future.cancel()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def parse_transcription_params(args):
+    """
+    Validates the /api/speech-to-text/stream query string. Returns (language_code,
+    sample_rate_hertz, encoding, interim_results, agent_id); raises ValueError with the 400 message.
+    """
+    language_code = args.get('languageCode', 'en-US')
+    encoding = args.get('encoding', 'LINEAR16').upper()
+    interim_results = args.get('interimResults', 'true').lower() not in ('false', '0', 'no')
     try:
-        response = requests.post(api_full_url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        json_response = response.json()
-
-        if "candidates" in json_response and len(json_response["candidates"]) > 0 and \
-           "content" in json_response["candidates"][0] and \
-           "parts" in json_response["candidates"][0]["content"] and \
-           len(json_response["candidates"][0]["content"]["parts"]) > 0:
-            agent_response_text = json_response["candidates"][0]["content"]["parts"][0]["text"]
-            return jsonify({"response": agent_response_text}), 200
-        else:
-            print(f"Unexpected Gemini API response structure for chat: {json.dumps(json_response)}")
-            return jsonify({"message": "Failed to get agent response from Gemini."}), 500
+        sample_rate_hertz = int(args.get('sampleRateHertz', 16000))
+    except ValueError:
+        raise ValueError("sampleRateHertz must be an integer")
+    if not 8000 <= sample_rate_hertz <= 48000:
+        raise ValueError("sampleRateHertz must be between 8000 and 48000")
+    if encoding not in STT_ENCODINGS:
+        raise ValueError(f"encoding must be one of: {', '.join(STT_ENCODINGS)}")
+    return language_code, sample_rate_hertz, encoding, interim_results, args.get('agentId')
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Gemini API for chat: {e}")
-        return jsonify({"message": f"Error communicating with AI: {e}"}), 500
-    except json.JSONDecodeError as e:
-        print(f"Error decoding Gemini API response for chat: {e}")
-        return jsonify({"message": f"Error processing AI response: {e}"}), 500
-    except Exception as e:
-        print(f"An unexpected error occurred during chat with AI: {e}")
-        return jsonify({"message": f"An unexpected error occurred: {e}"}), 500
+@app.route('/api/speech-to-text/stream', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def speech_to_text_stream():
+    """
+    Streaming transcription. POST raw audio as the body, ideally with Transfer-Encoding:
+    chunked so frames are recognized while the user is still speaking. Query string:
+    languageCode, sampleRateHertz, encoding (default LINEAR16), interimResults, and an
+    optional agentId. Server-Sent Events: `transcript` ({transcript, isFinal, stability})
+    as recognition progresses; with agentId each final transcript is also answered as a
+    chat turn in a `reply` event (the history carries over within the stream); `error`,
+    then `done` with all final transcripts and timings.
+    """
+    try:
+        language_code, sample_rate_hertz, encoding, interim_results, agent_id = parse_transcription_params(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    agent_profile = None
+    if agent_id:
+        agent_profile = agent_store.get(agent_id)
+        if not agent_profile:
+            return jsonify({"message": "Agent not found"}), 404
+        not_ready = agent_not_ready_response(agent_profile)
+        if not_ready:
+            return not_ready
+        if not GEMINI_API_KEY:
+            return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
+
+    client = stt_client.get()
+    if client is None:
+        return jsonify({"message": "Google Cloud Speech-to-Text client not initialized. Check server logs."}), 500
+
+    streaming_config = build_streaming_config(language_code, sample_rate_hertz, encoding, interim_results)
+    audio_chunks = read_audio_chunks(request.stream, audio_chunk_bytes(encoding, sample_rate_hertz))
+
+    def generate():
+        started_at = time.perf_counter()
+        timing = {"firstResultMs": None}
+        utterances = []
+        chat_history = []
+        status = "OK"
+        try:
+            for result in transcribe_stream(client, streaming_config, audio_chunks):
+                if timing['firstResultMs'] is None:
+                    timing['firstResultMs'] = (time.perf_counter() - started_at) * 1000
+                yield sse_event('transcript', result)
+                transcript = result['transcript'].strip()
+                if not result['isFinal'] or not transcript:
+                    continue
+                utterances.append(transcript)
+                if agent_profile is None:
+                    continue
+
+                # End of an utterance: answer it right away, while recognition keeps consuming audio
+                reply_started_at = time.perf_counter()
+                try:
+                    agent_response_text, _cache_status = generate_agent_reply(agent_profile, transcript, chat_history)
+                except GeminiError as e:
+                    print(f"Error calling Gemini API for transcribed chat turn: {e}")
+                    yield sse_event('error', {"message": f"Error communicating with AI: {e}", "status": e.status_code})
+                    continue
+                chat_history += [{"sender": "user", "message": transcript}, {"sender": "agent", "message": agent_response_text}]
+                yield sse_event('reply', {
+                    "transcript": transcript,
+                    "response": agent_response_text,
+                    "timing": {"replyMs": (time.perf_counter() - reply_started_at) * 1000}
+                })
+        except Exception as e:
+            status = type(e).__name__
+            print(f"Error during streaming speech recognition: {e}")
+            yield sse_event('error', {"message": f"Speech recognition failed: {e}", "status": 500})
+        finally:
+            record_upstream("stt", language_code, "streaming_recognize", status, time.perf_counter() - started_at)
+
+        timing['totalMs'] = (time.perf_counter() - started_at) * 1000
+        yield sse_event('done', {"utterances": utterances, "timing": timing})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/sessions', methods=['POST'])
+def create_chat_session():
+    """
+    Starts a server-side chat session with an agent. Subsequent turns are posted to
+    /api/sessions/<session_id>/messages with only the new user message.
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"message": "Request body must be a JSON object"}), 400
+    agent_id = data.get('agentId')
+    if not agent_id:
+        return jsonify({"message": "Missing agentId"}), 400
+    agent_profile = agent_store.get(agent_id)
+    if not agent_profile:
+        return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
+
+    session_store.purge_expired()
+    session = session_store.create(agent_id)
+    return jsonify({"sessionId": session['id'], "agentId": agent_id, "expiresAt": session['expires_at']}), 201
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_chat_session(session_id):
+    """
+    Returns the session summary and the turns not yet folded into it.
+    """
+    session = session_store.get(session_id)
+    if not session:
+        return jsonify({"message": "Session not found or expired"}), 404
+
+    turns = session_store.active_turns(session_id)
+    return jsonify({
+        "sessionId": session['id'],
+        "agentId": session['agent_id'],
+        "summary": session['summary'],
+        "chatHistory": [{"sender": 'user' if t['role'] == 'user' else 'agent', "message": t['text']} for t in turns],
+        "expiresAt": session['expires_at']
+    }), 200
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_chat_session(session_id):
+    if not session_store.delete(session_id):
+        return jsonify({"message": "Session not found or expired"}), 404
+    return jsonify({"message": "Session deleted"}), 200
+
+@app.route('/api/sessions/<session_id>/messages', methods=['POST'])
+def post_session_message(session_id):
+    """
+    Handles one chat turn inside a session. History is kept on the server; when it
+    exceeds the agent's token budget the oldest turns are summarized first. The latest
+    exchange is never summarized, so historyTokens can exceed the budget when that
+    exchange alone is larger than it.
+    """
+    if not request.is_json:
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"message": "Request body must be a JSON object"}), 400
+    user_message = data.get('userMessage')
+    if not user_message:
+        return jsonify({"message": "Missing userMessage"}), 400
 
+    session = session_store.get(session_id)
+    if not session:
+        return jsonify({"message": "Session not found or expired"}), 404
+
+    agent_profile = agent_store.get(session['agent_id'])
+    if not agent_profile:
+        return jsonify({"message": "Agent not found"}), 404
+    not_ready = agent_not_ready_response(agent_profile)
+    if not_ready:
+        return not_ready
+
+    if not GEMINI_API_KEY:
+        return jsonify({"message": "Gemini API Key not configured on the backend."}), 500
+
+    selected_llm = agent_profile['parameters'].get('llm', 'gemini-2.0-flash')
+    token_budget = agent_profile.get('history_token_budget', DEFAULT_HISTORY_TOKEN_BUDGET)
+    turns = session_store.active_turns(session_id)
+    summary = session['summary']
+
+    turns_to_compact = select_turns_to_compact(turns, estimate_tokens(user_message), token_budget)
+    if turns_to_compact:
+        with span("summarize_history"):
+            summary = summarize_history(selected_llm, summary, turns_to_compact, agent_profile['parameters'].get('language', 'English'))
+        session_store.compact(session_id, summary, turns_to_compact[-1]['seq'])
+        turns = turns[len(turns_to_compact):]
+
+    chat_history = [{"sender": 'user' if turn['role'] == 'user' else 'agent', "message": turn['text']} for turn in turns]
+    try:
+        agent_response_text, cache_status = generate_agent_reply(agent_profile, user_message, chat_history, history_summary=summary)
+    except GeminiError as e:
+        print(f"Error calling Gemini API for session chat: {e}")
+        return jsonify({"message": f"Error communicating with AI: {e}"}), e.status_code
+
+    if not session_store.append_turns(session_id, [('user', user_message), ('model', agent_response_text)]):
+        return jsonify({"message": "Session not found or expired"}), 404
+    return jsonify({
+        "response": agent_response_text,
+        "sessionId": session_id,
+        "summarized": bool(turns_to_compact),
+        "historyTokens": sum(turn['tokens'] for turn in turns) + estimate_tokens(user_message) + estimate_tokens(agent_response_text)
+    }), 200, {'X-Reply-Cache': cache_status}
 
 
 if __name__ == '__main__':
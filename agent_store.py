@@ -0,0 +1,168 @@
+# Pluggable storage for deployed agent profiles.
+# SQLite (WAL mode) is the default so every worker process sees the same agents and they survive
+# restarts; a small in-process LRU sits in front of it for the hot chat path.
+
+import json
+import os
+import threading
+import time
+
+from lru import LRUCache
+from sqlite_db import SQLiteDatabase
+
+
+class AgentStore:
+    """
+    Interface implemented by every agent storage backend.
+    """
+
+    def get(self, agent_id):
+        raise NotImplementedError
+
+    def put(self, agent_profile):
+        """
+        Inserts or replaces the profile stored under agent_profile['id'].
+        """
+        raise NotImplementedError
+
+    def list(self, limit=20, offset=0):
+        """
+        Returns agent summaries, newest first.
+        """
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+
+def summarize_agent(agent_profile, created_at):
+    parameters = agent_profile.get('parameters', {})
+    return {
+        "id": agent_profile['id'],
+        "name": parameters.get('name'),
+        "useCase": parameters.get('useCase'),
+        "language": parameters.get('language'),
+        "createdAt": created_at,
+    }
+
+
+class MemoryAgentStore(AgentStore):
+    """
+    Process-local store (the original behaviour). Only suitable for a single worker.
+    """
+
+    def __init__(self):
+        self._agents = {}
+        self._created_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, agent_id):
+        return self._agents.get(agent_id)
+
+    def put(self, agent_profile):
+        with self._lock:
+            self._created_at.setdefault(agent_profile['id'], time.time())
+            self._agents[agent_profile['id']] = agent_profile
+
+    def list(self, limit=20, offset=0):
+        with self._lock:
+            ordered = sorted(self._created_at.items(), key=lambda item: item[1], reverse=True)
+        return [summarize_agent(self._agents[agent_id], created_at) for agent_id, created_at in ordered[offset:offset + limit]]
+
+    def count(self):
+        return len(self._agents)
+
+
+class SQLiteAgentStore(SQLiteDatabase, AgentStore):
+    """
+    Agents stored as JSON rows keyed by deployment id. WAL mode lets any number of
+    worker processes read concurrently while one writes; each thread keeps its own
+    connection so lookups never share a lock.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS agents ("
+        " id TEXT PRIMARY KEY,"
+        " name TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " profile TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_agents_created_at ON agents (created_at DESC)",
+    )
+
+    def get(self, agent_id):
+        row = self._conn().execute("SELECT profile FROM agents WHERE id = ?", (agent_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, agent_profile):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO agents (id, name, created_at, updated_at, profile) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET name = excluded.name, updated_at = excluded.updated_at, profile = excluded.profile",
+            (agent_profile['id'], agent_profile.get('parameters', {}).get('name'), now, now, json.dumps(agent_profile)),
+        )
+
+    def list(self, limit=20, offset=0):
+        rows = self._conn().execute(
+            "SELECT id, name, json_extract(profile, '$.parameters.useCase'), json_extract(profile, '$.parameters.language'), created_at"
+            " FROM agents ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+        return [
+            {"id": agent_id, "name": name, "useCase": use_case, "language": language, "createdAt": created_at}
+            for agent_id, name, use_case, language, created_at in rows
+        ]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM agents").fetchone()[0]
+
+
+class CachedAgentStore(AgentStore):
+    """
+    Read-through LRU cache in front of another store. Entries expire after `ttl`
+    seconds so updates made by other workers become visible. Agents that are not ready
+    yet (still ingesting) are never cached, so they go live everywhere as soon as they finish.
+    """
+
+    def __init__(self, backend, maxsize=256, ttl=30):
+        self.backend = backend
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, agent_id):
+        agent_profile = self.cache.get(agent_id)
+        if agent_profile is None:
+            agent_profile = self.backend.get(agent_id)
+            if agent_profile is not None and agent_profile.get('status', 'ready') == 'ready':
+                self.cache.set(agent_id, agent_profile)
+        return agent_profile
+
+    def put(self, agent_profile):
+        self.backend.put(agent_profile)
+        if agent_profile.get('status', 'ready') == 'ready':
+            self.cache.set(agent_profile['id'], agent_profile)
+        else:
+            self.cache.pop(agent_profile['id'])
+
+    def list(self, limit=20, offset=0):
+        return self.backend.list(limit=limit, offset=offset)
+
+    def count(self):
+        return self.backend.count()
+
+
+def create_agent_store():
+    """
+    Builds the store selected by AGENT_STORE ('sqlite' by default, or 'memory').
+    """
+    backend_name = os.environ.get("AGENT_STORE", "sqlite").lower()
+    if backend_name == "memory":
+        backend = MemoryAgentStore()
+    elif backend_name == "sqlite":
+        backend = SQLiteAgentStore(os.environ.get("AGENT_STORE_PATH", "agents.db"))
+    else:
+        raise ValueError(f"Unknown AGENT_STORE backend: {backend_name}")
+    return CachedAgentStore(
+        backend,
+        maxsize=int(os.environ.get("AGENT_CACHE_SIZE", "256")),
+        ttl=float(os.environ.get("AGENT_CACHE_TTL", "30")),
+    )
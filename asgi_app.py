@@ -0,0 +1,301 @@
+# Async (ASGI) serving mode for the agent backend
+# (requires starlette, a2wsgi, uvicorn and aiohttp: pip install starlette a2wsgi uvicorn aiohttp).
+# The hot endpoints - chat and speech synthesis - get native Starlette handlers with one coroutine
+# per request instead of one thread: Gemini and TTS calls are awaited (AsyncGeminiClient, the
+# Google Cloud async TTS client) and blocking work - SQLite lookups, retrieval, disk caches -
+# runs on a bounded thread pool, so a single process can keep hundreds of conversations waiting
+# on upstreams. Every other route is agent_backend's Flask app itself, mounted through a2wsgi,
+# so the two serving modes cannot drift apart. Stores, caches and settings are shared.
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+import asyncio
+import base64
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import observability
+from agent_backend import (
+    GEMINI_API_KEY, REQUEST_LOG_JSON, TTS_AUDIO_ENCODING, agent_not_ready_message, agent_store, build_tts_request,
+    gemini_client, gemini_request_key, parse_speech_request, prepare_agent_reply, store_agent_reply, tts_cache,
+)
+from agent_backend import app as flask_app
+from gemini_async_client import AsyncGeminiClient
+from gemini_client import GeminiError, create_gemini_client
+from lazy import LazyValue
+from observability import annotate, record_coalesced, record_upstream, span
+from single_flight import AsyncSingleFlight
+from tts_cache import tts_cache_key
+
+BLOCKING_WORKERS = int(os.environ.get("ASGI_BLOCKING_WORKERS", "32"))
+
+# Blocking work from the native handlers; its size caps concurrent SQLite/disk/CPU work, not requests
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="asgi-blocking")
+
+# Same limits as the sync client, sharing its circuit breaker
+async_gemini_client = create_gemini_client(
+    GEMINI_API_KEY, client_class=AsyncGeminiClient, breaker=gemini_client.breaker, observer=observability.gemini_observer
+)
+
+# Identical concurrent Gemini / TTS requests share one in-flight upstream call
+async_gemini_flight = AsyncSingleFlight()
+async_tts_flight = AsyncSingleFlight()
+
+
+# --- Google Cloud TTS async client ---
+# grpc.aio binds the client to the event loop that creates it, so only credential discovery
+# (which can block for seconds) runs on the executor; the client is created on the loop.
+def load_tts_credentials():
+    try:
+        import google.auth
+        credentials, _project = google.auth.default()
+        return credentials
+    except Exception as e:
+        print(f"ERROR: Failed to load Google Cloud credentials for Text-to-Speech: {e}")
+        print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set and has 'Cloud Text-to-Speech User' role.")
+        return None
+
+def create_async_tts_client():
+    credentials = tts_credentials.get()
+    if credentials is None:
+        return None
+    try:
+        from google.cloud import texttospeech_v1beta1 as texttospeech
+        client = texttospeech.TextToSpeechAsyncClient(credentials=credentials)
+        print("Google Cloud Text-to-Speech async client initialized.")
+        return client
+    except Exception as e:
+        print(f"ERROR: Failed to initialize Google Cloud Text-to-Speech async client: {e}")
+        return None
+
+tts_credentials = LazyValue(load_tts_credentials, name="tts_credentials")
+async_tts_client = LazyValue(create_async_tts_client, name="async_tts")
+
+async def get_async_tts_client():
+    if not async_tts_client.loaded:
+        await run_blocking(tts_credentials.get)
+    return async_tts_client.get()
+
+
+async def run_blocking(function, *args):
+    """
+    Runs function(*args) on the blocking executor, in the caller's context (request trace included).
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, functools.partial(context.run, function, *args))
+
+
+def traced(handler):
+    """
+    Request trace, X-Request-ID and JSON request log for a native handler, as agent_backend's
+    before/after_request hooks do for the Flask routes.
+    """
+    @functools.wraps(handler)
+    async def endpoint(request):
+        observability.start_trace(handler.__name__, request.headers.get('x-request-id'))
+        try:
+            response = await handler(request)
+        except Exception as e:
+            print(f"An unexpected error occurred in {handler.__name__}: {e}")
+            response = JSONResponse({"message": f"An unexpected error occurred: {e}"}, 500)
+        trace = observability.end_trace(request.method, response.status_code)
+        if trace is not None:
+            response.headers['X-Request-ID'] = trace.request_id
+            if REQUEST_LOG_JSON:
+                observability.log_trace(trace)
+        return response
+    return endpoint
+
+
+async def read_json_object(request):
+    """
+    The request's JSON object body; raises ValueError with the 400 message otherwise.
+    """
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if mimetype != 'application/json' and not mimetype.endswith('+json'):
+        raise ValueError("Request must be JSON")
+    with span("parse_request"):
+        try:
+            data = json.loads(await request.body() or b'null')
+        except ValueError:
+            raise ValueError("Request body must be valid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+
+# --- Chat ---
+async def generate_agent_reply(agent_profile, user_message, chat_history, generation_config=None, bypass_cache=False):
+    """
+    Async agent_backend.generate_agent_reply: prompt building and caches on the executor,
+    the Gemini call awaited.
+    """
+    cached_reply, cache_status, gemini_call = await run_blocking(
+        prepare_agent_reply, agent_profile, user_message, chat_history, generation_config, bypass_cache
+    )
+    if gemini_call is None:
+        return cached_reply, cache_status
+    with span("gemini"):
+        agent_response_text, shared = await async_gemini_flight.do(
+            gemini_request_key(gemini_call),
+            lambda: async_gemini_client.generate_text(gemini_call['model'], gemini_call['contents'], **gemini_call['payload_fields'])
+        )
+    if shared:
+        record_coalesced("gemini")
+    elif gemini_call['cache_key'] is not None:
+        await run_blocking(store_agent_reply, gemini_call, agent_response_text)
+    return agent_response_text, cache_status
+
+@traced
+async def chat_with_agent(request):
+    try:
+        data = await read_json_object(request)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, 400)
+    agent_id = data.get('agentId')
+    user_message = data.get('userMessage')
+    chat_history = data.get('chatHistory', [])
+
+    if not agent_id or not user_message:
+        return JSONResponse({"message": "Missing agentId or userMessage"}, 400)
+
+    with span("load_agent"):
+        agent_profile = await run_blocking(agent_store.get, agent_id)
+    if not agent_profile:
+        return JSONResponse({"message": "Agent not found"}, 404)
+    not_ready = agent_not_ready_message(agent_profile)
+    if not_ready:
+        return JSONResponse(not_ready, 409)
+
+    if not GEMINI_API_KEY:
+        return JSONResponse({"message": "Gemini API Key not configured on the backend."}, 500)
+
+    bypass_cache = request.headers.get('x-reply-cache', '').lower() == 'bypass' or bool(data.get('bypassCache'))
+
+    try:
+        agent_response_text, cache_status = await generate_agent_reply(
+            agent_profile, user_message, chat_history, data.get('generationConfig'), bypass_cache
+        )
+    except GeminiError as e:
+        print(f"Error calling Gemini API for chat: {e}")
+        return JSONResponse({"message": f"Error communicating with AI: {e}"}, e.status_code)
+    return JSONResponse({"response": agent_response_text}, headers={'X-Reply-Cache': cache_status})
+
+
+# --- Speech synthesis ---
+async def synthesize_audio(text, language_code, voice_name, speaking_rate=1.0):
+    """
+    Async agent_backend.synthesize_audio: the audio cache on the executor, TTS awaited.
+    """
+    cache_key = tts_cache_key(text, language_code, voice_name, speaking_rate, TTS_AUDIO_ENCODING)
+    with span("tts_cache"):
+        audio_content = await run_blocking(tts_cache.get, cache_key)
+    if audio_content is not None:
+        return cache_key, audio_content, True
+
+    audio_content, shared = await async_tts_flight.do(
+        cache_key, lambda: synthesize_uncached_audio(cache_key, text, language_code, voice_name, speaking_rate)
+    )
+    if shared:
+        record_coalesced("tts")
+    return cache_key, audio_content, False
+
+async def synthesize_uncached_audio(cache_key, text, language_code, voice_name, speaking_rate):
+    client = await get_async_tts_client()
+    if client is None:
+        raise RuntimeError("Google Cloud Text-to-Speech client not initialized. Check server logs.")
+
+    started_at = time.perf_counter()
+    with span("tts"):
+        try:
+            response = await client.synthesize_speech(**build_tts_request(text, language_code, voice_name, speaking_rate))
+        except Exception as e:
+            record_upstream("tts", voice_name, "synthesize_speech", type(e).__name__, time.perf_counter() - started_at)
+            raise
+    record_upstream("tts", voice_name, "synthesize_speech", "OK", time.perf_counter() - started_at)
+
+    with span("tts_cache_store"):
+        await run_blocking(tts_cache.put, cache_key, response.audio_content)
+    return response.audio_content
+
+@traced
+async def synthesize_speech(request):
+    try:
+        data = await read_json_object(request)
+        text, language_code, voice_name, speaking_rate, response_format = parse_speech_request(data)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, 400)
+
+    try:
+        cache_key, audio_content, cache_hit = await synthesize_audio(text, language_code, voice_name, speaking_rate)
+    except RuntimeError as e:
+        return JSONResponse({"message": str(e)}, 500)
+    except Exception as e:
+        print(f"Error synthesizing speech with GCP TTS: {e}")
+        return JSONResponse({"message": f"Failed to synthesize speech: {e}"}, 500)
+
+    cache_header = {'X-Cache': 'HIT' if cache_hit else 'MISS'}
+    annotate(textChars=len(text), ttsCache=cache_header['X-Cache'], audioBytes=len(audio_content))
+    if response_format == 'binary':
+        return Response(audio_content, media_type='audio/mpeg', headers={**cache_header, 'ETag': f'"{cache_key}"'})
+    if response_format == 'url':
+        return JSONResponse({"audioUrl": f"/api/tts-audio/{cache_key}", "format": "audio/mp3"}, headers=cache_header)
+
+    with span("encode"):
+        audio_content_base64 = base64.b64encode(audio_content).decode('utf-8')
+        return JSONResponse({"audioContent": audio_content_base64, "format": "audio/mp3"}, headers=cache_header)
+
+@traced
+async def get_tts_audio(request):
+    cache_key = request.path_params['cache_key']
+    if not tts_cache.is_valid_key(cache_key):
+        return JSONResponse({"message": "Invalid audio key"}, 400)
+    if request.headers.get('if-none-match') == f'"{cache_key}"':
+        return Response(status_code=304, media_type='audio/mpeg')
+
+    audio_content = await run_blocking(tts_cache.get, cache_key)
+    if audio_content is None:
+        return JSONResponse({"message": "Audio not found"}, 404)
+    return Response(audio_content, media_type='audio/mpeg', headers={
+        'ETag': f'"{cache_key}"',
+        'Cache-Control': 'public, max-age=31536000, immutable'
+    })
+
+
+# --- Application ---
+@asynccontextmanager
+async def lifespan(app):
+    warm_up = os.environ.get("WARM_UP", "").lower()
+    if warm_up == "all" or "tts" in warm_up.split(","):
+        await get_async_tts_client()
+    yield
+    await async_gemini_client.aclose()
+    blocking_executor.shutdown(wait=False)
+
+# Native routes answer CORS like flask-cors does for the Flask app; their preflight (OPTIONS)
+# requests fall through to the Flask app, which has the same routes.
+native_middleware = [Middleware(CORSMiddleware, allow_origins=["*"])]
+
+app = Starlette(
+    routes=[
+        Route('/api/chat-with-agent', chat_with_agent, methods=['POST'], middleware=native_middleware),
+        Route('/api/synthesize-speech', synthesize_speech, methods=['POST'], middleware=native_middleware),
+        Route('/api/tts-audio/{cache_key}', get_tts_audio, methods=['GET'], middleware=native_middleware),
+        # Everything else - agent creation, ingestion status, sessions, streaming, voice, /metrics -
+        # runs in the Flask app on a2wsgi's threads
+        Mount('/', app=WSGIMiddleware(flask_app, workers=BLOCKING_WORKERS)),
+    ],
+    lifespan=lifespan,
+)
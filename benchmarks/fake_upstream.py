@@ -0,0 +1,206 @@
+# Local stand-ins for the upstream APIs the backend calls, for benchmarks and load tests.
+# FakeGeminiServer speaks the generateContent / streamGenerateContent (alt=sse) REST API;
+# FakeTTSClient / FakeAsyncTTSClient replace the Google Cloud TTS client objects (gRPC, not HTTP)
+# and FakeSpeechClient the Speech-to-Text one.
+# Both take a latency (mean + uniform jitter, in ms) and an error rate to inject failures;
+# fail_next(n) makes the next n calls fail, for tests that need a deterministic sequence.
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+FAKE_REPLY = (
+    "Thanks for reaching out. Our standard shipping takes 3-5 business days and express shipping "
+    "takes 1-2 business days. Is there anything else I can help you with today?"
+)
+
+
+class UpstreamFaults:
+    """
+    Latency and error injection shared by the fakes. Thread-safe counters.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503, retry_after=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status # HTTP status of injected Gemini failures
+        self.retry_after = retry_after # Retry-After seconds sent with them, if any
+        self.calls = 0
+        self.errors = 0
+        self._forced_failures = 0
+        self._lock = threading.Lock()
+
+    def fail_next(self, count):
+        with self._lock:
+            self._forced_failures = count
+
+    def latency_seconds(self, fraction=1.0):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, latency) * fraction / 1000
+
+    def delay(self, fraction=1.0):
+        time.sleep(self.latency_seconds(fraction))
+
+    def should_fail(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._forced_failures > 0 or random.random() < self.error_rate
+            if self._forced_failures > 0:
+                self._forced_failures -= 1
+            if failed:
+                self.errors += 1
+        return failed
+
+    def stats(self):
+        return {"calls": self.calls, "injectedErrors": self.errors}
+
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        faults = self.server.faults
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if faults.should_fail():
+            faults.delay()
+            headers = {'Retry-After': str(faults.retry_after)} if faults.retry_after is not None else None
+            self._send_json(faults.error_status, {"error": {"code": faults.error_status, "message": "Injected failure"}}, headers)
+            return
+        if ':streamGenerateContent' in self.path:
+            self._stream_reply(faults)
+            return
+        faults.delay()
+        self._send_json(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": FAKE_REPLY}]}}],
+            "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 40, "totalTokenCount": 140},
+        })
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream_reply(self, faults):
+        words = FAKE_REPLY.split(" ")
+        chunks = [" ".join(words[i:i + 6]) + " " for i in range(0, len(words), 6)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for index, text in enumerate(chunks):
+            # First chunk carries most of the latency (time to first token), the rest trickle in
+            faults.delay(0.5 if index == 0 else 0.5 / max(1, len(chunks) - 1))
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+            if index == len(chunks) - 1:
+                chunk["usageMetadata"] = {"promptTokenCount": 100, "candidatesTokenCount": 40, "totalTokenCount": 140}
+            event = f"data: {json.dumps(chunk)}\r\n\r\n".encode('utf-8')
+            self.wfile.write(f"{len(event):x}\r\n".encode('ascii') + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024 # Listen backlog; the default of 5 drops connections under load
+
+
+class FakeGeminiServer:
+    """
+    Serves /<version>/models/<model>:generateContent and :streamGenerateContent on 127.0.0.1.
+    Point GEMINI_API_BASE at `api_base` before the backend is imported.
+    """
+
+    def __init__(self, faults, port=0):
+        self.faults = faults
+        self._server = _ThreadingServer(('127.0.0.1', port), _GeminiHandler)
+        self._server.faults = faults
+        self._thread = None
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1beta"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeTTSClient:
+    """
+    Drop-in for texttospeech.TextToSpeechClient().synthesize_speech: returns fake MP3 bytes
+    sized roughly like real audio for the input text.
+    """
+
+    def __init__(self, faults):
+        self.faults = faults
+
+    def synthesize_speech(self, input, voice, audio_config):
+        self.faults.delay()
+        if self.faults.should_fail():
+            raise RuntimeError("Injected TTS failure")
+        return SimpleNamespace(audio_content=b"ID3" + b"\x00" * (len(input.text) * 400))
+
+
+class FakeAsyncTTSClient(FakeTTSClient):
+    """
+    Drop-in for texttospeech.TextToSpeechAsyncClient, used by the ASGI app.
+    """
+
+    async def synthesize_speech(self, input, voice, audio_config):
+        await asyncio.sleep(self.faults.latency_seconds())
+        if self.faults.should_fail():
+            raise RuntimeError("Injected TTS failure")
+        return SimpleNamespace(audio_content=b"ID3" + b"\x00" * (len(input.text) * 400))
+
+
+def _recognition_response(transcript, is_final):
+    result = SimpleNamespace(
+        alternatives=[SimpleNamespace(transcript=transcript)], is_final=is_final, stability=0.0 if is_final else 0.8
+    )
+    return SimpleNamespace(results=[result])
+
+
+class FakeSpeechClient:
+    """
+    Drop-in for speech.SpeechClient().streaming_recognize that "hears" the audio bytes as
+    UTF-8 text: after each audio chunk it returns an interim result with the utterance so far,
+    and every sentence end (. ! ?) closes the utterance with a final result. Runs of whitespace
+    count as one space, so chunks can be padded to a fixed size. `faults.delay()` runs per chunk.
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or UpstreamFaults()
+
+    def streaming_recognize(self, config, requests):
+        utterance = ""
+        for request in requests:
+            self.faults.delay()
+            if self.faults.should_fail():
+                raise RuntimeError("Injected STT failure")
+            utterance += request.audio_content.decode('utf-8', errors='ignore')
+            while (match := re.search(r'[.!?]', utterance)):
+                final, utterance = utterance[:match.end()], utterance[match.end():]
+                yield _recognition_response(" ".join(final.split()), True)
+            if utterance.strip() and config.interim_results:
+                yield _recognition_response(" ".join(utterance.split()), False)
+        if utterance.strip():
+            yield _recognition_response(" ".join(utterance.split()), True)
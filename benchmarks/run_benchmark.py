@@ -0,0 +1,262 @@
+# Load and latency benchmark for agent_backend.py, run entirely against local fakes (no API quota).
+# Starts FakeGeminiServer, swaps in the fake TTS client, serves the Flask app on a local threaded
+# server (or, with --server asgi, asgi_app on uvicorn), then drives each endpoint at a fixed request rate with a concurrency cap and writes the results
+# (p50/p95/p99 latency, throughput, error rates) as JSON that can be compared between commits.
+#
+#   python -m benchmarks.run_benchmark --rps 20 --concurrency 32 --duration 30 --output bench.json
+#   python -m benchmarks.run_benchmark --gemini-error-rate 0.05 --baseline bench.json
+#   python -m benchmarks.run_benchmark --server asgi --endpoints chat --rps 300 --concurrency 1000
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+import numpy as np
+
+from benchmarks.fake_upstream import FakeAsyncTTSClient, FakeGeminiServer, FakeTTSClient, UpstreamFaults
+
+ENDPOINTS = ("generate", "chat", "synthesize")
+
+KNOWLEDGE_BASE = "\n".join(
+    f"Section {i}. Bean O ships premium organic coffee worldwide. Standard shipping takes 3-5 business days, "
+    f"express shipping 1-2 business days. Unopened bags can be returned within 30 days. We roast light, "
+    f"medium and dark beans and offer subscriptions that can be managed from the account dashboard."
+    for i in range(40)
+)
+
+AGENT_FORM = {
+    "name": "Benchmark Agent",
+    "llm": "gemini-2.0-flash",
+    "useCase": "customer support",
+    "purpose": "answer questions about orders and products",
+    "campaignDesignPrompt": "Greet the customer and answer their question.",
+    "language": "English",
+    "knowledgeBaseType": "text",
+    "knowledgeBaseContent": KNOWLEDGE_BASE,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark agent_backend.py against local fake Gemini/TTS upstreams.")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--rps", type=float, default=10.0, help="requests started per second, per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="max requests in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per endpoint")
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency-ms", type=float, default=200.0)
+    parser.add_argument("--tts-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-distinct-texts", type=int, default=0,
+                        help="cycle through this many texts (0 = every request unique, i.e. no TTS cache hits)")
+    parser.add_argument("--agent-store", default="sqlite", choices=("sqlite", "memory"))
+    parser.add_argument("--server", default="flask", choices=("flask", "asgi"),
+                        help="serve agent_backend's Flask app (threaded) or asgi_app on uvicorn")
+    parser.add_argument("--output", default=None, help="write the JSON report here (default: stdout only)")
+    parser.add_argument("--baseline", default=None, help="earlier JSON report to print deltas against")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_backend(work_dir, gemini_api_base, tts_faults, agent_store, server="flask"):
+    """
+    Imports agent_backend against the fakes and serves it on 127.0.0.1. Returns (stop, base_url).
+    Must run before anything else imports agent_backend, since it reads its settings at import time.
+    """
+    os.environ.update({
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_API_BASE": gemini_api_base,
+        "AGENT_STORE": agent_store,
+        "AGENT_STORE_PATH": os.path.join(work_dir, "agents.db"),
+        "KNOWLEDGE_INDEX_DIR": os.path.join(work_dir, "agent_indexes"),
+        "TTS_CACHE_DIR": os.path.join(work_dir, "tts_cache"),
+        "EXTRACTION_CACHE_DIR": os.path.join(work_dir, "extraction_cache"),
+        "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+    })
+    import agent_backend
+
+    agent_backend.tts_client.set(FakeTTSClient(tts_faults))
+    if server == "asgi":
+        return start_asgi_backend(tts_faults)
+
+    from werkzeug.serving import make_server
+
+    wsgi_server = make_server("127.0.0.1", 0, agent_backend.app, threaded=True)
+    threading.Thread(target=wsgi_server.serve_forever, daemon=True).start()
+    return wsgi_server.shutdown, f"http://127.0.0.1:{wsgi_server.server_port}"
+
+
+def start_asgi_backend(tts_faults):
+    import asgi_app
+    import uvicorn
+
+    asgi_app.async_tts_client.set(FakeAsyncTTSClient(tts_faults))
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return stop, f"http://127.0.0.1:{port}"
+
+
+def request_factory(endpoint, agent_id, tts_distinct_texts):
+    """
+    Returns make_request(i) -> (path, aiohttp request kwargs) for the endpoint.
+    """
+    if endpoint == "generate":
+        return lambda i: ("/api/generate-agent-ai", {"data": dict(AGENT_FORM, name=f"Benchmark Agent {i}")})
+    if endpoint == "chat":
+        return lambda i: ("/api/chat-with-agent", {"json": {
+            "agentId": agent_id,
+            "userMessage": f"Question {i}: how long does express shipping take?",
+            "chatHistory": [],
+        }})
+    if endpoint == "synthesize":
+        def make_request(i):
+            n = i % tts_distinct_texts if tts_distinct_texts else i
+            return "/api/synthesize-speech", {"json": {
+                "text": f"This is benchmark sentence number {n}, spoken by the agent.",
+                "languageCode": "en-US",
+                "voiceName": "en-US-Standard-C",
+                "responseFormat": "url",
+            }}
+        return make_request
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def drive(session, make_request, rps, concurrency, duration):
+    """
+    Open-loop load: request i is due at start + i / rps whether or not earlier ones finished.
+    Latency is measured from the due time, so time spent waiting for a free concurrency slot
+    counts (no coordinated omission). Returns ([(latency_ms, status or None, error)], elapsed_s).
+    The client is aiohttp because httpx's connection pool cost grows with requests in flight
+    and would dominate the measurement at high concurrency.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    started_at = time.perf_counter()
+
+    async def one(i, due_at):
+        async with semaphore:
+            path, kwargs = make_request(i)
+            try:
+                async with session.post(path, **kwargs) as response:
+                    await response.read()
+                samples.append(((time.perf_counter() - due_at) * 1000, response.status, None))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                samples.append(((time.perf_counter() - due_at) * 1000, None, type(e).__name__))
+
+    tasks = []
+    total = int(rps * duration)
+    for i in range(total):
+        due_at = started_at + i / rps
+        await asyncio.sleep(max(0.0, due_at - time.perf_counter()))
+        tasks.append(asyncio.create_task(one(i, due_at)))
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - started_at
+
+
+def summarize(samples, elapsed):
+    ok = np.array([latency for latency, status, _error in samples if status is not None and status < 400])
+    statuses = Counter(str(status) if status is not None else error for _latency, status, error in samples)
+    errors = len(samples) - len(ok)
+    latency = {}
+    if len(ok):
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+        latency = {"p50": p50, "p95": p95, "p99": p99, "mean": float(ok.mean()), "max": float(ok.max())}
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "errorRate": errors / len(samples) if samples else 0.0,
+        "throughputRps": len(ok) / elapsed if elapsed else 0.0,
+        "latencyMs": {name: round(float(value), 2) for name, value in latency.items()},
+        "statusCodes": dict(statuses),
+    }
+
+
+def print_deltas(report, baseline):
+    print(f"\n--- Compared with {baseline.get('commit')} ---")
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        parts = []
+        for name in ("p50", "p95", "p99"):
+            before, after = previous["latencyMs"].get(name), current["latencyMs"].get(name)
+            if before and after:
+                parts.append(f"{name} {before:.0f} -> {after:.0f} ms ({(after - before) / before:+.1%})")
+        parts.append(f"throughput {previous['throughputRps']:.1f} -> {current['throughputRps']:.1f} rps")
+        parts.append(f"errors {previous['errorRate']:.1%} -> {current['errorRate']:.1%}")
+        print(f"{endpoint}: " + ", ".join(parts))
+
+
+async def run(args, base_url):
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    results = {}
+    async with aiohttp.ClientSession(base_url=base_url, connector=connector, timeout=aiohttp.ClientTimeout(total=120.0)) as session:
+        async with session.post("/api/generate-agent-ai", data=AGENT_FORM) as response:
+            response.raise_for_status()
+            agent_id = (await response.json())["deploymentId"]
+        for endpoint in endpoints:
+            print(f"Benchmarking {endpoint}: {args.rps} rps, concurrency {args.concurrency}, {args.duration}s")
+            make_request = request_factory(endpoint, agent_id, args.tts_distinct_texts)
+            samples, elapsed = await drive(session, make_request, args.rps, args.concurrency, args.duration)
+            results[endpoint] = summarize(samples, elapsed)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    gemini_faults = UpstreamFaults(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_error_rate)
+    tts_faults = UpstreamFaults(args.tts_latency_ms, args.tts_jitter_ms, args.tts_error_rate)
+    gemini = FakeGeminiServer(gemini_faults).start()
+
+    with tempfile.TemporaryDirectory(prefix="agent-benchmark-") as work_dir:
+        stop_backend, base_url = start_backend(work_dir, gemini.api_base, tts_faults, args.agent_store, args.server)
+        try:
+            endpoints = asyncio.run(run(args, base_url))
+        finally:
+            stop_backend()
+            gemini.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "endpoints": endpoints,
+        "upstream": {"gemini": gemini_faults.stats(), "tts": tts_faults.stats()},
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print_deltas(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Startup-time benchmark for agent_backend.py: how long a fresh worker process takes to import
+# the app and to answer its first request. Each sample is a new interpreter, as with a worker
+# fork or a freshly scheduled container, so nothing is reused between samples.
+#
+#   python -m benchmarks.startup_benchmark --runs 7
+#   python -m benchmarks.startup_benchmark --repo /tmp/older-checkout    # compare another tree
+#   python -m benchmarks.startup_benchmark --warm-up all                 # cost of WARM_UP=all
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs inside the child interpreter; prints one JSON line with the timings in seconds.
+CHILD_SCRIPT = """
+import json, sys, time
+started_at = time.perf_counter()
+import agent_backend
+imported_at = time.perf_counter()
+client = agent_backend.app.test_client()
+status = client.get("/metrics").status_code
+ready_at = time.perf_counter()
+print(json.dumps({"importSeconds": imported_at - started_at, "readySeconds": ready_at - started_at, "status": status}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure agent_backend.py import and first-request time in fresh processes.")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="checkout whose agent_backend.py to import (default: this one)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", default=None, help="WARM_UP value for the child processes (e.g. all, or tts,pdf)")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def measure_once(repo, work_dir, warm_up=None):
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": env.get("GEMINI_API_KEY", "benchmark"),
+        "AGENT_STORE_PATH": os.path.join(work_dir, "agents.db"),
+        "KNOWLEDGE_INDEX_DIR": os.path.join(work_dir, "agent_indexes"),
+        "TTS_CACHE_DIR": os.path.join(work_dir, "tts_cache"),
+        "EXTRACTION_CACHE_DIR": os.path.join(work_dir, "extraction_cache"),
+        "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.pop("WARM_UP", None)
+    if warm_up:
+        env["WARM_UP"] = warm_up
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], cwd=repo, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Child process failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    samples = []
+    with tempfile.TemporaryDirectory(prefix="agent-startup-") as work_dir:
+        measure_once(args.repo, work_dir, args.warm_up) # Discarded: fills the OS page cache
+        for _ in range(args.runs):
+            samples.append(measure_once(args.repo, work_dir, args.warm_up))
+
+    report = {
+        "repo": os.path.abspath(args.repo),
+        "warmUp": args.warm_up,
+        "runs": args.runs,
+        "importMs": round(statistics.median(s["importSeconds"] for s in samples) * 1000, 1),
+        "readyMs": round(statistics.median(s["readySeconds"] for s in samples) * 1000, 1),
+        "samples": samples,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Server-side chat sessions. History lives on the server and grows one turn at a time;
+# once it exceeds the agent's token budget, older turns are folded into a cached summary
+# so each Gemini request stays roughly constant in size however long the conversation runs.
+
+import os
+import threading
+import time
+import uuid
+
+from sqlite_db import SQLiteDatabase
+from tokens import estimate_tokens
+
+
+class SessionStore:
+    """
+    Interface implemented by every session storage backend.
+
+    Sessions are dicts with id, agent_id, summary, created_at and expires_at.
+    Turns are dicts with seq, role ('user' or 'model'), text and tokens.
+    """
+
+    def __init__(self, ttl_seconds=1800):
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, agent_id):
+        raise NotImplementedError
+
+    def get(self, session_id):
+        """
+        Returns the session, or None if it does not exist or has expired.
+        """
+        raise NotImplementedError
+
+    def active_turns(self, session_id):
+        """
+        Returns the turns not yet folded into the summary, oldest first.
+        """
+        raise NotImplementedError
+
+    def append_turns(self, session_id, turns):
+        """
+        Appends (role, text) pairs and pushes back the session's expiry. Returns False,
+        appending nothing, if the session has expired or been deleted since it was read.
+        """
+        raise NotImplementedError
+
+    def compact(self, session_id, summary, upto_seq):
+        """
+        Replaces the summary and drops turns with seq <= upto_seq from the active history.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Process-local sessions. Only suitable for a single worker.
+    """
+
+    def __init__(self, ttl_seconds=1800):
+        super().__init__(ttl_seconds)
+        self._sessions = {}
+        self._turns = {}
+        self._lock = threading.Lock()
+
+    def create(self, agent_id):
+        now = time.time()
+        session = {
+            "id": str(uuid.uuid4()),
+            "agent_id": agent_id,
+            "summary": "",
+            "created_at": now,
+            "expires_at": now + self.ttl_seconds,
+            "next_seq": 1,
+        }
+        with self._lock:
+            self._sessions[session['id']] = session
+            self._turns[session['id']] = []
+        return dict(session)
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session['expires_at'] < time.time():
+                self._sessions.pop(session_id, None)
+                self._turns.pop(session_id, None)
+                return None
+            return dict(session)
+
+    def active_turns(self, session_id):
+        with self._lock:
+            return list(self._turns.get(session_id, []))
+
+    def append_turns(self, session_id, turns):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session['expires_at'] < time.time():
+                return False
+            for role, text in turns:
+                self._turns[session_id].append({"seq": session['next_seq'], "role": role, "text": text, "tokens": estimate_tokens(text)})
+                session['next_seq'] += 1
+            session['expires_at'] = time.time() + self.ttl_seconds
+            return True
+
+    def compact(self, session_id, summary, upto_seq):
+        with self._lock:
+            if session_id not in self._sessions:
+                return
+            self._sessions[session_id]['summary'] = summary
+            self._turns[session_id] = [turn for turn in self._turns[session_id] if turn['seq'] > upto_seq]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._turns.pop(session_id, None)
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for session_id in [sid for sid, s in self._sessions.items() if s['expires_at'] < now]:
+                self._sessions.pop(session_id, None)
+                self._turns.pop(session_id, None)
+
+
+class SQLiteSessionStore(SQLiteDatabase, SessionStore):
+    """
+    Sessions and their turns in SQLite (WAL mode), so any worker can serve the next turn.
+    Turns are appended as rows; compaction flags them instead of rewriting the history.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS chat_sessions ("
+        " id TEXT PRIMARY KEY,"
+        " agent_id TEXT NOT NULL,"
+        " summary TEXT NOT NULL DEFAULT '',"
+        " created_at REAL NOT NULL,"
+        " expires_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_sessions_expires_at ON chat_sessions (expires_at)",
+        "CREATE TABLE IF NOT EXISTS chat_turns ("
+        " session_id TEXT NOT NULL,"
+        " seq INTEGER NOT NULL,"
+        " role TEXT NOT NULL,"
+        " text TEXT NOT NULL,"
+        " tokens INTEGER NOT NULL,"
+        " compacted INTEGER NOT NULL DEFAULT 0,"
+        " PRIMARY KEY (session_id, seq))",
+    )
+
+    def __init__(self, path, ttl_seconds=1800):
+        SessionStore.__init__(self, ttl_seconds)
+        SQLiteDatabase.__init__(self, path)
+
+    def create(self, agent_id):
+        now = time.time()
+        session = {
+            "id": str(uuid.uuid4()),
+            "agent_id": agent_id,
+            "summary": "",
+            "created_at": now,
+            "expires_at": now + self.ttl_seconds,
+        }
+        self._conn().execute(
+            "INSERT INTO chat_sessions (id, agent_id, summary, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (session['id'], agent_id, "", now, session['expires_at']),
+        )
+        return session
+
+    def get(self, session_id):
+        row = self._conn().execute(
+            "SELECT id, agent_id, summary, created_at, expires_at FROM chat_sessions WHERE id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        if row[4] < time.time():
+            self.delete(session_id)
+            return None
+        return {"id": row[0], "agent_id": row[1], "summary": row[2], "created_at": row[3], "expires_at": row[4]}
+
+    def active_turns(self, session_id):
+        rows = self._conn().execute(
+            "SELECT seq, role, text, tokens FROM chat_turns WHERE session_id = ? AND compacted = 0 ORDER BY seq",
+            (session_id,),
+        ).fetchall()
+        return [{"seq": seq, "role": role, "text": text, "tokens": tokens} for seq, role, text, tokens in rows]
+
+    def append_turns(self, session_id, turns):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            extended = conn.execute(
+                "UPDATE chat_sessions SET expires_at = ? WHERE id = ? AND expires_at >= ?",
+                (now + self.ttl_seconds, session_id, now),
+            ).rowcount
+            if not extended:
+                conn.execute("ROLLBACK")
+                return False
+            next_seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM chat_turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO chat_turns (session_id, seq, role, text, tokens) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, next_seq + i, role, text, estimate_tokens(text)) for i, (role, text) in enumerate(turns)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def compact(self, session_id, summary, upto_seq):
+        self._transaction([
+            ("UPDATE chat_sessions SET summary = ? WHERE id = ?", (summary, session_id)),
+            ("UPDATE chat_turns SET compacted = 1 WHERE session_id = ? AND seq <= ?", (session_id, upto_seq)),
+        ])
+
+    def delete(self, session_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+        return conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def purge_expired(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "DELETE FROM chat_turns WHERE session_id IN (SELECT id FROM chat_sessions WHERE expires_at < ?)", (now,)
+        )
+        conn.execute("DELETE FROM chat_sessions WHERE expires_at < ?", (now,))
+
+
+def create_session_store():
+    """
+    Builds the session store matching AGENT_STORE, sharing the agent database file for SQLite.
+    """
+    ttl_seconds = float(os.environ.get("SESSION_TTL_SECONDS", "1800"))
+    if os.environ.get("AGENT_STORE", "sqlite").lower() == "memory":
+        return MemorySessionStore(ttl_seconds=ttl_seconds)
+    return SQLiteSessionStore(os.environ.get("AGENT_STORE_PATH", "agents.db"), ttl_seconds=ttl_seconds)
+
+
+def select_turns_to_compact(turns, pending_tokens, token_budget):
+    """
+    Returns the prefix of `turns` that must be folded into the summary so the remaining
+    history plus `pending_tokens` fits the budget. When compaction is needed, history is
+    trimmed to half the budget so it does not have to run again on the very next turn.
+    The latest exchange is always kept verbatim, even when it alone exceeds the budget.
+    """
+    total = sum(turn['tokens'] for turn in turns) + pending_tokens
+    if total <= token_budget or len(turns) <= 2:
+        return []
+    target = token_budget // 2
+    keep_from = len(turns)
+    kept_tokens = pending_tokens
+    while keep_from > 0 and (len(turns) - keep_from < 2 or kept_tokens + turns[keep_from - 1]['tokens'] <= target):
+        keep_from -= 1
+        kept_tokens += turns[keep_from]['tokens']
+    return turns[:keep_from]
@@ -0,0 +1,127 @@
+# Incremental sync of evaluation scenarios into an Opik dataset.
+# Scenarios are streamed from JSONL files and deduplicated by content hash; a local state file
+# remembers which hashes were uploaded (and the dataset item id each got), so a run only inserts
+# new or changed rows. Without a state file (first run, another machine, CI) the hashes are read
+# back from the dataset itself. Rows that are not in the files are only deleted with prune=True.
+
+import json
+import os
+import tempfile
+
+from opik import id_helpers
+
+from eval_runner import scenario_id
+
+
+def iter_jsonl(paths):
+    """
+    Yields one record per non-empty line of each file, in order, without loading the files.
+    """
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+
+
+def unique_records(records):
+    """
+    Drops records whose content hash was already seen, keeping the first occurrence.
+    """
+    seen = set()
+    for record in records:
+        key = scenario_id(record)
+        if key not in seen:
+            seen.add(key)
+            yield record
+
+
+def load_scenarios(paths):
+    return list(unique_records(iter_jsonl(paths)))
+
+
+class DatasetSyncState:
+    """
+    JSON file of {dataset name: {"dataset_id": ..., "items": {content hash: dataset item id}}}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            self._state = {}
+
+    def items(self, dataset):
+        """
+        Synced {content hash: item id} for `dataset`, or None if it was never synced from
+        here or was recreated since.
+        """
+        entry = self._state.get(dataset.name)
+        if not entry or entry.get('dataset_id') != dataset.id:
+            return None
+        return dict(entry['items'])
+
+    def save(self, dataset, items):
+        self._state[dataset.name] = {"dataset_id": dataset.id, "items": items}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def read_dataset_items(dataset):
+    """
+    Hashes the rows already in `dataset` the same way as local records. Returns
+    ({content hash: item id}, ids of extra rows with a content hash seen before).
+    """
+    items = {}
+    duplicates = []
+    for item in dataset.get_items():
+        key = scenario_id({field: value for field, value in item.items() if field != 'id'})
+        if key in items:
+            duplicates.append(item['id'])
+        else:
+            items[key] = item['id']
+    return items, duplicates
+
+
+def sync_dataset(dataset, records, state_path, prune=False):
+    """
+    Uploads the `records` (deduplicated dicts) whose content hash is not in the last synced
+    state. The dataset is shared, so other rows are left alone unless `prune` is set, which
+    deletes rows that are not in `records` and duplicate rows.
+    Returns the dataset item ids of `records`, in order, for evaluate(dataset_item_ids=...).
+    """
+    state = DatasetSyncState(state_path)
+    synced = state.items(dataset)
+    duplicates = []
+    if synced is None:
+        # No local record of this dataset: match against its existing rows instead of re-inserting them
+        synced, duplicates = read_dataset_items(dataset)
+    current = {scenario_id(record): record for record in records}
+
+    added = {key: id_helpers.generate_id() for key in current if key not in synced}
+    stale = [item_id for key, item_id in synced.items() if key not in current] + duplicates
+    removed = stale if prune else []
+    if added:
+        dataset.insert([dict(current[key], id=item_id) for key, item_id in added.items()], deduplication=False)
+    if removed:
+        dataset.delete(removed)
+    elif stale:
+        print(f"Dataset {dataset.name}: {len(stale)} rows that are not in the scenario files or are duplicates were kept (prune to delete them)")
+
+    items = {key: synced.get(key) or added[key] for key in current}
+    if not prune:
+        # Kept rows stay in the state, so they are matched rather than re-inserted if they come back
+        items.update((key, item_id) for key, item_id in synced.items() if key not in current)
+    state.save(dataset, items)
+    print(f"Dataset {dataset.name}: {len(added)} added, {len(removed)} removed, {len(current) - len(added)} unchanged")
+    return [items[key] for key in current]
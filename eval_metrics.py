@@ -0,0 +1,65 @@
+# Opik metric wrappers used by test.py.
+# LocalScoreMetric reports a score computed up front by local_metrics; GatedMetric runs an
+# LLM-judge metric only for the items the task flagged as needing a judge; CachedMetric reuses
+# earlier judge results from a JudgeCache.
+
+import opik
+from opik.evaluation.metrics import base_metric, score_result
+
+from judge_cache import judge_cache_key
+
+
+class LocalScoreMetric(base_metric.BaseMetric):
+    """
+    Reports one of the precomputed local scores the evaluation task returns
+    under "local_scores" ({metric name: value}).
+    """
+
+    def __init__(self, name):
+        super().__init__(name=name, track=False)
+
+    def score(self, local_scores=None, **ignored_kwargs):
+        return score_result.ScoreResult(name=self.name, value=float((local_scores or {}).get(self.name, 0.0)))
+
+
+class GatedMetric(base_metric.BaseMetric):
+    """
+    Runs `metric` only when the task output has `judge` set; other items get no score
+    for it at all (and no judge call).
+    """
+
+    def __init__(self, metric):
+        super().__init__(name=metric.name, track=False)
+        self.metric = metric
+
+    def score(self, judge=True, **kwargs):
+        if not judge:
+            return []
+        return self.metric.score(**kwargs)
+
+
+class CachedMetric(base_metric.BaseMetric):
+    """
+    Looks the judged item up in `cache` before calling `metric`, and stores new results.
+    `version` should change whenever the metric's prompt or scale does; it defaults to the
+    Opik version, which ships the judge prompts. Failed scores are never cached.
+    """
+
+    def __init__(self, metric, cache, version=None):
+        super().__init__(name=metric.name, track=False)
+        self.metric = metric
+        self.cache = cache
+        self.version = version or f"{type(metric).__name__}:{opik.__version__}"
+        self.judge_model = getattr(getattr(metric, '_model', None), 'model_name', None)
+
+    def score(self, input=None, output=None, expected_output=None, context=None, **kwargs):
+        key = judge_cache_key(self.name, self.version, self.judge_model, input, output, expected_output, context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            value, reason = cached
+            return score_result.ScoreResult(name=self.name, value=value, reason=reason)
+
+        result = self.metric.score(input=input, output=output, expected_output=expected_output, context=context, **kwargs)
+        if isinstance(result, score_result.ScoreResult) and not result.scoring_failed:
+            self.cache.put(key, self.name, result.value, result.reason)
+        return result
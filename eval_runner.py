@@ -0,0 +1,244 @@
+# Asyncio runner that sends evaluation scenarios to the agent backend.
+# One pooled httpx.AsyncClient, a concurrency cap plus a token-bucket rate limit, retries with
+# jittered backoff, and results appended to a JSONL file as they finish. Re-running with the same
+# results file skips scenarios that already succeeded against the same agent and backend, so a
+# crash mid-suite loses no work.
+# Scenarios are either single questions (run_scenarios) or multi-turn conversations
+# (run_conversations), where turns are replayed in order against the conversation's own history.
+# (httpx ships with opik: pip install opik)
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+import httpx
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def scenario_id(scenario):
+    """
+    Stable id for a scenario, derived from its content, used to resume runs.
+    """
+    material = json.dumps(scenario, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+
+def load_results(results_path, agent_id, base_url):
+    """
+    Reads the results recorded for `agent_id` at `base_url` from a results JSONL file into
+    {scenario_id: result}; later lines win. Results for other agents or backends are ignored,
+    so they are never mistaken for this agent's replies.
+    """
+    results = {}
+    if not os.path.exists(results_path):
+        return results
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Partial last line from an interrupted run
+            if result.get('agent_id') == agent_id and result.get('base_url') == base_url:
+                results[result['id']] = result
+    return results
+
+
+async def post_with_retries(client, url, payload, max_retries, backoff_base=0.5, backoff_max=10.0):
+    """
+    POSTs JSON and returns (response_json, attempts). Retries 429/5xx and transport errors.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.post(url, json=payload)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                response.raise_for_status()
+                return response.json(), attempt + 1
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+        await asyncio.sleep(random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt))))
+
+
+async def send_chat_turn(client, agent_id, user_message, chat_history, max_retries):
+    """
+    Sends one message to /chat-with-agent and returns (reply, attempts).
+    """
+    body, attempts = await post_with_retries(client, "/chat-with-agent", {
+        "agentId": agent_id,
+        "userMessage": user_message,
+        "chatHistory": chat_history
+    }, max_retries)
+    return body.get('response'), attempts
+
+
+def conversation_id(conversation):
+    """
+    Label that groups a conversation's turns in reports: its "id", or a hash of its turns.
+    """
+    return conversation.get("id") or conversation_key(conversation)
+
+
+def conversation_key(conversation):
+    """
+    Resume key: a hash of the turns, so editing any turn replays the conversation even
+    when its "id" stays the same.
+    """
+    return scenario_id(conversation["turns"])
+
+
+class _ResultWriter:
+    """
+    Appends results to the JSONL file and records them in `results` ({id: result}).
+    """
+
+    def __init__(self, out, results):
+        self.out = out
+        self.results = results
+
+    def write(self, result):
+        self.out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.out.flush()
+        self.results[result['id']] = result
+
+
+async def _run_pending(pending, run_one, base_url, results_path, results, concurrency, rate_per_second, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate_per_second)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        with open(results_path, 'a', encoding='utf-8') as out:
+            writer = _ResultWriter(out, results)
+
+            async def run_guarded(item):
+                async with semaphore:
+                    writer.write(await run_one(client, bucket, item))
+
+            await asyncio.gather(*(run_guarded(item) for item in pending))
+
+
+async def run_scenarios(scenarios, agent_id, base_url, results_path, concurrency=16, rate_per_second=8.0,
+                        max_retries=3, timeout=120.0):
+    """
+    Sends every scenario's `input` to /chat-with-agent and returns {scenario_id: result}.
+    Results are appended to results_path as each one completes; scenarios already
+    recorded there with status "ok" for this agent and base_url are not sent again.
+    """
+    results = load_results(results_path, agent_id, base_url)
+    pending = [s for s in scenarios if results.get(scenario_id(s), {}).get('status') != 'ok']
+    print(f"{len(scenarios) - len(pending)} scenarios already done, running {len(pending)}")
+
+    async def run_one(client, bucket, scenario):
+        await bucket.acquire()
+        started_at = time.perf_counter()
+        result = {
+            "id": scenario_id(scenario),
+            "agent_id": agent_id,
+            "base_url": base_url,
+            "input": scenario["input"],
+            "expected_output": scenario.get("expected_output"),
+        }
+        try:
+            reply, attempts = await send_chat_turn(client, agent_id, scenario["input"], [], max_retries)
+            result.update(status="ok", output=reply, attempts=attempts)
+        except (httpx.HTTPError, ValueError) as e:
+            result.update(status="error", output=None, error=str(e))
+        result["latency_ms"] = (time.perf_counter() - started_at) * 1000
+        return result
+
+    await _run_pending(pending, run_one, base_url, results_path, results, concurrency, rate_per_second, timeout)
+
+    failed = sum(1 for s in scenarios if results.get(scenario_id(s), {}).get('status') != 'ok')
+    print(f"Finished {len(scenarios)} scenarios ({failed} failed) -> {results_path}")
+    return results
+
+
+async def run_conversations(conversations, agent_id, base_url, results_path, concurrency=16, rate_per_second=8.0,
+                            max_retries=3, timeout=120.0):
+    """
+    Replays multi-turn conversations and returns {conversation_key: result}.
+
+    Each conversation is {"id": optional, "turns": [{"input", "expected_output"}, ...]}. Turns run
+    one after another, each sent with the history of the turns before it (and the agent's actual
+    replies to them); independent conversations run in parallel, up to `concurrency` at a time.
+    If a turn fails the rest of that conversation is skipped, since its history would be wrong.
+    Conversations already recorded in results_path with status "ok" for this agent and
+    base_url are not replayed.
+    """
+    results = load_results(results_path, agent_id, base_url)
+    pending = [c for c in conversations if results.get(conversation_key(c), {}).get('status') != 'ok']
+    print(f"{len(conversations) - len(pending)} conversations already done, running {len(pending)}")
+
+    async def run_one(client, bucket, conversation):
+        started_at = time.perf_counter()
+        chat_history = []
+        turns = []
+        status = "ok"
+        for index, turn in enumerate(conversation["turns"]):
+            turn_result = {
+                "turn": index,
+                "input": turn["input"],
+                "expected_output": turn.get("expected_output"),
+                "output": None,
+            }
+            turns.append(turn_result)
+            if status != "ok":
+                turn_result["status"] = "skipped"
+                continue
+            await bucket.acquire()
+            turn_started_at = time.perf_counter()
+            try:
+                reply, attempts = await send_chat_turn(client, agent_id, turn["input"], list(chat_history), max_retries)
+                turn_result.update(status="ok", output=reply, attempts=attempts)
+                chat_history.append({"sender": "user", "message": turn["input"]})
+                chat_history.append({"sender": "agent", "message": reply or ""})
+            except (httpx.HTTPError, ValueError) as e:
+                turn_result.update(status="error", error=str(e))
+                status = "error"
+            turn_result["latency_ms"] = (time.perf_counter() - turn_started_at) * 1000
+        return {
+            "id": conversation_key(conversation),
+            "conversation_id": conversation_id(conversation),
+            "agent_id": agent_id,
+            "base_url": base_url,
+            "status": status,
+            "turns": turns,
+            "latency_ms": (time.perf_counter() - started_at) * 1000,
+        }
+
+    await _run_pending(pending, run_one, base_url, results_path, results, concurrency, rate_per_second, timeout)
+
+    failed = sum(1 for c in conversations if results.get(conversation_key(c), {}).get('status') != 'ok')
+    print(f"Finished {len(conversations)} conversations ({failed} failed) -> {results_path}")
+    return results
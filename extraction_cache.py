@@ -0,0 +1,153 @@
+# Deduplicating cache for knowledge base documents.
+# Extracted text (and the knowledge index built from it) is stored under a key derived from the
+# SHA-256 of the uploaded bytes plus the parser version, so re-uploading the same PDF/DOCX for
+# another agent skips parsing and indexing entirely.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_stream_to_file(stream, output_path):
+    """
+    Copies `stream` to output_path and returns the SHA-256 hex digest of its contents.
+    """
+    digest = hashlib.sha256()
+    with open(output_path, 'wb') as out:
+        while True:
+            block = stream.read(HASH_CHUNK_BYTES)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Each entry is a directory <directory>/<key>/ holding `text.txt` and optionally the
+    saved knowledge index (`index.npz`/`index.json`). Hits refresh the directory mtime;
+    when the total size passes `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.index_hits = 0
+        self.index_misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_sha256, parser_version):
+        return hashlib.sha256(f"{content_sha256}:{parser_version}".encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def text_path(self, key):
+        return os.path.join(self._entry_dir(key), 'text.txt')
+
+    def index_path(self, key):
+        """
+        Path prefix for the cached knowledge index (KnowledgeIndex.save/load format).
+        """
+        return os.path.join(self._entry_dir(key), 'index')
+
+    def _touch(self, key):
+        try:
+            os.utime(self._entry_dir(key))
+        except FileNotFoundError:
+            pass
+
+    def get_text(self, key):
+        """
+        Returns the cached extracted text, or None.
+        """
+        try:
+            with open(self.text_path(key), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(key)
+        return text
+
+    def put_text(self, key, source_path):
+        """
+        Stores the extracted text file at source_path (copied, the original is left in place).
+        """
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.tmp-')
+        os.close(fd)
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, self.text_path(key))
+        self._evict_if_needed()
+
+    def has_index(self, key):
+        present = os.path.exists(f"{self.index_path(key)}.json") and os.path.exists(f"{self.index_path(key)}.npz")
+        if present:
+            self.index_hits += 1
+            self._touch(key)
+        else:
+            self.index_misses += 1
+        return present
+
+    def copy_index(self, key, destination_prefix):
+        """
+        Copies the cached index files to destination_prefix (.npz/.json), so evicting the
+        cache entry never breaks an agent that uses it.
+        """
+        os.makedirs(os.path.dirname(destination_prefix) or ".", exist_ok=True)
+        for suffix in ('.npz', '.json'):
+            shutil.copyfile(f"{self.index_path(key)}{suffix}", f"{destination_prefix}{suffix}")
+
+    def store_index(self, key, source_prefix):
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return
+        for suffix in ('.npz', '.json'):
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.tmp-')
+            os.close(fd)
+            shutil.copyfile(f"{source_prefix}{suffix}", tmp_path)
+            os.replace(tmp_path, f"{self.index_path(key)}{suffix}")
+        self._evict_if_needed()
+
+    def _entries(self):
+        for key in os.listdir(self.directory):
+            entry_dir = os.path.join(self.directory, key)
+            try:
+                mtime = os.stat(entry_dir).st_mtime
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+            except FileNotFoundError:
+                continue
+            yield entry_dir, size, mtime
+
+    def _evict_if_needed(self):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _entry_dir, size, _mtime in entries)
+            for entry_dir, size, _mtime in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "indexHits": self.index_hits,
+            "indexMisses": self.index_misses,
+            "maxBytes": self.max_bytes,
+        }
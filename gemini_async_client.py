@@ -0,0 +1,129 @@
+# asyncio Gemini client for the ASGI app (requires aiohttp: pip install aiohttp).
+# Same retries, backoff, concurrency limits, circuit breaker and observer events as
+# gemini_client.GeminiClient, but a call waiting on Gemini holds no thread. aiohttp rather
+# than httpx: httpcore's pool rescans every connection on each request, which becomes the
+# bottleneck with hundreds of calls in flight. Kept out of gemini_client.py so the Flask
+# app does not import aiohttp.
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from gemini_client import GeminiAPIError, GeminiUnavailableError, _BaseGeminiClient, candidate_text
+
+
+class _BufferedResponse:
+    """
+    A fully read aiohttp response, with the attributes the shared retry/decode code uses.
+    """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncGeminiClient(_BaseGeminiClient):
+    """
+    Use it from a single event loop; the aiohttp session is created on first use.
+    """
+
+    def __init__(self, api_key, max_concurrency=64, pool_size=64, **settings):
+        super().__init__(api_key, **settings)
+        self.pool_size = max(pool_size, max_concurrency)
+        self._session = None
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        self._model_slots = {}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+                headers={'Content-Type': 'application/json'},
+            )
+        return self._session
+
+    async def _acquire(self, semaphore, message):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise GeminiUnavailableError(message)
+
+    @asynccontextmanager
+    async def _call_slot(self, model):
+        """
+        Holds a global and a per-model concurrency slot, then checks the circuit breaker.
+        """
+        model_slots = self._model_slots.get(model)
+        if model_slots is None:
+            model_slots = self._model_slots[model] = asyncio.Semaphore(self.per_model_concurrency)
+        await self._acquire(self._global_slots, "Too many concurrent Gemini requests.")
+        try:
+            await self._acquire(model_slots, f"Too many concurrent Gemini requests for {model}.")
+            try:
+                trial = self._check_available()
+                try:
+                    yield
+                finally:
+                    if trial:
+                        self.breaker.end_trial()
+            finally:
+                model_slots.release()
+        finally:
+            self._global_slots.release()
+
+    async def request(self, model, method, payload):
+        """
+        POSTs `payload` to models/<model>:<method> and returns the buffered response.
+        Retries 429/5xx and connection errors; raises a GeminiError once retries run out.
+        """
+        async with self._call_slot(model):
+            url = f"{self.api_base}/models/{model}:{method}"
+            body = json.dumps(payload)
+            session = self._get_session()
+            for attempt in range(self.max_retries + 1):
+                response = None
+                started_at = time.perf_counter()
+                try:
+                    async with session.post(url, data=body, headers={'x-goog-api-key': self.api_key}) as raw_response:
+                        response = _BufferedResponse(raw_response.status, raw_response.headers, await raw_response.read())
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._observe("attempt", model, method, status=type(e).__name__, seconds=time.perf_counter() - started_at)
+                    error = GeminiAPIError(f"Error calling Gemini API: {e!r}")
+                else:
+                    error = self._handle_response(model, method, response, started_at)
+                    if error is None:
+                        return response
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff_delay(attempt, response))
+            self.breaker.record_failure()
+            raise error
+
+    async def generate_content(self, model, payload):
+        """
+        Calls generateContent and returns the decoded JSON response.
+        """
+        return self._decode(model, await self.request(model, "generateContent", payload))
+
+    async def generate_text(self, model, contents, **payload_fields):
+        """
+        Calls generateContent with `contents` and returns the first candidate's text.
+        """
+        return candidate_text(await self.generate_content(model, {"contents": contents, **payload_fields}))
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
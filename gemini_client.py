@@ -0,0 +1,343 @@
+# Shared Gemini REST client used by every backend endpoint.
+# One pooled requests.Session (keep-alive, no per-turn TLS handshake), connect/read timeouts,
+# jittered exponential backoff on 429/5xx, global and per-model concurrency limits and a
+# circuit breaker. gemini_async_client.AsyncGeminiClient does the same for the ASGI app.
+# Point GEMINI_API_BASE at a local fake server to test without real quota.
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """
+    Base class for Gemini call failures. `status_code` is the HTTP status the
+    backend should answer with.
+    """
+    status_code = 500
+
+
+class GeminiAPIError(GeminiError):
+    def __init__(self, message, upstream_status=None):
+        super().__init__(message)
+        self.upstream_status = upstream_status
+
+
+class GeminiResponseError(GeminiError):
+    """
+    Gemini answered, but without any candidate text.
+    """
+
+
+class GeminiUnavailableError(GeminiError):
+    """
+    The call was not attempted: the circuit is open or no concurrency slot freed up in time.
+    """
+    status_code = 503
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+    TRIAL = "trial"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """
+        True if the call may go ahead, False if it is rejected, or TRIAL for the single
+        half-open trial call, whose caller must call end_trial() however the call ends.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return self.TRIAL
+
+    def end_trial(self):
+        """
+        A trial that recorded neither success nor failure (an unexpected error or a
+        cancellation) counts as failed, so the breaker re-opens instead of staying half-open.
+        """
+        with self._lock:
+            if self._trial_in_flight:
+                self._trial_in_flight = False
+                self._failures += 1
+                self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+def candidate_text(json_response):
+    """
+    Returns the first candidate's text from a generateContent response.
+    """
+    try:
+        return json_response["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        raise GeminiResponseError(f"Unexpected Gemini API response structure: {json.dumps(json_response)[:1000]}")
+
+
+class _BaseGeminiClient:
+    """
+    Settings, retry policy and instrumentation shared by the sync and async clients.
+    """
+
+    def __init__(self, api_key, api_base=DEFAULT_API_BASE, connect_timeout=5.0, read_timeout=60.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, acquire_timeout=30.0,
+                 per_model_concurrency=32, breaker_threshold=5, breaker_reset_timeout=30.0,
+                 breaker=None, observer=None):
+        self.api_key = api_key
+        # Optional observer(event, model, method, **fields) for instrumentation. Events:
+        # "attempt" (status, seconds) per HTTP attempt, "decode" (seconds), "usage" (usage).
+        self.observer = observer
+        self.api_base = api_base.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.acquire_timeout = acquire_timeout
+        self.per_model_concurrency = per_model_concurrency
+        # Pass another client's breaker to have both trip together
+        self.breaker = breaker or CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+
+    def _observe(self, event, model, method, **fields):
+        if self.observer is not None:
+            try:
+                self.observer(event, model, method, **fields)
+            except Exception as e:
+                print(f"Gemini client observer failed: {e}")
+
+    def _backoff_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_available(self):
+        """
+        Raises unless the call may go ahead. Returns True for the breaker's half-open trial call.
+        """
+        if not self.api_key:
+            raise GeminiError("Gemini API Key not configured on the backend.")
+        allowed = self.breaker.allow()
+        if not allowed:
+            raise GeminiUnavailableError("Gemini API circuit is open after repeated failures; try again shortly.")
+        return allowed == CircuitBreaker.TRIAL
+
+    def _handle_response(self, model, method, response, started_at):
+        """
+        Records one HTTP attempt. Returns None on success, otherwise the GeminiAPIError
+        to retry with; raises it right away when the status is not retryable.
+        """
+        self._observe("attempt", model, method, status=response.status_code, seconds=time.perf_counter() - started_at)
+        if response.status_code < 400:
+            self.breaker.record_success()
+            return None
+        error = GeminiAPIError(
+            f"Gemini API returned HTTP {response.status_code}: {response.text[:500]}",
+            upstream_status=response.status_code,
+        )
+        if response.status_code not in RETRYABLE_STATUS_CODES:
+            # The request itself is bad; the upstream is healthy.
+            self.breaker.record_success()
+            raise error
+        return error
+
+    def _decode(self, model, response):
+        started_at = time.perf_counter()
+        try:
+            json_response = response.json()
+        except ValueError as e:
+            raise GeminiResponseError(f"Error decoding Gemini API response: {e}")
+        self._observe("decode", model, "generateContent", seconds=time.perf_counter() - started_at)
+        self._observe("usage", model, "generateContent", usage=json_response.get('usageMetadata'))
+        return json_response
+
+
+class GeminiClient(_BaseGeminiClient):
+    def __init__(self, api_key, max_concurrency=64, pool_size=64, **settings):
+        super().__init__(api_key, **settings)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self._global_slots = threading.BoundedSemaphore(max_concurrency)
+        self._model_slots = {}
+        self._model_slots_lock = threading.Lock()
+
+    def _model_semaphore(self, model):
+        with self._model_slots_lock:
+            semaphore = self._model_slots.get(model)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_model_concurrency)
+                self._model_slots[model] = semaphore
+            return semaphore
+
+    @contextmanager
+    def _call_slot(self, model):
+        """
+        Holds a global and a per-model concurrency slot, then checks the circuit breaker.
+        """
+        model_slots = self._model_semaphore(model)
+        if not self._global_slots.acquire(timeout=self.acquire_timeout):
+            raise GeminiUnavailableError("Too many concurrent Gemini requests.")
+        try:
+            if not model_slots.acquire(timeout=self.acquire_timeout):
+                raise GeminiUnavailableError(f"Too many concurrent Gemini requests for {model}.")
+            try:
+                trial = self._check_available()
+                try:
+                    yield
+                finally:
+                    if trial:
+                        self.breaker.end_trial()
+            finally:
+                model_slots.release()
+        finally:
+            self._global_slots.release()
+
+    def request(self, model, method, payload):
+        """
+        POSTs `payload` to models/<model>:<method> and returns the requests.Response.
+        Retries 429/5xx and connection errors; raises a GeminiError once retries run out.
+        """
+        with self._call_slot(model):
+            return self._request_with_retries(model, method, payload, stream=False)
+
+    def _request_with_retries(self, model, method, payload, stream):
+        url = f"{self.api_base}/models/{model}:{method}"
+        params = {'alt': 'sse'} if stream else None
+        body = json.dumps(payload)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            started_at = time.perf_counter()
+            try:
+                response = self.session.post(
+                    url, params=params, data=body, headers={'x-goog-api-key': self.api_key},
+                    timeout=self.timeout, stream=stream,
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._observe("attempt", model, method, status=type(e).__name__, seconds=time.perf_counter() - started_at)
+                error = GeminiAPIError(f"Error calling Gemini API: {e}")
+            else:
+                error = self._handle_response(model, method, response, started_at)
+                if error is None:
+                    return response
+                response.close()
+
+            if attempt < self.max_retries:
+                time.sleep(self._backoff_delay(attempt, response))
+        self.breaker.record_failure()
+        raise error
+
+    def generate_content(self, model, payload):
+        """
+        Calls generateContent and returns the decoded JSON response.
+        """
+        return self._decode(model, self.request(model, "generateContent", payload))
+
+    def generate_text(self, model, contents, **payload_fields):
+        """
+        Calls generateContent with `contents` and returns the first candidate's text.
+        """
+        return candidate_text(self.generate_content(model, {"contents": contents, **payload_fields}))
+
+    def stream_generate_content(self, model, payload):
+        """
+        Calls streamGenerateContent (server-sent events) and yields each decoded
+        response chunk as it arrives. The concurrency slot is held until the stream ends.
+        """
+        with self._call_slot(model):
+            response = self._request_with_retries(model, "streamGenerateContent", payload, stream=True)
+            with response:
+                usage = None
+                try:
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line and line.startswith("data:"):
+                            json_chunk = json.loads(line[len("data:"):])
+                            usage = json_chunk.get('usageMetadata', usage)
+                            yield json_chunk
+                    self._observe("usage", model, "streamGenerateContent", usage=usage)
+                except requests.exceptions.RequestException as e:
+                    raise GeminiAPIError(f"Gemini stream interrupted: {e}")
+                except ValueError as e:
+                    raise GeminiResponseError(f"Error decoding Gemini stream chunk: {e}")
+
+    def close(self):
+        self.session.close()
+
+
+def chunk_text(json_chunk):
+    """
+    Returns the text carried by one generateContent / streamGenerateContent response chunk.
+    """
+    try:
+        parts = json_chunk["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+    return "".join(part.get("text", "") for part in parts)
+
+
+def create_gemini_client(api_key, client_class=GeminiClient, **overrides):
+    """
+    Builds the shared client (or, with client_class=AsyncGeminiClient, the ASGI app's
+    async one) from GEMINI_* environment settings; keyword overrides win.
+    """
+    settings = dict(
+        api_base=os.environ.get("GEMINI_API_BASE", DEFAULT_API_BASE),
+        connect_timeout=float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.environ.get("GEMINI_READ_TIMEOUT", "60")),
+        max_retries=int(os.environ.get("GEMINI_MAX_RETRIES", "3")),
+        max_concurrency=int(os.environ.get("GEMINI_MAX_CONCURRENCY", "64")),
+        per_model_concurrency=int(os.environ.get("GEMINI_PER_MODEL_CONCURRENCY", "32")),
+        breaker_threshold=int(os.environ.get("GEMINI_BREAKER_THRESHOLD", "5")),
+        breaker_reset_timeout=float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30")),
+    )
+    settings.update(overrides)
+    return client_class(api_key, **settings)
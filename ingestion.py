@@ -0,0 +1,370 @@
+# Background ingestion of uploaded knowledge base documents.
+# Uploads are saved to disk and processed as jobs: PDF pages are extracted in parallel on a
+# process pool and streamed to a text file in page order, with progress recorded per job so
+# any worker can answer status requests.
+
+import importlib
+import importlib.metadata
+import os
+import socket
+import threading
+import time
+import uuid
+
+from lazy import LazyValue
+from sqlite_db import SQLiteDatabase
+
+PDF_PAGES_PER_TASK = 8
+
+
+# Document parsers (you'll need to install these: pip install python-docx PyPDF2) are imported on
+# first use, so processes that never extract a document don't pay for them.
+def _import_parser(module_name, package_name, feature):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        print(f"WARNING: {package_name} not installed. {feature} will not work.")
+        return None
+
+pypdf2 = LazyValue(lambda: _import_parser("PyPDF2", "PyPDF2", "PDF document parsing"), name="PyPDF2")
+python_docx = LazyValue(lambda: _import_parser("docx", "python-docx", "Word document parsing"), name="python-docx")
+
+
+def _installed_version(package_name):
+    try:
+        return importlib.metadata.version(package_name)
+    except importlib.metadata.PackageNotFoundError:
+        return 'none'
+
+
+def parser_version():
+    """
+    Part of the extraction cache key: bump the leading number whenever extraction output changes.
+    Versions come from package metadata, so computing the key does not import the parsers.
+    """
+    return f"1:pypdf2-{_installed_version('PyPDF2')}:python-docx-{_installed_version('python-docx')}"
+
+
+# --- Extraction (these run inside pool processes, so they must stay module-level) ---
+def count_pdf_pages(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return len(pypdf2.get().PdfReader(file).pages)
+
+def extract_pdf_pages(pdf_path, start, end):
+    """
+    Returns the text of pages [start, end) as one string, one page per line block.
+    """
+    with open(pdf_path, 'rb') as file:
+        reader = pypdf2.get().PdfReader(file)
+        return "\n".join(reader.pages[page_num].extract_text() or '' for page_num in range(start, end))
+
+def extract_word_to_file(docx_path, output_path):
+    """
+    Streams the document's paragraphs to output_path and returns the paragraph count.
+    """
+    document = python_docx.get().Document(docx_path)
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for paragraph in document.paragraphs:
+            out.write(paragraph.text)
+            out.write("\n")
+            count += 1
+    return count
+
+
+def extract_pdf_to_file(pdf_path, output_path, pool, progress=None, window=None):
+    """
+    Extracts the PDF in page batches on `pool` and appends each batch to output_path in
+    page order as soon as it (and every batch before it) is done. At most `window` batches
+    are in flight, so memory stays bounded however large the document is.
+    `progress(pages_done, pages_total)` is called after every batch.
+    """
+    total_pages = pool.submit(count_pdf_pages, pdf_path).result()
+    if progress:
+        progress(0, total_pages)
+    window = window or 2 * (getattr(pool, '_max_workers', None) or os.cpu_count() or 1)
+    batches = [(start, min(start + PDF_PAGES_PER_TASK, total_pages)) for start in range(0, total_pages, PDF_PAGES_PER_TASK)]
+    in_flight = []
+    next_batch = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < window:
+                start, end = batches[next_batch]
+                in_flight.append((end, pool.submit(extract_pdf_pages, pdf_path, start, end)))
+                next_batch += 1
+            end, future = in_flight.pop(0)
+            out.write(future.result())
+            out.write("\n")
+            if progress:
+                progress(end, total_pages)
+    return total_pages
+
+
+def extract_document_to_file(document_path, filename, output_path, pool, progress=None):
+    """
+    Dispatches on the file extension. Raises ValueError for unsupported types or missing parsers.
+    """
+    lowered = filename.lower()
+    if lowered.endswith('.pdf'):
+        if not pypdf2.get():
+            raise ValueError("PyPDF2 not installed - cannot extract PDF text")
+        return extract_pdf_to_file(document_path, output_path, pool, progress)
+    if lowered.endswith(('.doc', '.docx')):
+        if not python_docx.get():
+            raise ValueError("python-docx not installed - cannot extract Word text")
+        if progress:
+            progress(0, 1)
+        pool.submit(extract_word_to_file, document_path, output_path).result()
+        if progress:
+            progress(1, 1)
+        return 1
+    raise ValueError(f"Unsupported file type for extraction: {filename}")
+
+
+# --- Job records ---
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+
+def job_owner():
+    """
+    Identifies the process that runs a job (jobs live in that process's thread pool).
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_is_gone(owner):
+    """
+    True when `owner` names a process on this host that no longer exists. Jobs owned by
+    another host are left alone: their process cannot be checked from here.
+    """
+    if not owner:
+        return True
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        return False
+    return False
+
+
+class IngestionJobStore:
+    """
+    Interface for job records: dicts with id, agent_id, filename, status
+    ('queued', 'running', 'completed', 'failed'), pages_done, pages_total, error,
+    owner, created_at and updated_at.
+    """
+
+    def create(self, agent_id, filename):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def heartbeat(self, job_ids):
+        """
+        Refreshes updated_at on those of `job_ids` that are still queued or running.
+        """
+        raise NotImplementedError
+
+    def fail_orphaned(self, error, stale_after=None):
+        """
+        Marks queued/running jobs as failed and returns them when their owning process has
+        exited (their worker restarted mid-job) or, whoever owns them, when their updated_at
+        heartbeat is older than `stale_after` seconds.
+        """
+        return []
+
+
+def new_job(agent_id, filename):
+    now = time.time()
+    return {
+        "id": str(uuid.uuid4()),
+        "agent_id": agent_id,
+        "filename": filename,
+        "status": "queued",
+        "pages_done": 0,
+        "pages_total": None,
+        "error": None,
+        "owner": job_owner(),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class MemoryIngestionJobStore(IngestionJobStore):
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, agent_id, filename):
+        job = new_job(agent_id, filename)
+        with self._lock:
+            self._jobs[job['id']] = job
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def heartbeat(self, job_ids):
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job and job['status'] in ACTIVE_JOB_STATUSES:
+                    job['updated_at'] = now
+
+    def fail_orphaned(self, error, stale_after=None):
+        if stale_after is None:
+            return []
+        now = time.time()
+        failed = []
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] in ACTIVE_JOB_STATUSES and job['updated_at'] < now - stale_after:
+                    failed.append(dict(job))
+                    job.update(status='failed', error=error, updated_at=now)
+        return failed
+
+
+class SQLiteIngestionJobStore(SQLiteDatabase, IngestionJobStore):
+    columns = ("id", "agent_id", "filename", "status", "pages_done", "pages_total", "error", "owner", "created_at", "updated_at")
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+        " id TEXT PRIMARY KEY,"
+        " agent_id TEXT NOT NULL,"
+        " filename TEXT NOT NULL,"
+        " status TEXT NOT NULL,"
+        " pages_done INTEGER NOT NULL DEFAULT 0,"
+        " pages_total INTEGER,"
+        " error TEXT,"
+        " owner TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        # Tables created before jobs recorded an owner; BEGIN IMMEDIATE so concurrently
+        # starting workers do not both add the column.
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(ingestion_jobs)")}:
+                conn.execute("ALTER TABLE ingestion_jobs ADD COLUMN owner TEXT")
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def create(self, agent_id, filename):
+        job = new_job(agent_id, filename)
+        self._conn().execute(
+            f"INSERT INTO ingestion_jobs ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+            tuple(job[column] for column in self.columns),
+        )
+        return job
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(self.columns)} FROM ingestion_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return dict(zip(self.columns, row)) if row else None
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields if column in self.columns)
+        self._conn().execute(
+            f"UPDATE ingestion_jobs SET {assignments} WHERE id = ?",
+            tuple(value for column, value in fields.items() if column in self.columns) + (job_id,),
+        )
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        self._conn().execute(
+            f"UPDATE ingestion_jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(job_ids))})"
+            f" AND status IN ({', '.join('?' * len(ACTIVE_JOB_STATUSES))})",
+            (time.time(), *job_ids, *ACTIVE_JOB_STATUSES),
+        )
+
+    def fail_orphaned(self, error, stale_after=None):
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM ingestion_jobs WHERE status IN ({', '.join('?' * len(ACTIVE_JOB_STATUSES))})",
+            ACTIVE_JOB_STATUSES,
+        ).fetchall()
+        now = time.time()
+        failed = []
+        for job in (dict(zip(self.columns, row)) for row in rows):
+            stale = stale_after is not None and job['updated_at'] < now - stale_after
+            if not stale and not owner_is_gone(job['owner']):
+                continue
+            # Only if untouched since it was read: a job that finished or beat meanwhile is alive
+            updated = conn.execute(
+                f"UPDATE ingestion_jobs SET status = 'failed', error = ?, updated_at = ?"
+                f" WHERE id = ? AND updated_at = ? AND status IN ({', '.join('?' * len(ACTIVE_JOB_STATUSES))})",
+                (error, now, job['id'], job['updated_at'], *ACTIVE_JOB_STATUSES),
+            ).rowcount
+            if updated:
+                failed.append(job)
+        return failed
+
+
+class JobHeartbeat:
+    """
+    Refreshes updated_at every `interval` seconds on the jobs this process holds, from one
+    background thread, so any worker can tell a live job from one whose process is gone
+    even when host:pid owners are reused (containers restarting as pid 1).
+    """
+
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self._job_ids = set()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, job_id):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive fork(), and a child does not hold its parent's jobs
+                self._job_ids = set()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="ingest-heartbeat", daemon=True).start()
+            self._job_ids.add(job_id)
+
+    def discard(self, job_id):
+        with self._lock:
+            self._job_ids.discard(job_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                job_ids = list(self._job_ids)
+            try:
+                self.store.heartbeat(job_ids)
+            except Exception as e:
+                print(f"Error recording ingestion job heartbeats: {e}")
+
+
+def create_ingestion_job_store():
+    """
+    Builds the job store matching AGENT_STORE, sharing the agent database file for SQLite.
+    """
+    if os.environ.get("AGENT_STORE", "sqlite").lower() == "memory":
+        return MemoryIngestionJobStore()
+    return SQLiteIngestionJobStore(os.environ.get("AGENT_STORE_PATH", "agents.db"))
@@ -0,0 +1,59 @@
+# Disk-backed cache of LLM-judge metric results for evaluation re-runs.
+# Keyed by everything the judge sees (input, output, expected output, context) plus the metric
+# name, metric version and judge model, so an unchanged agent output is never judged twice.
+
+import hashlib
+import json
+import time
+
+from sqlite_db import SQLiteDatabase
+
+
+def judge_cache_key(metric_name, metric_version, judge_model, input, output, expected_output, context=None):
+    material = json.dumps(
+        [metric_name, metric_version, judge_model, input, output, expected_output, context],
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class JudgeCache(SQLiteDatabase):
+    """
+    get(key) -> (value, reason) or None, put(key, metric_name, value, reason).
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS judge_results ("
+        " key TEXT PRIMARY KEY,"
+        " metric_name TEXT NOT NULL,"
+        " value REAL NOT NULL,"
+        " reason TEXT,"
+        " created_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, reason FROM judge_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key, metric_name, value, reason):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO judge_results (key, metric_name, value, reason, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, metric_name, value, reason, time.time()),
+        )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
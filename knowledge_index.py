@@ -0,0 +1,165 @@
+# Chunked BM25 retrieval index over an agent's knowledge base (requires numpy).
+# Built once when the agent is created and stored next to the agent profile, so chat turns
+# only send the few chunks relevant to the user's message instead of the whole document.
+
+import json
+import os
+import re
+
+import numpy as np
+
+from tokens import estimate_tokens
+
+INDEX_FORMAT_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text, chunk_words=200, overlap_words=40):
+    """
+    Splits text into overlapping windows of roughly `chunk_words` words.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    Okapi BM25 over fixed-size text chunks. Postings are kept term-major
+    (CSC-style `indptr`/`doc_ids`/`tfs` arrays) so scoring a query only
+    touches the chunks that contain one of its terms.
+    """
+
+    def __init__(self, chunks, vocab, indptr, doc_ids, tfs, doc_lens, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        n_docs = len(self.chunks)
+        doc_freq = np.diff(indptr).astype(np.float64)
+        self.idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        self.chunk_tokens = np.array([estimate_tokens(c) for c in self.chunks], dtype=np.int64)
+
+    @classmethod
+    def build(cls, text, chunk_words=200, overlap_words=40):
+        chunks = chunk_text(text, chunk_words, overlap_words)
+        vocab = {}
+        term_ids = []
+        chunk_ids = []
+        doc_lens = np.zeros(len(chunks), dtype=np.float64)
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_lens[chunk_id] = len(tokens)
+            for token in tokens:
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                chunk_ids.append(chunk_id)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        # Collapse (term, chunk) occurrences into term frequencies, sorted term-major.
+        keys = term_ids * max(1, len(chunks)) + chunk_ids
+        unique_keys, tfs = np.unique(keys, return_counts=True)
+        posting_terms = unique_keys // max(1, len(chunks))
+        doc_ids = (unique_keys % max(1, len(chunks))).astype(np.int64)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(vocab)), out=indptr[1:])
+        return cls(chunks, vocab, indptr, doc_ids, tfs.astype(np.float64), doc_lens)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def score(self, query):
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        if not self.chunks:
+            return scores
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[docs] / max(self.avg_doc_len, 1e-9))
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=4, token_budget=None):
+        """
+        Returns up to `top_k` (chunk_text, score) pairs, best first, whose
+        combined estimated size stays within `token_budget` tokens.
+        """
+        scores = self.score(query)
+        candidates = np.flatnonzero(scores > 0)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return self._take(order, scores, top_k, token_budget)
+
+    def head(self, top_k=4, token_budget=None):
+        """
+        Returns the leading chunks of the document, for prompts with no useful query.
+        """
+        return self._take(np.arange(len(self.chunks)), np.zeros(len(self.chunks)), top_k, token_budget)
+
+    def _take(self, order, scores, top_k, token_budget):
+        results = []
+        used_tokens = 0
+        for chunk_id in order:
+            if len(results) >= top_k:
+                break
+            chunk_tokens = int(self.chunk_tokens[chunk_id])
+            if token_budget is not None and used_tokens + chunk_tokens > token_budget:
+                continue
+            results.append((self.chunks[chunk_id], float(scores[chunk_id])))
+            used_tokens += chunk_tokens
+        return results
+
+    def save(self, path):
+        """
+        Writes the index as `<path>.npz` (arrays) plus `<path>.json` (chunks and vocabulary).
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            f"{path}.npz",
+            indptr=self.indptr, doc_ids=self.doc_ids, tfs=self.tfs, doc_lens=self.doc_lens,
+        )
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "chunks": self.chunks,
+                "vocab": self.vocab,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported knowledge index version: {meta.get('version')}")
+        with np.load(f"{path}.npz", allow_pickle=False) as arrays:
+            return cls(
+                meta["chunks"], meta["vocab"],
+                arrays["indptr"], arrays["doc_ids"], arrays["tfs"], arrays["doc_lens"],
+                k1=meta["k1"], b=meta["b"],
+            )
+
+
+def format_excerpts(results):
+    return "\n\n".join(f"[Excerpt {i + 1}]\n{chunk}" for i, (chunk, _score) in enumerate(results))
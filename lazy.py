@@ -0,0 +1,48 @@
+# Lazily created per-process singletons for heavy clients and optional dependencies.
+
+import os
+import threading
+import time
+
+_UNSET = object()
+
+
+class LazyValue:
+    """
+    Calls `factory()` on the first get() and returns the same value afterwards. Creation
+    happens once per process: concurrent first callers wait for a single factory call, and a
+    forked child builds its own value instead of reusing the parent's (clients holding
+    sockets or gRPC channels must not cross fork()). `load_seconds` records how long the
+    factory took.
+    """
+
+    def __init__(self, factory, name=None):
+        self.factory = factory
+        self.name = name or getattr(factory, '__name__', 'value')
+        self.load_seconds = None
+        self._value = _UNSET
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is not _UNSET and self._pid == os.getpid():
+            return self._value
+        with self._lock:
+            if self._value is _UNSET or self._pid != os.getpid():
+                started_at = time.perf_counter()
+                self._value = self.factory()
+                self.load_seconds = time.perf_counter() - started_at
+                self._pid = os.getpid()
+            return self._value
+
+    def set(self, value):
+        """
+        Replaces the value (e.g. with a fake client in tests and benchmarks).
+        """
+        with self._lock:
+            self._value = value
+            self._pid = os.getpid()
+
+    @property
+    def loaded(self):
+        return self._value is not _UNSET and self._pid == os.getpid()
@@ -0,0 +1,122 @@
+# Cheap, deterministic scoring of agent outputs against expected outputs (requires numpy).
+# Runs over the whole result set at once, before any LLM-judge metric, so only items whose
+# scores are inconclusive need a paid judge call.
+
+import re
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+METRIC_NAMES = ("exact_match", "contains", "token_f1", "rouge_l", "length_ratio")
+
+
+def normalize(text):
+    return _WHITESPACE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def lcs_length(a, b):
+    """
+    Length of the longest common subsequence of token lists a and b, using the bit-parallel
+    algorithm (one big-int bitmask per distinct token of `a`): O(len(a) * len(b) / wordsize).
+    """
+    if not a or not b:
+        return 0
+    masks = {}
+    for position, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(a)) - 1
+    row = full
+    for token in b:
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return len(a) - bin(row).count("1")
+
+
+def _bag_overlap(output_tokens, expected_tokens):
+    """
+    Per item, the number of tokens shared by output and expected (multiset intersection),
+    computed for all items at once from (item, token id) pairs.
+    """
+    vocabulary = {}
+    def encode(token_lists):
+        rows, ids = [], []
+        for row, tokens in enumerate(token_lists):
+            rows.extend([row] * len(tokens))
+            ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+        return np.asarray(rows, dtype=np.int64), np.asarray(ids, dtype=np.int64)
+
+    output_rows, output_ids = encode(output_tokens)
+    expected_rows, expected_ids = encode(expected_tokens)
+    width = max(len(vocabulary), 1)
+    output_keys, output_counts = np.unique(output_rows * width + output_ids, return_counts=True)
+    expected_keys, expected_counts = np.unique(expected_rows * width + expected_ids, return_counts=True)
+    shared, output_at, expected_at = np.intersect1d(output_keys, expected_keys, assume_unique=True, return_indices=True)
+    overlap = np.minimum(output_counts[output_at], expected_counts[expected_at])
+    return np.bincount(shared // width, weights=overlap, minlength=len(output_tokens))
+
+
+def score_outputs(outputs, expected_outputs):
+    """
+    Scores each output against its expected output. Returns {metric: float array}, one
+    value per item, for the metrics in METRIC_NAMES (all in [0, 1] except length_ratio,
+    which is output tokens / expected tokens). Missing outputs score 0.
+    """
+    outputs = [output or "" for output in outputs]
+    expected_outputs = [expected or "" for expected in expected_outputs]
+    normalized_outputs = [normalize(output) for output in outputs]
+    normalized_expected = [normalize(expected) for expected in expected_outputs]
+    output_tokens = [tokenize(output) for output in outputs]
+    expected_tokens = [tokenize(expected) for expected in expected_outputs]
+
+    output_lengths = np.array([len(tokens) for tokens in output_tokens], dtype=np.float64)
+    expected_lengths = np.array([len(tokens) for tokens in expected_tokens], dtype=np.float64)
+
+    overlap = _bag_overlap(output_tokens, expected_tokens)
+    precision = np.divide(overlap, output_lengths, out=np.zeros_like(overlap), where=output_lengths > 0)
+    recall = np.divide(overlap, expected_lengths, out=np.zeros_like(overlap), where=expected_lengths > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(overlap), where=(precision + recall) > 0)
+
+    lcs = np.array([lcs_length(a, b) for a, b in zip(output_tokens, expected_tokens)], dtype=np.float64)
+    lcs_precision = np.divide(lcs, output_lengths, out=np.zeros_like(lcs), where=output_lengths > 0)
+    lcs_recall = np.divide(lcs, expected_lengths, out=np.zeros_like(lcs), where=expected_lengths > 0)
+    rouge_l = np.divide(2 * lcs_precision * lcs_recall, lcs_precision + lcs_recall,
+                        out=np.zeros_like(lcs), where=(lcs_precision + lcs_recall) > 0)
+
+    exact = np.array([bool(o) and o == e for o, e in zip(normalized_outputs, normalized_expected)], dtype=np.float64)
+    contains = np.array([bool(o) and bool(e) and e in o for o, e in zip(normalized_outputs, normalized_expected)], dtype=np.float64)
+
+    return {
+        "exact_match": exact,
+        "contains": contains,
+        "token_f1": f1,
+        "rouge_l": rouge_l,
+        "length_ratio": np.divide(output_lengths, expected_lengths, out=np.zeros_like(output_lengths), where=expected_lengths > 0),
+    }
+
+
+def combined_score(scores):
+    """
+    One cheap quality estimate per item: 1 for an exact or contained match, otherwise the
+    better of token F1 and ROUGE-L.
+    """
+    matched = (scores["exact_match"] > 0) | (scores["contains"] > 0)
+    return np.where(matched, 1.0, np.maximum(scores["token_f1"], scores["rouge_l"]))
+
+
+def uncertain_mask(scores, low, high):
+    """
+    True for items whose combined score falls inside [low, high]: too close to call
+    locally, so they are sent to the LLM-judge metrics.
+    """
+    combined = combined_score(scores)
+    return (combined >= low) & (combined <= high)
+
+
+def summarize(scores):
+    return {name: float(values.mean()) if len(values) else 0.0 for name, values in scores.items()}
@@ -0,0 +1,315 @@
+# Request tracing and Prometheus metrics for the backend (no extra dependencies).
+# Each request gets a RequestTrace holding its id, per-stage timings and attributes such as prompt
+# size, token usage and upstream status. Stage timings, request totals and upstream calls are also
+# aggregated into Prometheus histograms/counters, rendered in the text exposition format for /metrics.
+
+import bisect
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_SECONDS_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+http_requests = registry.counter(
+    "agent_http_requests_total", "HTTP requests handled, by endpoint, method and status.", ("endpoint", "method", "status"))
+http_request_seconds = registry.histogram(
+    "agent_http_request_duration_seconds", "HTTP request handling time.", ("endpoint", "method"))
+stage_seconds = registry.histogram(
+    "agent_stage_duration_seconds", "Time spent in each stage of a request.", ("endpoint", "stage"))
+prompt_chars = registry.histogram(
+    "agent_prompt_chars", "Size of prompts sent to Gemini, in characters.", ("endpoint",), buckets=SIZE_BUCKETS)
+upstream_requests = registry.counter(
+    "agent_upstream_requests_total", "Upstream API calls (every attempt, including retries), by status.",
+    ("upstream", "model", "method", "status"))
+upstream_seconds = registry.histogram(
+    "agent_upstream_request_duration_seconds", "Upstream API call time per attempt.", ("upstream", "model", "method"))
+gemini_tokens = registry.counter(
+    "agent_gemini_tokens_total", "Tokens reported by Gemini usageMetadata.", ("model", "kind"))
+coalesced_requests = registry.counter(
+    "agent_coalesced_requests_total", "Requests that shared an identical in-flight upstream call instead of making one.",
+    ("upstream",))
+voice_first_audio_seconds = registry.histogram(
+    "agent_voice_first_audio_seconds", "Voice turns: time from the request to the first synthesized sentence.")
+
+
+class RequestTrace:
+    """
+    Timings and attributes for one request; `to_dict` is what the JSON request log contains.
+    """
+
+    def __init__(self, endpoint, request_id=None):
+        self.endpoint = endpoint
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+
+    def to_dict(self):
+        return {
+            "requestId": self.request_id,
+            "endpoint": self.endpoint,
+            "durationMs": round((time.perf_counter() - self.started_at) * 1000, 2),
+            "spans": self.spans,
+            **self.attributes,
+        }
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(endpoint, request_id=None):
+    trace = RequestTrace(endpoint, request_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def end_trace(method, status):
+    """
+    Records the request totals and returns the finished trace (or None if none was started).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    http_requests.inc(endpoint=trace.endpoint, method=method, status=status)
+    http_request_seconds.observe(time.perf_counter() - trace.started_at, endpoint=trace.endpoint, method=method)
+    trace.attributes["status"] = status
+    return trace
+
+
+def detach_trace():
+    """
+    Removes the current trace from this context without ending it and returns it, for a
+    response body that is still being produced after the request handler returns.
+    """
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    return trace
+
+
+def trace_stream(trace, chunks, method, status, on_end=None):
+    """
+    Yields a streamed response body with `trace` as the current trace while each chunk is
+    produced, so its spans belong to the request, then ends the trace once the body is
+    exhausted or closed and passes it to `on_end`.
+    """
+    iterator = iter(chunks)
+    try:
+        while True:
+            # Set on every step: a server may resume the body in a different context
+            _current_trace.set(trace)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        _current_trace.set(trace)
+        try:
+            if close is not None:
+                close()
+        finally:
+            finished = end_trace(method, status)
+            if on_end is not None:
+                on_end(finished)
+
+
+def _endpoint():
+    trace = _current_trace.get()
+    return trace.endpoint if trace is not None else "background"
+
+
+@contextmanager
+def span(stage):
+    """
+    Times the enclosed block as `stage` of the current request (or of background work).
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        stage_seconds.observe(elapsed, endpoint=_endpoint(), stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"stage": stage, "ms": round(elapsed * 1000, 2)})
+
+
+def annotate(**attributes):
+    """
+    Attaches attributes (prompt size, cache status, ...) to the current request's trace.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def record_prompt(text_chars, estimated_tokens):
+    prompt_chars.observe(text_chars, endpoint=_endpoint())
+    annotate(promptChars=text_chars, promptTokensEstimate=estimated_tokens)
+
+
+def record_upstream(upstream, model, method, status, seconds):
+    """
+    One upstream call attempt; `status` is the HTTP status or an error name.
+    """
+    upstream_requests.inc(upstream=upstream, model=model, method=method, status=status)
+    upstream_seconds.observe(seconds, upstream=upstream, model=model, method=method)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.setdefault("upstream", []).append(
+            {"upstream": upstream, "method": method, "status": status, "ms": round(seconds * 1000, 2)}
+        )
+
+
+def record_coalesced(upstream):
+    coalesced_requests.inc(upstream=upstream)
+    annotate(coalesced=upstream)
+
+
+def record_first_audio(seconds):
+    voice_first_audio_seconds.observe(seconds)
+    annotate(firstAudioMs=round(seconds * 1000, 2))
+
+
+def record_usage(model, usage):
+    """
+    Adds Gemini usageMetadata token counts to the counters and the current trace.
+    """
+    if not usage:
+        return
+    counts = {
+        "prompt": usage.get("promptTokenCount", 0),
+        "candidates": usage.get("candidatesTokenCount", 0),
+        "total": usage.get("totalTokenCount", 0),
+    }
+    for kind, count in counts.items():
+        if count:
+            gemini_tokens.inc(count, model=model, kind=kind)
+    trace = _current_trace.get()
+    if trace is not None:
+        usage_so_far = trace.attributes.setdefault("tokens", {})
+        for kind, count in counts.items():
+            usage_so_far[kind] = usage_so_far.get(kind, 0) + count
+
+
+def gemini_observer(event, model, method, **fields):
+    """
+    GeminiClient.observer hook: feeds upstream attempts, response decoding and token usage
+    into the metrics and the current trace.
+    """
+    if event == "attempt":
+        record_upstream("gemini", model, method, fields["status"], fields["seconds"])
+    elif event == "decode":
+        stage_seconds.observe(fields["seconds"], endpoint=_endpoint(), stage="gemini_decode")
+    elif event == "usage":
+        record_usage(model, fields["usage"])
+
+
+def log_trace(trace):
+    print(json.dumps({"event": "request", **trace.to_dict()}, default=str), flush=True)
@@ -0,0 +1,145 @@
+# Opt-in cache of agent replies for deterministic re-runs (e.g. evaluation suites).
+# Keyed by everything that determines the Gemini request, so a hit is only possible when the
+# agent, model, conversation, message and generation settings are all unchanged.
+
+import hashlib
+import json
+import os
+import re
+import time
+
+from lru import LRUCache
+from sqlite_db import SQLiteDatabase
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def profile_hash(agent_profile):
+    """
+    Stable hash of an agent profile (persona, parameters, retrieval settings).
+    """
+    return hashlib.sha256(json.dumps(agent_profile, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def reply_cache_key(agent_profile_hash, model, chat_history, user_message, generation_config, history_summary=None):
+    history = [
+        [entry.get('sender'), normalize_text(entry.get('message'))]
+        for entry in chat_history or []
+        if entry.get('sender') in ('user', 'agent')
+    ]
+    parts = [agent_profile_hash, model, history, normalize_text(user_message), generation_config or {}]
+    if history_summary:
+        parts.append(normalize_text(history_summary))
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ReplyCache:
+    """
+    Interface: get(key) -> reply text or None, put(key, reply).
+    """
+
+    def __init__(self, maxsize=10000, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, reply):
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+class MemoryReplyCache(ReplyCache):
+    def __init__(self, maxsize=10000, ttl=86400):
+        super().__init__(maxsize, ttl)
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        reply = self._cache.get(key)
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    def put(self, key, reply):
+        self._cache.set(key, reply)
+
+
+class SQLiteReplyCache(SQLiteDatabase, ReplyCache):
+    """
+    Shared by all workers. Expired rows are ignored on read; the table is trimmed back to
+    `maxsize` least-recently-used rows every `trim_every` writes.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS reply_cache ("
+        " key TEXT PRIMARY KEY,"
+        " reply TEXT NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " last_used_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_reply_cache_last_used_at ON reply_cache (last_used_at)",
+    )
+
+    def __init__(self, path, maxsize=10000, ttl=86400, trim_every=100):
+        ReplyCache.__init__(self, maxsize, ttl)
+        SQLiteDatabase.__init__(self, path)
+        self.trim_every = trim_every
+        self._writes = 0
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT reply, created_at FROM reply_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE reply_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, reply):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO reply_cache (key, reply, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+            (key, reply, now, now),
+        )
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            self._transaction([
+                ("DELETE FROM reply_cache WHERE created_at < ?", (now - self.ttl,)),
+                ("DELETE FROM reply_cache WHERE key NOT IN (SELECT key FROM reply_cache ORDER BY last_used_at DESC LIMIT ?)", (self.maxsize,)),
+            ])
+
+
+def create_reply_cache():
+    """
+    Returns the reply cache if REPLY_CACHE_ENABLED is set, otherwise None (caching off).
+    """
+    if os.environ.get("REPLY_CACHE_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    maxsize = int(os.environ.get("REPLY_CACHE_MAX_ENTRIES", "10000"))
+    ttl = float(os.environ.get("REPLY_CACHE_TTL_SECONDS", "86400"))
+    if os.environ.get("AGENT_STORE", "sqlite").lower() == "memory":
+        return MemoryReplyCache(maxsize=maxsize, ttl=ttl)
+    return SQLiteReplyCache(os.environ.get("AGENT_STORE_PATH", "agents.db"), maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,79 @@
+# Request coalescing ("single-flight") for upstream calls: concurrent callers with the same key
+# share one in-flight call and all receive its result (or its exception). Nothing is kept after
+# the call finishes, so this complements the caches rather than replacing them.
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+
+def request_key(*parts):
+    """
+    Stable hash of a JSON-serializable upstream request (model, contents, settings, ...).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Thread version: the first caller for a key runs `function()`, later callers block until it
+    finishes. `calls` counts upstream calls made, `coalesced` the callers that shared one.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+        Returns (result, shared): shared is True when another caller's call was reused.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            shared = future is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+        if shared:
+            return future.result(), True
+
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "inFlight": len(self._in_flight)}
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    asyncio version, for a single event loop. The shared call runs as its own task, so a
+    caller that disconnects (is cancelled) does not cancel it for the others.
+    """
+
+    async def do(self, key, function):
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(function())
+            self._in_flight[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda _task: self._in_flight.pop(key, None))
+        return await asyncio.shield(task), shared
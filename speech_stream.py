@@ -0,0 +1,66 @@
+# Helpers for streaming speech-to-text: audio is fed to Google Cloud streaming recognition
+# while it is still arriving, and the recognizer's responses become transcript events
+# (interim while the user speaks, final at the end of each utterance).
+
+STT_FRAME_MS = 100
+COMPRESSED_CHUNK_BYTES = 256 # ~100 ms of 16-24 kbit/s Opus/AMR
+
+STT_ENCODINGS = (
+    'LINEAR16', 'FLAC', 'MULAW', 'AMR', 'AMR_WB', 'OGG_OPUS', 'SPEEX_WITH_HEADER_BYTE', 'MP3', 'WEBM_OPUS'
+)
+
+
+def audio_chunk_bytes(encoding, sample_rate_hertz, frame_ms=STT_FRAME_MS):
+    """
+    Read size that holds about `frame_ms` of audio. Chunked request bodies only return a
+    read once it is full, so a fixed large size would add seconds of delay to compressed audio.
+    """
+    if encoding == 'LINEAR16':
+        return sample_rate_hertz * 2 * frame_ms // 1000
+    if encoding == 'MULAW':
+        return sample_rate_hertz * frame_ms // 1000
+    return COMPRESSED_CHUNK_BYTES
+
+
+def read_audio_chunks(stream, chunk_size):
+    """
+    Yields the request body as it arrives, without waiting for the whole recording.
+    """
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_streaming_config(language_code, sample_rate_hertz, encoding, interim_results=True):
+    from google.cloud import speech_v1p1beta1 as speech # Already imported by the client factory
+
+    return speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+            sample_rate_hertz=sample_rate_hertz,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+        ),
+        interim_results=interim_results,
+    )
+
+
+def transcribe_stream(client, streaming_config, audio_chunks):
+    """
+    Runs streaming recognition over `audio_chunks` with SpeechClient `client` and yields
+    {"transcript", "isFinal", "stability"} for each result, as the recognizer produces them.
+    """
+    from google.cloud import speech_v1p1beta1 as speech
+
+    requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks)
+    for response in client.streaming_recognize(config=streaming_config, requests=requests):
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            yield {
+                "transcript": result.alternatives[0].transcript,
+                "isFinal": bool(result.is_final),
+                "stability": result.stability,
+            }
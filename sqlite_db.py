@@ -0,0 +1,58 @@
+# Shared SQLite connection handling for the backend's stores (agents, sessions, jobs).
+
+import os
+import sqlite3
+import threading
+
+
+class SQLiteDatabase:
+    """
+    Base for SQLite-backed stores. Each thread gets its own connection in WAL mode, so
+    readers in any number of threads or worker processes never wait on one another.
+    Subclasses pass their CREATE statements as `schema`.
+    """
+
+    schema = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Create the schema on a throwaway connection so nothing is inherited across fork().
+        conn = self._connect()
+        try:
+            with conn:
+                for statement in self.schema:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _conn(self):
+        # Reconnect after fork(): a connection must not be shared between processes.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, statements):
+        """
+        Runs (sql, params) pairs atomically.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
@@ -1,10 +1,17 @@
 import requests
 import json
 import os
+import asyncio
+from collections import defaultdict
 import opik
 from dotenv import load_dotenv
 from opik.evaluation import evaluate_prompt, evaluate
 from opik.evaluation.metrics import Hallucination, AnswerRelevance, Contains, Usefulness
+from eval_runner import run_scenarios, run_conversations, scenario_id, conversation_id, conversation_key
+from eval_metrics import CachedMetric, GatedMetric, LocalScoreMetric
+from judge_cache import JudgeCache
+from local_metrics import METRIC_NAMES, score_outputs, summarize, uncertain_mask
+from dataset_sync import load_scenarios, sync_dataset
 
 
 load_dotenv()
@@ -19,6 +26,26 @@ workspace_name = opik_workspace # Replace if not set in env
 # Define your backend URL
 BASE_URL = "http://localhost:5000/api"
 
+# Async scenario runner settings (see eval_runner.py)
+EVAL_RESULTS_PATH = os.getenv("EVAL_RESULTS_PATH", "eval_results.jsonl") # Re-running resumes from this file
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "16"))
+EVAL_RATE_PER_SECOND = float(os.getenv("EVAL_RATE_PER_SECOND", "8"))
+EVAL_MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", "3"))
+EVAL_MODE = os.getenv("EVAL_MODE", "single") # "single" questions or multi-turn "conversation" replay
+EVAL_CONVERSATION_RESULTS_PATH = os.getenv("EVAL_CONVERSATION_RESULTS_PATH", "eval_results_conversations.jsonl")
+# Comma-separated JSONL scenario files: one {"input", "expected_output"} or {"id", "turns": [...]} per line
+EVAL_SCENARIO_FILES = os.getenv("EVAL_SCENARIO_FILES", "scenarios/single_turn.jsonl").split(",")
+EVAL_CONVERSATION_FILES = os.getenv("EVAL_CONVERSATION_FILES", "scenarios/conversations.jsonl").split(",")
+# Content hashes already uploaded to each Opik dataset, so only new or changed rows are inserted
+EVAL_SYNC_STATE_PATH = os.getenv("EVAL_SYNC_STATE_PATH", "eval_sync_state.json")
+# Set to delete dataset rows that are no longer in the scenario files (the dataset is shared; off by default)
+EVAL_SYNC_PRUNE = os.getenv("EVAL_SYNC_PRUNE", "").lower() in ("1", "true", "yes")
+# LLM-judge metrics only score items whose local score (see local_metrics.py) falls in this band; "0,1" judges everything
+EVAL_JUDGE_BAND_LOW = float(os.getenv("EVAL_JUDGE_BAND_LOW", "0.1"))
+EVAL_JUDGE_BAND_HIGH = float(os.getenv("EVAL_JUDGE_BAND_HIGH", "0.9"))
+# Judge results are cached here, so unchanged agent outputs are never re-judged on later runs
+EVAL_JUDGE_CACHE_PATH = os.getenv("EVAL_JUDGE_CACHE_PATH", "judge_cache.db")
+
 def get_agent_data(agent_id):
     """
     Calls the /api/get-agent-data/<deployment_id> endpoint to retrieve agent details.
@@ -42,39 +69,53 @@ def get_agent_data(agent_id):
         print(f"An unexpected error occurred during agent data retrieval: {e}")
     return None
 
-def chat_with_agent(agent_id, user_message, chat_history=[]):
+def conversation_turn_items(conversations):
     """
-    Calls the /api/chat-with-agent endpoint to interact with an agent.
+    Flattens conversations into one dataset item per turn, tagged with conversation_id
+    and turn so scores can be grouped back per conversation.
     """
-    url = f"{BASE_URL}/chat-with-agent"
-    print(f"\n--- Calling {url} to chat with agent {agent_id} ---")
+    return [
+        {
+            "input": turn["input"],
+            "expected_output": turn.get("expected_output"),
+            "conversation_id": conversation_id(conversation),
+            "turn": index,
+        }
+        for conversation in conversations
+        for index, turn in enumerate(conversation["turns"])
+    ]
 
-    payload = {
-        "agentId": agent_id,
-        "userMessage": user_message,
-        "chatHistory": chat_history # Pass accumulated chat history
-    }
-    headers = {
-        'Content-Type': 'application/json'
-    }
+def conversation_turn_outputs(conversations, run_results):
+    """
+    Returns {(conversation_id, turn): (agent reply, context)} for the replayed turns, where
+    context lists the earlier turns so the judges see what a follow-up question refers to.
+    Turns that failed or were skipped are left out.
+    """
+    outputs = {}
+    for conversation in conversations:
+        result = run_results.get(conversation_key(conversation), {})
+        context = []
+        for turn in result.get("turns", []):
+            if turn["status"] != "ok":
+                break # Failed turn: later turns were never sent
+            outputs[(conversation_id(conversation), turn["turn"])] = (turn.get("output"), list(context))
+            context += [f"user: {turn['input']}", f"agent: {turn.get('output') or ''}"]
+    return outputs
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        result = response.json()
-        agent_response = result.get('response')
-        print(f"User: {user_message}")
-        print(f"Agent: {agent_response}")
-        return agent_response
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP error during chat: {e}")
-        print(f"Response: {e.response.text}")
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection error: Is the Flask backend running at {BASE_URL}? {e}")
-        print("Please ensure your 'app.py' Flask server is running on http://localhost:5000.")
-    except Exception as e:
-        print(f"An unexpected error occurred during chat: {e}")
-    return None
+def aggregate_conversation_scores(test_results):
+    """
+    Averages each metric over the turns of every conversation: {conversation_id: {metric: mean}}.
+    """
+    scores = defaultdict(lambda: defaultdict(list))
+    for test_result in test_results:
+        item = test_result.test_case.dataset_item_content
+        for score in test_result.score_results:
+            if not score.scoring_failed:
+                scores[item.get("conversation_id")][score.name].append(score.value)
+    return {
+        conversation: {name: sum(values) / len(values) for name, values in metrics.items()}
+        for conversation, metrics in scores.items()
+    }
 
 if __name__ == "__main__":
    
@@ -91,74 +132,112 @@ if __name__ == "__main__":
 
     # --- STEP 2: Start Chat with Agent ---
     print("\n--- Starting a chat with the generated agent ---")
-    chat_history = []
-
-    test_scenarios = [
-    {"input": "What is the return policy in this company??",
-        "expected_output": "Our return policy allows for returns within 30 days for unopened bags."},
-    {"input": "Do you have any light roast options??",
-        "expected_output": "Yes, we do! Our light roasts are known for their brighter, more acidic flavors and often exhibit fruity or floral notes."},
-    {"input": "How many roasted coffee type in your company?",
-        "expected_output": "We offer three roast types: light, medium, and dark."},
-    {"input": "How long is the shipping for standard one?",
-        "expected_output": "Standard shipping typically takes 3-5 business days."},
-    {"input": "How long is the shipping for express one?",
-        "expected_output": "Express shipping typically takes 1-2 business days."},
-    {"input": "What kind of coffee does Bean O sell?",
-        "expected_output": "At Bean O, we sell premium organic coffee beans globally. We specialize in single-origin, ethically sourced beans, offering a variety of light, medium, and dark roasts, as well as convenient subscription services."},
-    {"input": "Are your coffee beans ethically sourced?",
-        "expected_output": "Yes, absolutely! At Bean O, we are committed to sustainability, and all our coffee beans are ethically sourced."},
-    {"input": "Tell me about Bean O's values.",
-        "expected_output": "At Bean O, our customers value quality, sustainability, and quick support. We are dedicated to providing premium organic, single-origin, and ethically sourced coffee beans."},
-    {"input": "What's the best way to brew your light roast for a pour-over?",
-        "expected_output": "While specific brewing methods can vary, a great starting point for pour-over with a light roast is often a water temperature around 200-205°F (93-96°C) and a grind size similar to table salt. A common ratio is 1:15 or 1:16 coffee to water. You can find more detailed brewing guides on our website for optimal results!"},
-    {"input": "Which roast is ideal for making espresso?",
-        "expected_output": "For espresso, many people prefer our dark roast due to its rich, bold flavor. However, some also enjoy the intensity of our medium roast. Ultimately, it comes down to personal preference!"},
-    {"input": "How do I manage my coffee subscription?",
-        "expected_output": "To manage your coffee subscription, you can log in to your account on our website. From your account dashboard, you'll be able to update your order frequency, change your coffee selection, or adjust your shipping details. If you need any specific guidance, just let me know!"},
-    {"input": "Do you have any dark roast options?",
-        "expected_output": "Yes, we certainly do! Bean O offers a selection of delicious dark roast coffee beans for those who prefer a bold and robust flavor."},
-    {"input": "What are single-origin beans?",
-        "expected_output": "Single-origin beans come from a single specific geographical location, which could be a single farm, a specific region, or a particular country. This means they often have distinct and unique flavor profiles influenced by their specific growing conditions."},
-]
-        
-        # Perform chat & collect responses
-    
+
+    # Scenarios are streamed from JSONL files and deduplicated by content hash
+    test_scenarios = load_scenarios(EVAL_SCENARIO_FILES)
+    test_conversations = load_scenarios(EVAL_CONVERSATION_FILES)
+
+    # Perform chat & collect responses (async, rate limited, resumable)
+    if EVAL_MODE == "conversation":
+        run_results = asyncio.run(run_conversations(
+            test_conversations,
+            agent_id_to_use,
+            base_url=BASE_URL,
+            results_path=EVAL_CONVERSATION_RESULTS_PATH,
+            concurrency=EVAL_CONCURRENCY,
+            rate_per_second=EVAL_RATE_PER_SECOND,
+            max_retries=EVAL_MAX_RETRIES
+        ))
+        dataset_items = conversation_turn_items(test_conversations)
+        outputs_by_turn = conversation_turn_outputs(test_conversations, run_results)
+        dataset_name = "Agent-jellybean-conversations"
+        experiment_name = "Agent-Jellybean-Conversation-Eval"
+    else:
+        run_results = asyncio.run(run_scenarios(
+            test_scenarios,
+            agent_id_to_use,
+            base_url=BASE_URL,
+            results_path=EVAL_RESULTS_PATH,
+            concurrency=EVAL_CONCURRENCY,
+            rate_per_second=EVAL_RATE_PER_SECOND,
+            max_retries=EVAL_MAX_RETRIES
+        ))
+        outputs_by_scenario = {
+            scenario_id(scenario): run_results.get(scenario_id(scenario), {}).get("output")
+            for scenario in test_scenarios
+        }
+        dataset_items = test_scenarios
+        dataset_name = "Agent-jellybean"
+        experiment_name = "Agent-Jellybean-Eval"
 
     # Create / get Opik dataset
     opik_client = opik.Opik()
-    dataset = opik_client.get_or_create_dataset(name="Agent-jellybean")
+    dataset = opik_client.get_or_create_dataset(name=dataset_name)
 
     print("Success create dataset")
 
-    dataset.insert(test_scenarios)
+    dataset_item_ids = sync_dataset(dataset, dataset_items, EVAL_SYNC_STATE_PATH, prune=EVAL_SYNC_PRUNE)
+
+    print("Success sync dataset")
 
-    print("Success insert dataset")
 
+    # Agent replies were already collected by the async runner
+    def item_key(x):
+        if EVAL_MODE == "conversation":
+            return (x["conversation_id"], x["turn"])
+        # Content hash without the dataset item id, as in dataset_sync: scenarios can share an input
+        return scenario_id({field: value for field, value in x.items() if field != "id"})
+
+    def agent_output(x):
+        if EVAL_MODE == "conversation":
+            return outputs_by_turn.get(item_key(x), (None, []))[0]
+        return outputs_by_scenario.get(item_key(x))
+
+    # Cheap local scores over the whole result set first; only uncertain items go to the LLM judges
+    local_scores = score_outputs([agent_output(item) for item in dataset_items], [item["expected_output"] for item in dataset_items])
+    judge_mask = uncertain_mask(local_scores, EVAL_JUDGE_BAND_LOW, EVAL_JUDGE_BAND_HIGH)
+    local_results = {
+        item_key(item): ({name: float(local_scores[name][i]) for name in METRIC_NAMES}, bool(judge_mask[i]))
+        for i, item in enumerate(dataset_items)
+    }
+    print("\n--- Local scores (mean) ---")
+    print(json.dumps(summarize(local_scores), indent=2))
+    print(f"{int(judge_mask.sum())} of {len(dataset_items)} items in judge band [{EVAL_JUDGE_BAND_LOW}, {EVAL_JUDGE_BAND_HIGH}]")
 
     hallucination_metric = Hallucination()
     contains_metric = Contains(case_sensitive=False)
     useful_metric = Usefulness()
     relevance_metric = AnswerRelevance(require_context=False)
+    local_score_metrics = [LocalScoreMetric(name) for name in METRIC_NAMES]
+    judge_cache = JudgeCache(EVAL_JUDGE_CACHE_PATH)
+    judge_metrics = [
+        GatedMetric(CachedMetric(metric, judge_cache))
+        for metric in (hallucination_metric, useful_metric, relevance_metric)
+    ]
 
     print("Success insert metrics")
     
 
     # Define Opik evaluation task
     def evaluation_task(x):
-        user_input = x["input"]
-        agent_reply = chat_with_agent(agent_id_to_use, user_input, chat_history)
-        return {
-            "output": agent_reply
+        item_local_scores, needs_judge = local_results[item_key(x)]
+        task_output = {
+            "output": agent_output(x),
+            "local_scores": item_local_scores,
+            "judge": needs_judge
         }
+        if EVAL_MODE == "conversation":
+            task_output["context"] = outputs_by_turn.get(item_key(x), (None, []))[1]
+        return task_output
     
 
     # Run Opik evaluation
     result = evaluate(
         dataset=dataset,
+        dataset_item_ids=dataset_item_ids,
         task=evaluation_task,
-        scoring_metrics=[hallucination_metric, useful_metric, relevance_metric],
-        experiment_name="Agent-Jellybean-Eval",
+        scoring_metrics=local_score_metrics + judge_metrics,
+        experiment_name=experiment_name,
         scoring_key_mapping={
         "reference": "expected_output"},
         task_threads=3
@@ -166,4 +245,12 @@ if __name__ == "__main__":
 
     print("\n--- Opik Evaluation Results ---")
     print(result)
+
+    judge_cache_stats = judge_cache.stats()
+    print(f"Judge cache: {judge_cache_stats['hits']} hits, {judge_cache_stats['misses']} misses "
+          f"(hit rate {judge_cache_stats['hitRate']:.1%}) -> {EVAL_JUDGE_CACHE_PATH}")
+
+    if EVAL_MODE == "conversation":
+        print("\n--- Per-conversation scores (mean over turns) ---")
+        print(json.dumps(aggregate_conversation_scores(result.test_results), indent=2))
     
@@ -0,0 +1,65 @@
+# Shared fixtures: the Flask backend, imported once against a fake Gemini server and a temporary
+# working directory. Run from the repository root: python -m pytest -q tests
+
+import json
+import os
+
+import pytest
+
+from benchmarks.fake_upstream import FakeGeminiServer, UpstreamFaults
+
+AGENT_FORM = {
+    "name": "Test Agent", "llm": "gemini-2.0-flash", "useCase": "support", "purpose": "help customers",
+    "campaignDesignPrompt": "Be brief.", "knowledgeBaseType": "text",
+    "knowledgeBaseContent": "Standard shipping takes 3-5 business days. Returns are accepted within 30 days.",
+}
+
+
+@pytest.fixture(scope="session")
+def gemini_faults():
+    return UpstreamFaults()
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory, gemini_faults):
+    """
+    The agent_backend module. Its settings are read at import, so the environment is set first.
+    """
+    server = FakeGeminiServer(gemini_faults).start()
+    work_dir = tmp_path_factory.mktemp("backend")
+    os.environ.update({
+        "GEMINI_API_KEY": "test-key",
+        "GEMINI_API_BASE": server.api_base,
+        "AGENT_STORE_PATH": str(work_dir / "agents.db"),
+        "KNOWLEDGE_INDEX_DIR": str(work_dir / "agent_indexes"),
+        "TTS_CACHE_DIR": str(work_dir / "tts_cache"),
+        "EXTRACTION_CACHE_DIR": str(work_dir / "extraction_cache"),
+        "UPLOAD_DIR": str(work_dir / "uploads"),
+    })
+    import agent_backend
+    yield agent_backend
+    server.stop()
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def agent_id(client):
+    response = client.post("/api/generate-agent-ai", data=AGENT_FORM)
+    assert response.status_code == 200
+    return response.get_json()["deploymentId"]
+
+
+def sse_events(body):
+    """
+    [(event, data)] of a Server-Sent Events response body.
+    """
+    events = []
+    for block in body.decode('utf-8').split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
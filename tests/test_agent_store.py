@@ -0,0 +1,117 @@
+# Agent store tests: the memory and SQLite backends behave the same, and the LRU cache in
+# front of them never serves a stale not-ready agent. Run from the repository root: python -m pytest -q tests
+
+import time
+
+import pytest
+
+from agent_store import CachedAgentStore, MemoryAgentStore, SQLiteAgentStore, create_agent_store
+
+
+def agent(agent_id, name="Support bot", status=None, **parameters):
+    profile = {"id": agent_id, "parameters": {"name": name, "useCase": "support", "language": "en", **parameters}}
+    if status is not None:
+        profile["status"] = status
+    return profile
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryAgentStore()
+    return SQLiteAgentStore(str(tmp_path / "agents.db"))
+
+
+def test_get_returns_stored_profile(store):
+    assert store.get("missing") is None
+    store.put(agent("a1"))
+    assert store.get("a1") == agent("a1")
+
+
+def test_put_replaces_profile_but_keeps_created_at(store):
+    store.put(agent("a1"))
+    created_at = store.list()[0]["createdAt"]
+    time.sleep(0.01)
+    store.put(agent("a1", name="Renamed"))
+    assert store.get("a1")["parameters"]["name"] == "Renamed"
+    assert store.count() == 1
+    assert store.list() == [{
+        "id": "a1", "name": "Renamed", "useCase": "support", "language": "en", "createdAt": created_at,
+    }]
+
+
+def test_list_is_newest_first_and_paginated(store):
+    for agent_id in ("a1", "a2", "a3"):
+        store.put(agent(agent_id))
+        time.sleep(0.01)
+    assert [item["id"] for item in store.list()] == ["a3", "a2", "a1"]
+    assert [item["id"] for item in store.list(limit=1, offset=1)] == ["a2"]
+    assert store.count() == 3
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "agents.db")
+    SQLiteAgentStore(path).put(agent("a1"))
+    assert SQLiteAgentStore(path).get("a1") == agent("a1")
+
+
+class CountingStore(MemoryAgentStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, agent_id):
+        self.reads += 1
+        return super().get(agent_id)
+
+
+def test_cache_serves_ready_agents_without_backend_reads():
+    backend = CountingStore()
+    backend.put(agent("a1"))
+    store = CachedAgentStore(backend)
+    assert store.get("a1") == agent("a1")
+    assert store.get("a1") == agent("a1")
+    assert backend.reads == 1
+
+
+def test_cache_never_holds_not_ready_agents():
+    backend = CountingStore()
+    store = CachedAgentStore(backend)
+    store.put(agent("a1", status="ingesting"))
+    assert store.get("a1")["status"] == "ingesting"
+    assert store.get("a1")["status"] == "ingesting"
+    assert backend.reads == 2
+
+    # Another worker finishes ingestion: the ready profile is visible on the next read.
+    backend.put(agent("a1", status="ready"))
+    assert store.get("a1")["status"] == "ready"
+
+
+def test_put_of_not_ready_profile_evicts_cached_copy():
+    backend = CountingStore()
+    store = CachedAgentStore(backend)
+    store.put(agent("a1"))
+    store.put(agent("a1", status="ingesting"))
+    assert store.get("a1")["status"] == "ingesting"
+    assert backend.reads == 1
+
+
+def test_cache_entries_expire_after_ttl():
+    backend = CountingStore()
+    store = CachedAgentStore(backend, ttl=0.05)
+    store.put(agent("a1"))
+    backend.put(agent("a1", name="Updated elsewhere"))
+    assert store.get("a1")["parameters"]["name"] == "Support bot"
+    time.sleep(0.1)
+    assert store.get("a1")["parameters"]["name"] == "Updated elsewhere"
+
+
+def test_create_agent_store_selects_backend(monkeypatch, tmp_path):
+    monkeypatch.setenv("AGENT_STORE", "memory")
+    assert isinstance(create_agent_store().backend, MemoryAgentStore)
+    monkeypatch.setenv("AGENT_STORE", "sqlite")
+    monkeypatch.setenv("AGENT_STORE_PATH", str(tmp_path / "agents.db"))
+    assert isinstance(create_agent_store().backend, SQLiteAgentStore)
+    monkeypatch.setenv("AGENT_STORE", "redis")
+    with pytest.raises(ValueError, match="Unknown AGENT_STORE backend"):
+        create_agent_store()
@@ -0,0 +1,102 @@
+# Chat endpoints against the fake Gemini server: request validation, per-item batch results,
+# sessions and the reply cache on the streaming endpoint.
+
+import pytest
+
+from benchmarks.fake_upstream import FAKE_REPLY
+from reply_cache import MemoryReplyCache
+from tests.conftest import sse_events
+
+
+@pytest.mark.parametrize("body, message", [
+    ([{"userMessage": "hi"}], "Request body must be a JSON object"),
+    ({"agentId": "x", "items": []}, "Missing agentId or items"),
+    ({"agentId": "x", "items": ["hi"]}, "Each item must be a JSON object"),
+])
+def test_batch_rejects_malformed_bodies(client, body, message):
+    response = client.post("/api/chat-with-agent/batch", json=body)
+    assert response.status_code == 400
+    assert response.get_json()["message"] == message
+
+
+def test_batch_reports_invalid_items_individually(client, agent_id):
+    response = client.post("/api/chat-with-agent/batch", json={"agentId": agent_id, "bypassCache": True, "items": [
+        {"userMessage": "How long is shipping?"},
+        {"userMessage": "And returns?", "chatHistory": [{"message": "no sender"}]},
+        {"userMessage": "Hello", "chatHistory": "not a list"},
+        {"chatHistory": []},
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result["statusCode"] for result in body["results"]] == [200, 400, 400, 400]
+    assert body["results"][0]["response"] == FAKE_REPLY
+    assert body["results"][1]["error"] == "Each chatHistory entry must have a sender and a message"
+    assert body["results"][2]["error"] == "chatHistory must be a list"
+    assert body["results"][3]["error"] == "Missing userMessage"
+    assert body["failed"] == 3
+
+
+@pytest.fixture
+def session_id(client, agent_id):
+    response = client.post("/api/sessions", json={"agentId": agent_id})
+    assert response.status_code == 201
+    return response.get_json()["sessionId"]
+
+
+@pytest.mark.parametrize("url", ["/api/sessions", "/api/sessions/some-id/messages"])
+def test_session_endpoints_reject_non_object_bodies(client, url):
+    response = client.post(url, json=["hi"])
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Request body must be a JSON object"
+
+
+def test_session_message_keeps_history(client, session_id):
+    response = client.post(f"/api/sessions/{session_id}/messages", json={"userMessage": "How long is shipping?"})
+    assert response.status_code == 200
+    assert response.get_json()["response"] == FAKE_REPLY
+    assert response.headers["X-Reply-Cache"] in ("MISS", "OFF")
+    history = client.get(f"/api/sessions/{session_id}").get_json()["chatHistory"]
+    assert history == [{"sender": "user", "message": "How long is shipping?"}, {"sender": "agent", "message": FAKE_REPLY}]
+
+
+def test_session_gone_during_turn_returns_404(backend, client, session_id, monkeypatch):
+    generate_agent_reply = backend.generate_agent_reply
+
+    def delete_then_reply(*args, **kwargs):
+        backend.session_store.delete(session_id)
+        return generate_agent_reply(*args, **kwargs)
+
+    monkeypatch.setattr(backend, "generate_agent_reply", delete_then_reply)
+    response = client.post(f"/api/sessions/{session_id}/messages", json={"userMessage": "Hello"})
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def reply_cache(backend, monkeypatch):
+    cache = MemoryReplyCache()
+    monkeypatch.setattr(backend, "reply_cache", cache)
+    return cache
+
+
+def test_stream_serves_cached_reply_as_one_delta(client, agent_id, reply_cache, gemini_faults):
+    body = {"agentId": agent_id, "userMessage": "How long is shipping?"}
+    first = client.post("/api/chat-with-agent/stream", json=body)
+    assert first.headers["X-Reply-Cache"] == "MISS"
+    assert len([event for event, _data in sse_events(first.data) if event == "delta"]) > 1
+
+    calls = gemini_faults.calls
+    second = client.post("/api/chat-with-agent/stream", json=body)
+    assert second.headers["X-Reply-Cache"] == "HIT"
+    events = sse_events(second.data)
+    assert [event for event, _data in events] == ["delta", "done"]
+    assert events[0][1]["text"] == events[1][1]["response"] == sse_events(first.data)[-1][1]["response"]
+    assert gemini_faults.calls == calls
+
+    # The non-streaming endpoint shares the same cache entries.
+    response = client.post("/api/chat-with-agent", json=body)
+    assert response.headers["X-Reply-Cache"] == "HIT"
+
+
+def test_stream_rejects_non_object_body(client):
+    response = client.post("/api/chat-with-agent/stream", json=["hi"])
+    assert response.status_code == 400
@@ -0,0 +1,92 @@
+# Chat session tests: history compaction selection and the memory/SQLite session stores.
+# Run from the repository root: python -m pytest -q tests
+
+import time
+
+import pytest
+
+from chat_sessions import MemorySessionStore, SQLiteSessionStore, select_turns_to_compact
+
+
+def turns(*token_counts):
+    return [
+        {"seq": seq, "role": "user" if seq % 2 else "model", "text": f"turn {seq}", "tokens": tokens}
+        for seq, tokens in enumerate(token_counts, start=1)
+    ]
+
+
+def test_nothing_to_compact_within_budget():
+    assert select_turns_to_compact(turns(100, 100, 100), pending_tokens=100, token_budget=400) == []
+
+
+def test_compacts_oldest_turns_down_to_half_the_budget():
+    history = turns(100, 100, 100, 100, 100, 100)
+    compacted = select_turns_to_compact(history, pending_tokens=50, token_budget=500)
+    # 250 tokens of room: pending 50 plus the two newest turns.
+    assert [turn["seq"] for turn in compacted] == [1, 2, 3, 4]
+
+
+def test_latest_exchange_is_always_kept():
+    history = turns(10, 10, 400, 400)
+    compacted = select_turns_to_compact(history, pending_tokens=10, token_budget=300)
+    assert [turn["seq"] for turn in compacted] == [1, 2]
+
+
+def test_two_turns_or_fewer_are_never_compacted():
+    assert select_turns_to_compact(turns(1000, 1000), pending_tokens=1000, token_budget=100) == []
+    assert select_turns_to_compact([], pending_tokens=1000, token_budget=100) == []
+
+
+def test_compaction_returns_a_prefix():
+    history = turns(50, 300, 20, 20, 20, 20)
+    compacted = select_turns_to_compact(history, pending_tokens=0, token_budget=200)
+    assert compacted == history[:len(compacted)]
+    assert [turn["seq"] for turn in compacted] == [1, 2]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore(ttl_seconds=60)
+    return SQLiteSessionStore(str(tmp_path / "agents.db"), ttl_seconds=60)
+
+
+def test_append_and_compact_turns(store):
+    session = store.create("agent-1")
+    assert store.append_turns(session["id"], [("user", "hello"), ("model", "hi there")])
+    store.append_turns(session["id"], [("user", "refunds?"), ("model", "within 14 days")])
+    active = store.active_turns(session["id"])
+    assert [(turn["seq"], turn["role"]) for turn in active] == [(1, "user"), (2, "model"), (3, "user"), (4, "model")]
+    assert all(turn["tokens"] > 0 for turn in active)
+
+    store.compact(session["id"], "User greeted the agent.", upto_seq=2)
+    assert store.get(session["id"])["summary"] == "User greeted the agent."
+    assert [turn["seq"] for turn in store.active_turns(session["id"])] == [3, 4]
+
+
+def test_expired_sessions_are_gone(store):
+    store.ttl_seconds = 0.01
+    session = store.create("agent-1")
+    time.sleep(0.05)
+    assert store.get(session["id"]) is None
+    assert store.active_turns(session["id"]) == []
+
+
+def test_delete_session(store):
+    session = store.create("agent-1")
+    assert store.delete(session["id"])
+    assert store.get(session["id"]) is None
+    assert not store.delete(session["id"])
+
+
+def test_append_to_a_gone_session_appends_nothing(store):
+    session = store.create("agent-1")
+    store.delete(session["id"])
+    assert not store.append_turns(session["id"], [("user", "hello")])
+    store.compact(session["id"], "summary", upto_seq=1)
+    assert store.active_turns(session["id"]) == []
+
+    store.ttl_seconds = 0.01
+    expired = store.create("agent-1")
+    time.sleep(0.05)
+    assert not store.append_turns(expired["id"], [("user", "hello")])
@@ -0,0 +1,127 @@
+# Dataset sync tests against an in-memory stand-in for an Opik dataset: only new rows are
+# inserted, stale rows are only deleted with prune, and a missing state file is rebuilt from
+# the dataset's rows. Run from the repository root: python -m pytest -q tests
+
+import json
+
+import pytest
+
+from dataset_sync import load_scenarios, sync_dataset
+
+
+class FakeDataset:
+    def __init__(self, name="scenarios", dataset_id="dataset-1"):
+        self.name = name
+        self.id = dataset_id
+        self.rows = {}
+        self.inserted = []
+        self.deleted = []
+
+    def insert(self, items, deduplication=True):
+        for item in items:
+            self.rows[item['id']] = dict(item)
+        self.inserted.extend(item['id'] for item in items)
+
+    def delete(self, item_ids):
+        for item_id in item_ids:
+            self.rows.pop(item_id, None)
+        self.deleted.extend(item_ids)
+
+    def get_items(self):
+        return [dict(row) for row in self.rows.values()]
+
+    def contents(self):
+        return sorted(row['input'] for row in self.rows.values())
+
+
+@pytest.fixture
+def dataset():
+    return FakeDataset()
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "sync_state.json")
+
+
+def records(*inputs):
+    return [{"input": text, "expected_output": f"answer to {text}"} for text in inputs]
+
+
+def test_first_sync_inserts_all_rows(dataset, state_path):
+    item_ids = sync_dataset(dataset, records("q1", "q2"), state_path)
+    assert dataset.contents() == ["q1", "q2"]
+    assert item_ids == dataset.inserted
+
+
+def test_unchanged_records_are_not_reinserted(dataset, state_path):
+    first_ids = sync_dataset(dataset, records("q1", "q2"), state_path)
+    dataset.inserted.clear()
+    assert sync_dataset(dataset, records("q1", "q2"), state_path) == first_ids
+    assert dataset.inserted == []
+
+
+def test_new_and_changed_records_are_added(dataset, state_path):
+    sync_dataset(dataset, records("q1", "q2"), state_path)
+    dataset.inserted.clear()
+    item_ids = sync_dataset(dataset, records("q1", "q2 edited", "q3"), state_path)
+    assert len(dataset.inserted) == 2
+    assert item_ids[1:] == dataset.inserted
+
+
+def test_stale_rows_are_kept_without_prune(dataset, state_path):
+    sync_dataset(dataset, records("q1", "q2"), state_path)
+    sync_dataset(dataset, records("q1"), state_path)
+    assert dataset.deleted == []
+    assert dataset.contents() == ["q1", "q2"]
+
+    # The kept row is still tracked, so restoring the record does not insert it again.
+    dataset.inserted.clear()
+    sync_dataset(dataset, records("q1", "q2"), state_path)
+    assert dataset.inserted == []
+
+
+def test_prune_deletes_stale_rows(dataset, state_path):
+    sync_dataset(dataset, records("q1", "q2"), state_path)
+    sync_dataset(dataset, records("q1"), state_path, prune=True)
+    assert dataset.contents() == ["q1"]
+    assert len(dataset.deleted) == 1
+
+
+def test_rows_added_by_others_survive_without_prune(dataset, state_path):
+    dataset.insert([{"id": "someone-else", "input": "their row"}])
+    sync_dataset(dataset, records("q1"), state_path)
+    assert dataset.contents() == ["q1", "their row"]
+
+
+def test_missing_state_is_rebuilt_from_dataset_rows(dataset, state_path, tmp_path):
+    first_ids = sync_dataset(dataset, records("q1", "q2"), state_path)
+    dataset.inserted.clear()
+    other_state_path = str(tmp_path / "other_machine.json")
+    assert sync_dataset(dataset, records("q1", "q2"), other_state_path) == first_ids
+    assert dataset.inserted == []
+
+
+def test_prune_without_state_removes_duplicate_rows(dataset, state_path):
+    dataset.insert([dict(records("q1")[0], id="copy-1"), dict(records("q1")[0], id="copy-2")])
+    item_ids = sync_dataset(dataset, records("q1"), state_path, prune=True)
+    assert item_ids == ["copy-1"]
+    assert dataset.deleted == ["copy-2"]
+
+
+def test_recreated_dataset_is_synced_from_scratch(dataset, state_path):
+    sync_dataset(dataset, records("q1"), state_path)
+    recreated = FakeDataset(dataset_id="dataset-2")
+    sync_dataset(recreated, records("q1"), state_path)
+    assert recreated.contents() == ["q1"]
+
+
+def test_load_scenarios_deduplicates_across_files(tmp_path):
+    first = tmp_path / "a.jsonl"
+    second = tmp_path / "b.jsonl"
+    first.write_text(json.dumps({"input": "q1"}) + "\n\n" + json.dumps({"input": "q2"}) + "\n", encoding="utf-8")
+    second.write_text(json.dumps({"input": "q1"}) + "\n" + "{broken\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="b.jsonl:2: invalid JSON"):
+        load_scenarios([str(first), str(second)])
+    second.write_text(json.dumps({"input": "q1"}) + "\n" + json.dumps({"input": "q3"}) + "\n", encoding="utf-8")
+    assert load_scenarios([str(first), str(second)]) == [{"input": "q1"}, {"input": "q2"}, {"input": "q3"}]
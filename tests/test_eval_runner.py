@@ -0,0 +1,125 @@
+# Evaluation runner tests against a local stub of /chat-with-agent: resuming from the results
+# file, per-agent results and conversation keys. Run from the repository root: python -m pytest -q tests
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from eval_runner import conversation_id, conversation_key, load_results, run_conversations, run_scenarios
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    """
+    Replies "<agentId>:<userMessage>:<history length>"; messages starting with "fail" get a 400.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(body)
+        if body['userMessage'].startswith("fail"):
+            status, reply = 400, {"error": "bad message"}
+        else:
+            status, reply = 200, {"response": f"{body['agentId']}:{body['userMessage']}:{len(body['chatHistory'])}"}
+        payload = json.dumps(reply).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def chat_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def base_url(chat_server):
+    return f"http://127.0.0.1:{chat_server.server_port}/api"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_run_scenarios_records_results(chat_server, base_url, tmp_path):
+    results_path = str(tmp_path / "results.jsonl")
+    results = run(run_scenarios([{"input": "q1"}, {"input": "fail q2"}], "agent-a", base_url, results_path, max_retries=0))
+    outputs = sorted((result["input"], result["status"], result["output"]) for result in results.values())
+    assert outputs == [("fail q2", "error", None), ("q1", "ok", "agent-a:q1:0")]
+    assert load_results(results_path, "agent-a", base_url) == results
+
+
+def test_resume_skips_only_successful_scenarios(chat_server, base_url, tmp_path):
+    results_path = str(tmp_path / "results.jsonl")
+    scenarios = [{"input": "q1"}, {"input": "fail q2"}]
+    run(run_scenarios(scenarios, "agent-a", base_url, results_path, max_retries=0))
+    chat_server.requests.clear()
+    run(run_scenarios(scenarios, "agent-a", base_url, results_path, max_retries=0))
+    assert [body["userMessage"] for body in chat_server.requests] == ["fail q2"]
+
+
+def test_resume_is_per_agent_and_backend(chat_server, base_url, tmp_path):
+    results_path = str(tmp_path / "results.jsonl")
+    scenarios = [{"input": "q1"}]
+    run(run_scenarios(scenarios, "agent-a", base_url, results_path))
+    results = run(run_scenarios(scenarios, "agent-b", base_url, results_path))
+    assert [result["output"] for result in results.values()] == ["agent-b:q1:0"]
+    assert len(chat_server.requests) == 2
+    assert load_results(results_path, "agent-a", base_url.replace("127.0.0.1", "localhost")) == {}
+
+
+def test_load_results_ignores_partial_last_line(base_url, tmp_path):
+    results_path = tmp_path / "results.jsonl"
+    complete = {"id": "abc", "agent_id": "agent-a", "base_url": base_url, "status": "ok"}
+    results_path.write_text(json.dumps(complete) + "\n" + '{"id": "def", "agen', encoding="utf-8")
+    assert load_results(str(results_path), "agent-a", base_url) == {"abc": complete}
+
+
+def test_conversation_key_follows_turn_content():
+    conversation = {"id": "c1", "turns": [{"input": "a"}, {"input": "b"}]}
+    edited = {"id": "c1", "turns": [{"input": "a"}, {"input": "changed"}]}
+    assert conversation_key(conversation) == conversation_key(dict(conversation))
+    assert conversation_key(conversation) != conversation_key(edited)
+    assert conversation_id(conversation) == "c1"
+    assert conversation_id({"turns": edited["turns"]}) == conversation_key(edited)
+
+
+def test_run_conversations_replays_history_and_resumes(chat_server, base_url, tmp_path):
+    results_path = str(tmp_path / "conversations.jsonl")
+    conversation = {"id": "c1", "turns": [{"input": "a"}, {"input": "b"}]}
+    results = run(run_conversations([conversation], "agent-a", base_url, results_path))
+    result = results[conversation_key(conversation)]
+    assert result["conversation_id"] == "c1"
+    assert [turn["output"] for turn in result["turns"]] == ["agent-a:a:0", "agent-a:b:2"]
+
+    chat_server.requests.clear()
+    run(run_conversations([conversation], "agent-a", base_url, results_path))
+    assert chat_server.requests == []
+
+    # Same id, edited turns: replayed rather than resumed from the old result.
+    edited = {"id": "c1", "turns": [{"input": "a"}, {"input": "changed"}]}
+    results = run(run_conversations([edited], "agent-a", base_url, results_path))
+    assert [turn["output"] for turn in results[conversation_key(edited)]["turns"]] == ["agent-a:a:0", "agent-a:changed:2"]
+    assert len(chat_server.requests) == 2
+
+
+def test_failed_turn_skips_rest_of_conversation(chat_server, base_url, tmp_path):
+    results_path = str(tmp_path / "conversations.jsonl")
+    conversation = {"turns": [{"input": "fail a"}, {"input": "b"}]}
+    results = run(run_conversations([conversation], "agent-a", base_url, results_path, max_retries=0))
+    result = results[conversation_key(conversation)]
+    assert result["status"] == "error"
+    assert [turn["status"] for turn in result["turns"]] == ["error", "skipped"]
+    assert len(chat_server.requests) == 1
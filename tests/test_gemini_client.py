@@ -0,0 +1,197 @@
+# Gemini client tests against the local fake Gemini server: retries, Retry-After, streaming and
+# the circuit breaker. Run from the repository root: python -m pytest -q tests
+
+import asyncio
+import time
+
+import pytest
+import requests
+
+from benchmarks.fake_upstream import FAKE_REPLY, FakeGeminiServer, UpstreamFaults
+from gemini_async_client import AsyncGeminiClient
+from gemini_client import GeminiAPIError, GeminiClient, GeminiUnavailableError, chunk_text
+
+MODEL = "gemini-2.0-flash"
+CONTENTS = [{"role": "user", "parts": [{"text": "hi"}]}]
+RESET_SECONDS = 0.05
+
+
+@pytest.fixture
+def faults():
+    return UpstreamFaults()
+
+
+@pytest.fixture
+def api_base(faults):
+    server = FakeGeminiServer(faults).start()
+    yield server.api_base
+    server.stop()
+
+
+def make_client(api_base, client_class=GeminiClient):
+    return client_class(
+        "test-key", api_base=api_base, max_retries=0, max_concurrency=1, acquire_timeout=0.05,
+        breaker_threshold=1, breaker_reset_timeout=RESET_SECONDS,
+    )
+
+
+def retrying_client(api_base, client_class=GeminiClient, **settings):
+    defaults = dict(max_retries=3, backoff_base=0.001, backoff_max=1.0, breaker_threshold=5)
+    return client_class("test-key", api_base=api_base, **{**defaults, **settings})
+
+
+def test_generate_text(api_base, faults):
+    assert retrying_client(api_base).generate_text(MODEL, CONTENTS) == FAKE_REPLY
+    assert faults.calls == 1
+
+
+def test_retries_503_until_success(api_base, faults):
+    client = retrying_client(api_base)
+    faults.fail_next(2)
+    assert client.generate_text(MODEL, CONTENTS) == FAKE_REPLY
+    assert faults.calls == 3
+    assert client.breaker.state == "closed"
+
+
+def test_429_waits_for_retry_after(api_base, faults):
+    client = retrying_client(api_base)
+    faults.error_status = 429
+    faults.retry_after = 0.3
+    faults.fail_next(1)
+    started_at = time.perf_counter()
+    assert client.generate_text(MODEL, CONTENTS) == FAKE_REPLY
+    assert time.perf_counter() - started_at >= 0.3 # backoff_base alone would wait ~1 ms
+    assert faults.calls == 2
+
+
+def test_gives_up_after_max_retries(api_base, faults):
+    client = retrying_client(api_base, max_retries=2)
+    faults.error_rate = 1.0
+    with pytest.raises(GeminiAPIError) as raised:
+        client.generate_text(MODEL, CONTENTS)
+    assert raised.value.upstream_status == 503
+    assert faults.calls == 3
+
+
+def test_client_error_is_not_retried(api_base, faults):
+    client = retrying_client(api_base, breaker_threshold=1)
+    faults.error_status = 400
+    faults.fail_next(1)
+    with pytest.raises(GeminiAPIError) as raised:
+        client.generate_text(MODEL, CONTENTS)
+    assert raised.value.upstream_status == 400
+    assert faults.calls == 1
+    assert client.breaker.state == "closed" # A bad request says nothing about upstream health
+
+
+def test_stream_generate_content_parses_chunks(api_base, faults):
+    events = []
+    client = retrying_client(api_base, observer=lambda event, model, method, **fields: events.append((event, fields)))
+    chunks = list(client.stream_generate_content(MODEL, {"contents": CONTENTS}))
+    assert len(chunks) > 1
+    assert "".join(chunk_text(chunk) for chunk in chunks).strip() == FAKE_REPLY
+    assert ("usage", {"usage": chunks[-1]["usageMetadata"]}) in events
+
+
+def test_breaker_opens_after_upstream_errors(api_base, faults):
+    client = retrying_client(api_base, max_retries=1, breaker_threshold=2, breaker_reset_timeout=60)
+    faults.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(GeminiAPIError):
+            client.generate_text(MODEL, CONTENTS)
+    assert client.breaker.state == "open"
+    calls = faults.calls
+    with pytest.raises(GeminiUnavailableError, match="circuit is open"):
+        client.generate_text(MODEL, CONTENTS)
+    assert faults.calls == calls # Rejected without reaching the upstream
+
+
+def test_async_client_retries_503(api_base, faults):
+    async def run():
+        client = retrying_client(api_base, AsyncGeminiClient)
+        try:
+            faults.fail_next(2)
+            assert await client.generate_text(MODEL, CONTENTS) == FAKE_REPLY
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert faults.calls == 3
+
+
+def trip_breaker(client, faults):
+    faults.error_rate = 1.0
+    with pytest.raises(GeminiAPIError):
+        client.generate_text(MODEL, CONTENTS)
+    faults.error_rate = 0.0
+    assert client.breaker.state == "open"
+    time.sleep(RESET_SECONDS * 2)
+    assert client.breaker.state == "half_open"
+
+
+def test_breaker_closes_after_successful_trial(api_base, faults):
+    client = make_client(api_base)
+    trip_breaker(client, faults)
+    assert client.generate_text(MODEL, CONTENTS)
+    assert client.breaker.state == "closed"
+
+
+def test_slot_timeout_does_not_use_up_the_trial(api_base, faults):
+    client = make_client(api_base)
+    trip_breaker(client, faults)
+
+    client._global_slots.acquire()
+    try:
+        with pytest.raises(GeminiUnavailableError, match="Too many concurrent"):
+            client.generate_text(MODEL, CONTENTS)
+    finally:
+        client._global_slots.release()
+
+    assert client.generate_text(MODEL, CONTENTS)
+    assert client.breaker.state == "closed"
+
+
+def test_unexpected_trial_error_reopens_breaker(api_base, faults, monkeypatch):
+    client = make_client(api_base)
+    trip_breaker(client, faults)
+
+    def broken_post(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.session, "post", broken_post)
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            client.generate_text(MODEL, CONTENTS)
+
+    assert client.breaker.state == "open"
+    time.sleep(RESET_SECONDS * 2)
+    assert client.generate_text(MODEL, CONTENTS)
+    assert client.breaker.state == "closed"
+
+
+def test_cancelled_async_trial_reopens_breaker(api_base, faults):
+    async def run():
+        client = make_client(api_base, AsyncGeminiClient)
+        try:
+            faults.error_rate = 1.0
+            with pytest.raises(GeminiAPIError):
+                await client.generate_text(MODEL, CONTENTS)
+            faults.error_rate = 0.0
+            await asyncio.sleep(RESET_SECONDS * 2)
+
+            faults.latency_ms = 1000
+            trial = asyncio.ensure_future(client.generate_text(MODEL, CONTENTS))
+            await asyncio.sleep(0.1)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            assert client.breaker.state == "open"
+
+            faults.latency_ms = 0
+            await asyncio.sleep(RESET_SECONDS * 2)
+            assert await client.generate_text(MODEL, CONTENTS)
+            assert client.breaker.state == "closed"
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
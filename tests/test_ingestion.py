@@ -0,0 +1,80 @@
+# Ingestion helpers: the extraction cache key and the job store.
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import ingestion
+from ingestion import JobHeartbeat, MemoryIngestionJobStore, SQLiteIngestionJobStore
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_parser_version_does_not_import_parsers():
+    code = "import sys, ingestion; ingestion.parser_version(); print(sorted({'PyPDF2', 'docx'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_parser_version_names_installed_parsers():
+    version = ingestion.parser_version()
+    assert version.startswith("1:pypdf2-")
+    assert ":python-docx-" in version
+    assert ingestion._installed_version("no-such-package-installed") == "none"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def job_store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryIngestionJobStore()
+    return SQLiteIngestionJobStore(str(tmp_path / "agents.db"))
+
+
+def test_stale_jobs_fail_whoever_owns_them(job_store):
+    stale = job_store.create("agent-1", "kb.pdf")
+    finished = job_store.create("agent-2", "kb.pdf")
+    job_store.update(finished["id"], status="completed")
+    time.sleep(0.05)
+    fresh = job_store.create("agent-3", "kb.pdf")
+
+    failed = job_store.fail_orphaned("stalled", stale_after=0.03)
+    assert [job["id"] for job in failed] == [stale["id"]]
+    assert job_store.get(stale["id"])["status"] == "failed"
+    assert job_store.get(stale["id"])["error"] == "stalled"
+    assert job_store.get(finished["id"])["status"] == "completed"
+    assert job_store.get(fresh["id"])["status"] == "queued"
+
+
+def test_heartbeat_keeps_active_jobs_fresh(job_store):
+    job = job_store.create("agent-1", "kb.pdf")
+    time.sleep(0.05)
+    job_store.heartbeat([job["id"]])
+    assert job_store.fail_orphaned("stalled", stale_after=0.03) == []
+    assert job_store.get(job["id"])["status"] == "queued"
+
+
+def test_jobs_of_exited_processes_fail_without_waiting(tmp_path):
+    job_store = SQLiteIngestionJobStore(str(tmp_path / "agents.db"))
+    job = job_store.create("agent-1", "kb.pdf")
+    job_store._conn().execute("UPDATE ingestion_jobs SET owner = ? WHERE id = ?", (f"{socket.gethostname()}:4194305", job["id"]))
+    live = job_store.create("agent-2", "kb.pdf")
+    assert [failed["id"] for failed in job_store.fail_orphaned("restarted")] == [job["id"]]
+    assert job_store.get(live["id"])["status"] == "queued"
+
+
+def test_job_heartbeat_thread_refreshes_held_jobs(job_store):
+    job = job_store.create("agent-1", "kb.pdf")
+    heartbeat = JobHeartbeat(job_store, interval=0.01)
+    heartbeat.add(job["id"])
+    time.sleep(0.1)
+    assert job_store.get(job["id"])["updated_at"] > job["updated_at"]
+
+    heartbeat.discard(job["id"])
+    time.sleep(0.05)
+    last_beat = job_store.get(job["id"])["updated_at"]
+    time.sleep(0.05)
+    assert job_store.get(job["id"])["updated_at"] == last_beat
@@ -0,0 +1,101 @@
+# BM25 knowledge index tests: chunking, ranking, token budgets and the on-disk format.
+# Run from the repository root: python -m pytest -q tests
+
+import json
+
+import pytest
+
+from knowledge_index import KnowledgeIndex, chunk_text, format_excerpts, tokenize
+
+DOCUMENT = " ".join([
+    "Our store opens at nine and closes at six on weekdays.",
+    "Refunds are issued within fourteen days of purchase with a receipt.",
+    "Shipping is free for orders above fifty euros.",
+    "Refunds for digital goods are not available once downloaded.",
+    "The support team answers phone calls in English and German.",
+])
+
+
+def build_index():
+    # Small windows so the facts land in different chunks.
+    return KnowledgeIndex.build(DOCUMENT, chunk_words=11, overlap_words=0)
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Refunds, FAST-shipping & 24h!") == ["refunds", "fast", "shipping", "24h"]
+
+
+def test_chunk_text_overlaps_windows():
+    words = [f"w{i}" for i in range(10)]
+    chunks = chunk_text(" ".join(words), chunk_words=4, overlap_words=2)
+    assert chunks == ["w0 w1 w2 w3", "w2 w3 w4 w5", "w4 w5 w6 w7", "w6 w7 w8 w9"]
+    assert chunk_text("   ") == []
+
+
+def test_search_ranks_matching_chunks_first():
+    index = build_index()
+    results = index.search("refunds receipt", top_k=3)
+    assert results
+    assert "receipt" in results[0][0]
+    assert all("refunds" in tokenize(chunk) for chunk, _score in results)
+    scores = [score for _chunk, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_skips_chunks_without_query_terms():
+    index = build_index()
+    assert index.search("unrelated vocabulary") == []
+    assert len(index.search("refunds", top_k=10)) == 2
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = KnowledgeIndex.build("apple banana\napple cherry\napple durian", chunk_words=2, overlap_words=0)
+    results = index.search("apple cherry")
+    assert results[0][0] == "apple cherry"
+
+
+def test_token_budget_limits_results():
+    index = build_index()
+    unlimited = index.search("refunds", top_k=10)
+    budget = int(index.chunk_tokens.max())
+    limited = index.search("refunds", top_k=10, token_budget=budget)
+    assert len(limited) == 1
+    assert limited[0] == unlimited[0]
+    assert index.search("refunds", token_budget=0) == []
+
+
+def test_head_returns_leading_chunks():
+    index = build_index()
+    assert [chunk for chunk, _score in index.head(top_k=2)] == index.chunks[:2]
+
+
+def test_empty_document():
+    index = KnowledgeIndex.build("")
+    assert len(index) == 0
+    assert index.search("anything") == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_index()
+    path = str(tmp_path / "agents" / "agent-1")
+    index.save(path)
+    loaded = KnowledgeIndex.load(path)
+    assert loaded.chunks == index.chunks
+    assert loaded.vocab == index.vocab
+    assert loaded.search("shipping euros") == index.search("shipping euros")
+
+
+def test_load_rejects_unknown_version(tmp_path):
+    path = str(tmp_path / "agent-1")
+    build_index().save(path)
+    with open(f"{path}.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["version"] = 999
+    with open(f"{path}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError, match="Unsupported knowledge index version"):
+        KnowledgeIndex.load(path)
+
+
+def test_format_excerpts_numbers_chunks():
+    assert format_excerpts([("first", 2.0), ("second", 1.0)]) == "[Excerpt 1]\nfirst\n\n[Excerpt 2]\nsecond"
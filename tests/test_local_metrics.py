@@ -0,0 +1,79 @@
+# Local metric tests: the bit-parallel LCS against a plain dynamic-programming reference, and
+# the vectorised scores against hand-computed values. Run from the repository root: python -m pytest -q tests
+
+import random
+
+import numpy as np
+import pytest
+
+from local_metrics import METRIC_NAMES, combined_score, lcs_length, score_outputs, summarize, uncertain_mask
+
+
+def reference_lcs(a, b):
+    previous = [0] * (len(b) + 1)
+    for token in a:
+        current = [0]
+        for j, other in enumerate(b):
+            current.append(previous[j] + 1 if token == other else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ([], ["x"], 0),
+    (["a", "b", "c"], ["a", "b", "c"], 3),
+    (["a", "b", "c", "d"], ["b", "d"], 2),
+    (["a", "b", "a", "b"], ["b", "a", "b", "a"], 3),
+    (["x", "y"], ["z"], 0),
+])
+def test_lcs_length_examples(a, b, expected):
+    assert lcs_length(a, b) == expected
+
+
+def test_lcs_length_matches_reference():
+    rng = random.Random(1234)
+    for _ in range(300):
+        # Lengths past 64 exercise masks wider than a machine word.
+        a = [rng.choice("abcde") for _ in range(rng.randint(0, 90))]
+        b = [rng.choice("abcde") for _ in range(rng.randint(0, 90))]
+        assert lcs_length(a, b) == reference_lcs(a, b)
+
+
+def test_score_outputs_values():
+    scores = score_outputs(
+        ["The refund takes 14 days.", "Refunds within fourteen days", None, "yes"],
+        ["the refund  takes 14 days.", "Refunds are issued within fourteen days", "anything", ""],
+    )
+    assert set(scores) == set(METRIC_NAMES)
+    assert scores["exact_match"].tolist() == [1.0, 0.0, 0.0, 0.0]
+    assert scores["contains"].tolist() == [1.0, 0.0, 0.0, 0.0]
+    # Item 1: 4 output tokens, 6 expected, all 4 shared and in order.
+    assert scores["token_f1"][1] == pytest.approx(0.8)
+    assert scores["rouge_l"][1] == pytest.approx(0.8)
+    assert scores["length_ratio"].tolist() == pytest.approx([1.0, 4 / 6, 0.0, 0.0])
+    # Missing output and empty expected output both score 0.
+    assert scores["token_f1"][2:].tolist() == [0.0, 0.0]
+    assert scores["rouge_l"][2:].tolist() == [0.0, 0.0]
+
+
+def test_token_f1_counts_repeated_tokens_once_per_match():
+    scores = score_outputs(["no no no"], ["no"])
+    # Precision 1/3, recall 1.
+    assert scores["token_f1"][0] == pytest.approx(0.5)
+
+
+def test_contains_match_counts_as_full_score():
+    scores = score_outputs(["Sure! Refunds take 14 days, anything else?", "unrelated"], ["refunds take 14 days", "refunds take 14 days"])
+    assert combined_score(scores).tolist() == [1.0, 0.0]
+    assert uncertain_mask(scores, 0.3, 0.7).tolist() == [False, False]
+
+
+def test_uncertain_mask_selects_middle_scores():
+    scores = score_outputs(["refunds take days"], ["refunds take 14 days"])
+    assert 0.3 < combined_score(scores)[0] < 0.9
+    assert uncertain_mask(scores, 0.3, 0.9).tolist() == [True]
+
+
+def test_summarize_averages_each_metric():
+    scores = {"exact_match": np.array([1.0, 0.0]), "token_f1": np.array([], dtype=np.float64)}
+    assert summarize(scores) == {"exact_match": 0.5, "token_f1": 0.0}
@@ -0,0 +1,55 @@
+# Request traces: work done in executor threads and in streamed (SSE) response bodies is
+# attributed to the request that started it, not to "background".
+
+import pytest
+
+import observability
+
+
+@pytest.fixture
+def finished_traces(backend, monkeypatch):
+    traces = []
+    monkeypatch.setattr(backend, "log_finished_trace", traces.append)
+    return traces
+
+
+def test_batch_item_spans_belong_to_the_request(client, agent_id, finished_traces):
+    response = client.post("/api/chat-with-agent/batch", json={
+        "agentId": agent_id, "bypassCache": True, "items": [{"userMessage": "Hi"}, {"userMessage": "Bye"}],
+    })
+    assert response.status_code == 200
+    trace = finished_traces[-1]
+    assert trace.endpoint == "chat_with_agent_batch"
+    assert [span["stage"] for span in trace.spans].count("gemini") == 2
+    assert response.headers["X-Request-ID"] == trace.request_id
+
+
+def test_stream_trace_ends_when_the_body_does(client, agent_id, finished_traces):
+    response = client.post("/api/chat-with-agent/stream", json={"agentId": agent_id, "userMessage": "Hi"}, buffered=False)
+    assert finished_traces == []
+    body = response.get_data()
+    response.close()
+    assert b"event: done" in body
+    trace = finished_traces[-1]
+    assert trace.endpoint == "chat_with_agent_stream"
+    assert trace.request_id == response.headers["X-Request-ID"]
+    assert [call["upstream"] for call in trace.attributes["upstream"]] == ["gemini"]
+    assert observability.current_trace() is None
+
+
+def test_trace_stream_ends_trace_when_closed_early():
+    finished = []
+
+    def body():
+        with observability.span("produce"):
+            yield "first"
+        yield "second"
+
+    trace = observability.start_trace("stream_endpoint")
+    observability.detach_trace()
+    stream = observability.trace_stream(trace, body(), "POST", 200, finished.append)
+    assert next(stream) == "first"
+    stream.close()
+    assert finished == [trace]
+    assert trace.attributes["status"] == 200
+    assert [span["stage"] for span in trace.spans] == ["produce"]
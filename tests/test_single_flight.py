@@ -0,0 +1,137 @@
+# Single-flight tests: concurrent callers with the same key share one call, its result and its
+# exception, and nothing is kept once it finishes. Run from the repository root: python -m pytest -q tests
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight, request_key
+
+CALLERS = 8
+
+
+def test_request_key_is_canonical():
+    assert request_key("model", {"a": 1, "b": 2}) == request_key("model", {"b": 2, "a": 1})
+    assert request_key("model", {"a": 1}) != request_key("model", {"a": 2})
+    assert request_key("model", {"a": 1}) != request_key("other", {"a": 1})
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        yield executor
+
+
+def wait_until_coalesced(flight, count):
+    while flight.coalesced < count:
+        time.sleep(0.01)
+
+
+def test_concurrent_callers_share_one_call(executor):
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "reply"
+
+    futures = [executor.submit(flight.do, "key", function) for _ in range(CALLERS)]
+    started.wait(5)
+    wait_until_coalesced(flight, CALLERS - 1)
+    release.set()
+    results = [future.result(5) for future in futures]
+
+    assert len(calls) == 1
+    assert sorted(results) == [("reply", False)] + [("reply", True)] * (CALLERS - 1)
+    assert flight.stats() == {"calls": 1, "coalesced": CALLERS - 1, "inFlight": 0}
+
+
+def test_exception_reaches_every_caller(executor):
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def function():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    futures = [executor.submit(flight.do, "key", function) for _ in range(CALLERS)]
+    wait_until_coalesced(flight, CALLERS - 1)
+    release.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="upstream down"):
+            future.result(5)
+    assert flight.stats()["inFlight"] == 0
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+    assert flight.stats() == {"calls": 2, "coalesced": 0, "inFlight": 0}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == ("a", False)
+    assert flight.do("b", lambda: "b") == ("b", False)
+    assert flight.calls == 2
+
+
+def test_async_callers_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def function():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", function) for _ in range(CALLERS)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(results) == [("reply", False)] + [("reply", True)] * (CALLERS - 1)
+    assert flight.stats() == {"calls": 1, "coalesced": CALLERS - 1, "inFlight": 0}
+
+
+def test_async_exception_reaches_every_caller():
+    flight = AsyncSingleFlight()
+
+    async def function():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", function) for _ in range(CALLERS)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats() == {"calls": 1, "coalesced": CALLERS - 1, "inFlight": 0}
+
+
+def test_cancelled_async_caller_does_not_cancel_shared_call():
+    flight = AsyncSingleFlight()
+
+    async def function():
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", function))
+        second = asyncio.ensure_future(flight.do("key", function))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == ("reply", True)
+    assert flight.calls == 1
@@ -0,0 +1,73 @@
+# Streaming speech-to-text: transcribe_stream and /api/speech-to-text/stream with the fake recognizer.
+
+import io
+
+import pytest
+
+from benchmarks.fake_upstream import FakeSpeechClient
+from speech_stream import audio_chunk_bytes, build_streaming_config, read_audio_chunks, transcribe_stream
+from tests.conftest import sse_events
+
+
+def padded_chunks(*parts, size=256):
+    return [part.encode('utf-8').ljust(size) for part in parts]
+
+
+def test_audio_chunk_bytes_hold_100_ms():
+    assert audio_chunk_bytes('LINEAR16', 16000) == 3200
+    assert audio_chunk_bytes('MULAW', 8000) == 800
+    assert audio_chunk_bytes('OGG_OPUS', 48000) == 256
+
+
+def test_transcribe_stream_yields_interim_then_final():
+    config = build_streaming_config('en-US', 16000, 'OGG_OPUS')
+    results = list(transcribe_stream(FakeSpeechClient(), config, padded_chunks("Hello", "there.", "How long", "is it?")))
+    assert [(r["transcript"], r["isFinal"]) for r in results] == [
+        ("Hello", False), ("Hello there.", True), ("How long", False), ("How long is it?", True),
+    ]
+
+
+def test_transcribe_stream_without_interim_results():
+    config = build_streaming_config('en-US', 16000, 'OGG_OPUS', interim_results=False)
+    results = list(transcribe_stream(FakeSpeechClient(), config, padded_chunks("Hello", "there.", "Bye")))
+    assert [(r["transcript"], r["isFinal"]) for r in results] == [("Hello there.", True), ("Bye", True)]
+
+
+def test_read_audio_chunks_reads_fixed_sizes():
+    assert list(read_audio_chunks(io.BytesIO(b"abcdefg"), 3)) == [b"abc", b"def", b"g"]
+
+
+@pytest.fixture
+def speech_client(backend):
+    backend.stt_client.set(FakeSpeechClient())
+
+
+@pytest.mark.parametrize("query", ["sampleRateHertz=4000", "sampleRateHertz=96000", "sampleRateHertz=abc", "encoding=bogus"])
+def test_invalid_params_are_rejected(client, speech_client, query):
+    response = client.post(f"/api/speech-to-text/stream?{query}", data=b"x")
+    assert response.status_code == 400
+
+
+def test_unknown_agent_is_rejected(client, speech_client):
+    assert client.post("/api/speech-to-text/stream?agentId=missing", data=b"x").status_code == 404
+
+
+def test_stream_emits_transcripts(client, speech_client):
+    audio = b"".join(padded_chunks("Hello", "there.", "Bye"))
+    response = client.post("/api/speech-to-text/stream?encoding=OGG_OPUS", data=audio)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = sse_events(response.get_data())
+    transcripts = [(data["transcript"], data["isFinal"]) for event, data in events if event == "transcript"]
+    assert transcripts == [("Hello", False), ("Hello there.", True), ("Bye", False), ("Bye", True)]
+    assert [event for event, _ in events if event != "transcript"] == ["done"]
+
+
+def test_stream_answers_each_final_transcript(client, speech_client, agent_id):
+    audio = b"".join(padded_chunks("How long", "is shipping?", "And returns?"))
+    response = client.post(f"/api/speech-to-text/stream?encoding=OGG_OPUS&agentId={agent_id}", data=audio)
+    events = sse_events(response.get_data())
+    replies = [data for event, data in events if event == "reply"]
+    assert [reply["transcript"] for reply in replies] == ["How long is shipping?", "And returns?"]
+    assert all(reply["response"] for reply in replies)
+    assert events[-1][0] == "done"
@@ -0,0 +1,57 @@
+# TTS cache tests: keys, the two tiers, disk accounting and eviction.
+
+import os
+import time
+
+from tts_cache import TTSCache, tts_cache_key
+
+
+def key(text):
+    return tts_cache_key(text, "en-US", "voice", 1.0, "MP3")
+
+
+def test_key_depends_on_every_parameter(tmp_path):
+    base = tts_cache_key("hello", "en-US", "voice", 1.0, "MP3")
+    assert base == tts_cache_key("hello", "en-US", "voice", 1.0004, "MP3")
+    assert base != tts_cache_key("hello", "en-GB", "voice", 1.0, "MP3")
+    assert base != tts_cache_key("hello", "en-US", "voice", 1.25, "MP3")
+    cache = TTSCache(str(tmp_path))
+    assert cache.is_valid_key(base)
+    assert not cache.is_valid_key("../etc/passwd")
+
+
+def test_put_and_get_from_disk(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_items=0)
+    assert cache.get(key("hello")) is None
+    cache.put(key("hello"), b"audio")
+    assert cache.get(key("hello")) == b"audio"
+    assert TTSCache(str(tmp_path)).get(key("hello")) == b"audio"
+
+
+def test_overwrite_counts_the_entry_once(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    cache.put(key("hello"), b"x" * 100)
+    cache.put(key("hello"), b"x" * 60)
+    assert cache.stats()["diskBytes"] == 60
+
+
+def test_in_flight_temp_files_are_not_counted(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    cache.put(key("hello"), b"x" * 100)
+    with open(os.path.join(str(tmp_path), key("hello")[:2], ".tmp-partial"), "wb") as f:
+        f.write(b"y" * 1000)
+    assert TTSCache(str(tmp_path)).stats()["diskBytes"] == 100
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=250, memory_items=0)
+    for text in ("a", "b"):
+        cache.put(key(text), b"x" * 100)
+        time.sleep(0.02)
+    cache.get(key("a")) # Refreshes a's mtime, so b is now the oldest
+    time.sleep(0.02)
+    cache.put(key("c"), b"x" * 100)
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) is not None
+    assert cache.get(key("c")) is not None
+    assert cache.stats()["diskBytes"] == 200
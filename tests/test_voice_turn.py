@@ -0,0 +1,60 @@
+# /api/voice-turn with the fake Gemini server and a fake TTS client: audio per sentence, the
+# time-to-first-audio metric, and no synthesis left running after the client disconnects.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import observability
+from benchmarks.fake_upstream import FakeTTSClient, UpstreamFaults
+from tests.conftest import sse_events
+
+
+@pytest.fixture
+def tts_faults(backend, monkeypatch):
+    faults = UpstreamFaults()
+    monkeypatch.setattr(backend.tts_client, "get", lambda: FakeTTSClient(faults))
+    return faults
+
+
+def voice_turn_body(agent_id, voice_name):
+    # Each test uses its own voice so sentences are never served from an earlier test's TTS cache.
+    return {"agentId": agent_id, "userMessage": "How long is shipping?", "languageCode": "en-US",
+            "voiceName": voice_name, "audioFormat": "url", "bypassCache": True}
+
+
+def first_audio_observations():
+    return sum(sum(series[:-1]) for series in observability.voice_first_audio_seconds._series.values())
+
+
+def test_voice_turn_streams_audio_and_records_first_audio(client, agent_id, tts_faults):
+    observed = first_audio_observations()
+    response = client.post("/api/voice-turn", json=voice_turn_body(agent_id, "voice-full"))
+    events = sse_events(response.data)
+    audio = [data for event, data in events if event == "audio"]
+    assert [item["index"] for item in audio] == list(range(len(audio)))
+    assert len(audio) == tts_faults.calls == 3
+    done = events[-1]
+    assert done[0] == "done"
+    assert done[1]["timing"]["firstAudioMs"] is not None
+    assert first_audio_observations() == observed + 1
+    assert "agent_voice_first_audio_seconds_count" in client.get("/metrics").get_data(as_text=True)
+
+
+def test_disconnect_cancels_pending_synthesis(backend, client, agent_id, tts_faults, monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(backend, "tts_executor", executor)
+    tts_faults.latency_ms = 200
+
+    response = client.post("/api/voice-turn", json=voice_turn_body(agent_id, "voice-disconnect"), buffered=False)
+    received = b""
+    for chunk in response.response:
+        received += chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+        if b"event: audio" in received:
+            break
+    response.close()
+
+    # Sentence 2 was already synthesizing; sentence 3 was still queued and must not run.
+    executor.shutdown(wait=True)
+    assert tts_faults.calls == 2
@@ -0,0 +1,10 @@
+# Token estimation shared by prompt budgeting code (retrieval excerpts, chat history compaction).
+
+
+def estimate_tokens(text):
+    """
+    Rough LLM token count (~4 characters per token). Good enough for budgeting prompts.
+    """
+    if not text:
+        return 0
+    return len(text) // 4 + 1
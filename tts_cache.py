@@ -0,0 +1,120 @@
+# Content-addressed cache for synthesized speech.
+# Audio is keyed by a hash of everything that affects the output, kept on disk with size-bounded
+# LRU eviction and fronted by a small in-memory tier for the hottest phrases (greetings, fillers).
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from lru import LRUCache
+
+
+def tts_cache_key(text, language_code, voice_name, speaking_rate, audio_encoding):
+    """
+    SHA-256 over the normalized synthesis parameters.
+    """
+    material = json.dumps(
+        [text, language_code, voice_name, round(float(speaking_rate), 3), audio_encoding],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Two-tier audio cache. Disk entries live at <directory>/<key[:2]>/<key>; reads refresh
+    the file mtime so eviction (oldest mtime first) approximates LRU across workers.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, memory_items=256, memory_item_max_bytes=256 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_item_max_bytes = memory_item_max_bytes
+        self.memory = LRUCache(maxsize=memory_items)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(size for _path, size, _mtime in self._scan())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue # Another writer's file that is not renamed into place yet
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def is_valid_key(self, key):
+        return len(key) == 64 and all(c in '0123456789abcdef' for c in key)
+
+    def get(self, key):
+        audio = self.memory.get(key)
+        if audio is not None:
+            self.hits += 1
+            return audio
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if len(audio) <= self.memory_item_max_bytes:
+            self.memory.set(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(audio)
+        try:
+            replaced_bytes = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+        os.replace(tmp_path, path)
+        if len(audio) <= self.memory_item_max_bytes:
+            self.memory.set(key, audio)
+        with self._lock:
+            self._disk_bytes += len(audio) - replaced_bytes
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Rescan rather than trust the counter: other workers write to the same directory.
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.memory.pop(os.path.basename(path))
+            total -= size
+        self._disk_bytes = total
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "diskBytes": self._disk_bytes,
+            "maxBytes": self.max_bytes,
+            "memoryItems": len(self.memory),
+        }
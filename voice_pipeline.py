@@ -0,0 +1,43 @@
+# Helpers for the sentence-pipelined voice turn: split a streaming reply into sentences so
+# each one can be sent to TTS as soon as it is complete instead of waiting for the whole reply.
+
+import re
+
+# Sentence end: terminal punctuation (incl. Hindi danda) followed by whitespace, or a line break.
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?।])\s+|\n+')
+_MARKDOWN_RE = re.compile(r'[*_#`>~]+|\[([^\]]*)\]\([^)]*\)')
+
+
+class SentenceSplitter:
+    """
+    Accumulates streamed text and hands back complete sentences. Fragments shorter than
+    `min_chars` are merged with the next sentence so TTS is not called for "Mr." or "OK.".
+    """
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        pending_start = 0
+        for match in _SENTENCE_END_RE.finditer(self._buffer):
+            candidate = self._buffer[pending_start:match.start()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                pending_start = match.end()
+        self._buffer = self._buffer[pending_start:]
+        return sentences
+
+    def flush(self):
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return [remainder] if remainder else []
+
+
+def clean_for_speech(text):
+    """
+    Strips markdown markup (emphasis, headings, code ticks, link targets) before synthesis.
+    """
+    return _MARKDOWN_RE.sub(lambda m: m.group(1) or '', text).strip()